@@ -1,10 +1,27 @@
-from flask import Flask, render_template, request
-import sqlite3
-import torch
-from transformers import T5ForConditionalGeneration, T5Tokenizer
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+from functools import partial
 from datetime import datetime
 import random
-from log_interaction import log_interaction
+import sqlite3
+import time
+from batching import BatchScheduler
+from db_pool import ConnectionPool, time_limit
+from log_interaction import FEEDBACK_CORRECT, FEEDBACK_WRONG, LOG_FILE, log_interaction
+from model_manager import ModelManager
+from question_cache import QuestionCache, model_fingerprint, normalize_question
+from result_cache import ResultCache
+from retrieval import load_index
+from sql_guard import SqlGuard, with_limit
+from sql_schema import load_schema, unknown_identifiers
+from telemetry import CONTENT_TYPE, REGISTRY, SQL_ERRORS, SQL_SOURCE, Trace, timed
+from telemetry import render as render_metrics
+from template_fastpath import TemplateIndex
 
 ENCOURAGEMENTS = [
     "Отличный запрос! Так держать!",
@@ -21,48 +38,558 @@ ENCOURAGEMENTS = [
 
 app = Flask(__name__)
 
+# Другую базу (например, из db_generate.py) можно подставить через SQLBOT_DB_PATH
+DB_PATH = os.environ.get("SQLBOT_DB_PATH", "data/database.db")
+# Пул соединений только для чтения, общий для всех потоков сервера.
+# WAL (SQLBOT_DB_WAL=1) меняет заголовок файла БД, поэтому включается только явно
+db_pool = ConnectionPool(DB_PATH, size=int(os.environ.get("SQLBOT_DB_POOL_SIZE", "4")),
+                         wal=os.environ.get("SQLBOT_DB_WAL", "0") == "1")
+
+# Схема БД: по ней проверяются таблицы и столбцы в сгенерированном SQL
+schema = load_schema(DB_PATH)
+
 # Загрузка модели и токенизатора
 model_dir = "data/model_t5_sql"
-tokenizer = T5Tokenizer.from_pretrained(model_dir)
-model = T5ForConditionalGeneration.from_pretrained(model_dir)
-device = torch.device("cpu")  # CPU для совместимости на Mac/Windows
-model = model.to(device)
-model.eval()
-
-def get_sql_query(user_input):
-    prompt = f"translate Russian to SQL: {user_input}"
-    inputs = tokenizer(prompt, return_tensors="pt", max_length=128, truncation=True).to(device)
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_length=128)
-    sql_query = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return sql_query
-
-def execute_query(query):
-    conn = sqlite3.connect("data/database.db")
-    cursor = conn.cursor()
+
+def load_generator():
+    # torch и transformers импортируются только здесь: импорт app.py не загружает модель.
+    # Возвращает (generate, версия прочитанных файлов) для ModelManager
+    from backends import create_backend
+
+    # model_dir может быть символической ссылкой на версию модели (continuous_finetune.py):
+    # читаем файлы одной версии, даже если ссылку переключат во время загрузки
+    path = os.path.realpath(model_dir)
+    version = model_fingerprint(path)
+
+    # Бэкенды по умолчанию работают на CPU — для совместимости на Mac/Windows.
+    # Бэкенд инференса: "torch" (fp32), "int8" (динамическая квантизация) или "onnx" (ONNX Runtime)
+    backend = create_backend(
+        os.environ.get("SQLBOT_BACKEND", "torch"),
+        path,
+        tolerance=float(os.environ.get("SQLBOT_BACKEND_TOLERANCE", "0"))
+    )
+    generate = partial(backend.generate, max_length=128)
+    # Декодирование с ограничениями по схеме (SQLBOT_CONSTRAINED=1): модель не может
+    # сгенерировать несуществующую таблицу или столбец
+    if os.environ.get("SQLBOT_CONSTRAINED", "0") == "1":
+        from transformers import LogitsProcessorList
+        from constrained_decoding import SchemaLogitsProcessor
+
+        generate = partial(generate, logits_processor=LogitsProcessorList([SchemaLogitsProcessor(backend.tokenizer, schema)]))
+    return generate, version
+
+def current_model_version():
+    # Версия файлов модели; None, если модели ещё нет (например, до обучения)
     try:
-        cursor.execute(query)
-        results = cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-    except Exception as e:
-        results = [[f"Ошибка: {e} (SQL: {query})"]]
-        columns = ["Ошибка"]
-    conn.close()
-    return columns, results
+        return model_fingerprint(model_dir)
+    except OSError:
+        return None
+
+# Модель грузится по SQLBOT_MODEL_LOAD: "background" (фоновый поток, готовность — /ready),
+# "eager" (сразу, так делает gunicorn.conf.py с preload_app) или "lazy" (при первом вопросе)
+model_manager = ModelManager(load_generator, version=current_model_version())
+model_manager.start(os.environ.get("SQLBOT_MODEL_LOAD", "background"))
+
+# Динамический батчинг: одновременные запросы объединяются в один вызов generate
+BATCH_MAX_SIZE = int(os.environ.get("SQLBOT_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("SQLBOT_BATCH_MAX_WAIT_MS", "5"))
+scheduler = BatchScheduler(
+    lambda texts: model_manager.get()(texts),
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS
+)
+
+# Кэш "вопрос -> SQL": повторные вопросы не проходят декодирование заново
+question_cache = QuestionCache(
+    max_size=int(os.environ.get("SQLBOT_QUESTION_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("SQLBOT_QUESTION_CACHE_TTL", str(24 * 3600))),
+    db_path=os.environ.get("SQLBOT_QUESTION_CACHE_DB") or None
+)
+# Кэш привязан к версии, которую модель загрузила на самом деле
+model_manager.on_version = lambda version: question_cache.set_model_version(version or "")
+MODEL_RELOADS = REGISTRY.counter("sqlbot_model_reloads_total", "Горячих замен модели")
+model_manager.on_swap = lambda version: MODEL_RELOADS.inc()
+question_cache.set_model_version(model_manager.version or "")
+
+def sql_compiles(query):
+    # Проверка без выполнения: SQLite компилирует запрос и сверяет таблицы/столбцы
+    with db_pool.connection() as conn:
+        try:
+            conn.execute(f"EXPLAIN {query}")
+            return True
+        except Exception:
+            return False
+
+question_cache.warm_from_log(LOG_FILE, validate=sql_compiles)
+
+# Быстрый путь: вопросы по шаблонам синтетического датасета переводятся в SQL без модели
+template_index = TemplateIndex() if os.environ.get("SQLBOT_FASTPATH", "1") == "1" else None
+
+# Поиск похожего вопроса в обучающем корпусе: почти дословные повторы отвечаются без модели
+retrieval_index = load_index(
+    threshold=float(os.environ.get("SQLBOT_RETRIEVAL_THRESHOLD", "0.9"))
+) if os.environ.get("SQLBOT_RETRIEVAL", "1") == "1" else None
+
+def lookup_sql(user_input):
+    """
+    SQL без обращения к модели: (sql, source), где source — "fastpath",
+    "cache" или "retrieval"; (None, None), если нужен T5.
+    """
+    if template_index is not None:
+        sql_query = template_index.match(user_input)
+        if sql_query is not None:
+            return sql_query, "fastpath"
+    sql_query = question_cache.get(user_input)
+    if sql_query is not None:
+        return sql_query, "cache"
+    if retrieval_index is not None:
+        sql_query = retrieval_index.match(user_input)
+        if sql_query is not None:
+            question_cache.put(user_input, sql_query)
+            return sql_query, "retrieval"
+    return None, None
+
+# Горячая замена модели: не чаще раза в SQLBOT_MODEL_WATCH_INTERVAL секунд сверяем версию
+# файлов в model_dir; новая версия грузится в фоне, до подмены отвечает прежняя.
+# Проверка идёт из обработки запроса, поэтому работает и в воркерах gunicorn после fork
+MODEL_WATCH_INTERVAL = float(os.environ.get("SQLBOT_MODEL_WATCH_INTERVAL", "30"))
+_model_checked_at = time.monotonic()
+
+def check_model_version():
+    global _model_checked_at
+    now = time.monotonic()
+    if MODEL_WATCH_INTERVAL <= 0 or now - _model_checked_at < MODEL_WATCH_INTERVAL:
+        return
+    _model_checked_at = now
+    version = current_model_version()
+    if version is None:
+        return
+    if version not in (model_manager.version, model_manager.failed_version):
+        model_manager.reload(version)
+
+def get_sql_query(user_input, trace=None):
+    return get_sql_queries([user_input], trace)[0][0]
+
+def get_sql_queries(questions, trace=None):
+    """
+    SQL для списка вопросов: [(sql, source), ...] в том же порядке.
+    Вопросы без готового ответа уходят в модель сразу все (submit_many),
+    одинаковые после нормализации — один раз.
+    """
+    with timed(trace, "lookup"):
+        results, pending, version = lookup_sql_queries(questions)
+    generated = {}
+    if pending:
+        with timed(trace, "generate"):
+            futures = scheduler.submit_many(list(pending.values()))
+            generated = {key: future.result() for key, future in zip(pending, futures)}
+    return finish_sql_queries(questions, results, generated, version)
+
+def lookup_sql_queries(questions):
+    """
+    Первая половина get_sql_queries (общая с asgi_app): проверка новой версии
+    модели и поиск готовых ответов. Возвращает (results, pending, version):
+    pending — {нормализованный вопрос: вопрос} для модели, version — версия
+    модели до генерации.
+    """
+    check_model_version()
+    results = [lookup_sql(question) for question in questions]
+    pending = {}
+    for question, (sql_query, _) in zip(questions, results):
+        if sql_query is None:
+            pending.setdefault(normalize_question(question), question)
+    return results, pending, model_manager.version
+
+def finish_sql_queries(questions, results, generated, version):
+    """
+    Вторая половина get_sql_queries: подставляет ответы модели
+    generated {нормализованный вопрос: sql} и кладёт их в кэш вопросов.
+    """
+    for i, (question, (sql_query, _)) in enumerate(zip(questions, results)):
+        if sql_query is None:
+            sql_query = generated[normalize_question(question)]
+            # Ответ модели, которую подменили во время генерации, в кэш не кладём
+            if model_manager.version == version:
+                question_cache.put(question, sql_query)
+            results[i] = (sql_query, "model")
+    for _, source in results:
+        SQL_SOURCE.inc(source=source)
+    return results
+
+# Кэш результатов: одинаковый SQL не выполняется повторно, пока база не изменилась
+result_cache = ResultCache(DB_PATH)
+
+# Постраничная выдача: в HTML не больше ROW_LIMIT строк, остальное — по кнопке "Загрузить ещё"
+ROW_LIMIT = int(os.environ.get("SQLBOT_ROW_LIMIT", "500"))
+STREAM_ROW_LIMIT = int(os.environ.get("SQLBOT_STREAM_ROW_LIMIT", "5000"))
+FETCH_CHUNK = 200
+
+# Проверка SQL перед выполнением: только чтение, оценка стоимости по плану,
+# LIMIT; запрос дольше SQL_TIMEOUT секунд прерывается
+sql_guard = SqlGuard(DB_PATH, max_cost=int(os.environ.get("SQLBOT_SQL_MAX_COST", "1000000")))
+SQL_TIMEOUT = float(os.environ.get("SQLBOT_SQL_TIMEOUT", "5"))
+
+def _skip_rows(cursor, offset):
+    # Пропускаем строки предыдущих страниц порциями, не держа их в памяти
+    skipped = 0
+    while skipped < offset:
+        chunk = cursor.fetchmany(min(FETCH_CHUNK, offset - skipped))
+        if not chunk:
+            break
+        skipped += len(chunk)
+
+def _iter_chunks(cursor, limit):
+    sent = 0
+    while sent < limit:
+        chunk = cursor.fetchmany(min(FETCH_CHUNK, limit - sent))
+        if not chunk:
+            break
+        sent += len(chunk)
+        yield chunk
+
+def _sql_error_text(e):
+    # Прерывание обработчиком прогресса (time_limit) — это превышение SQL_TIMEOUT
+    if isinstance(e, sqlite3.OperationalError) and str(e) == "interrupted":
+        return f"запрос выполнялся дольше {SQL_TIMEOUT:g} с"
+    return str(e)
+
+def execute_query(query, offset=0, limit=ROW_LIMIT):
+    """
+    Выполняет запрос и возвращает одну страницу результата:
+    (columns, rows, next_cursor), где next_cursor — смещение следующей
+    страницы или None, если строк больше нет.
+    """
+    unknown = unknown_identifiers(query, schema)
+    if unknown:
+        # Запрос заведомо не выполнится — не обращаемся к базе
+        SQL_ERRORS.inc()
+        return ["Ошибка"], [[f"Ошибка: неизвестные таблицы или столбцы: {', '.join(unknown)} (SQL: {query})"]], None
+    page = (offset, limit)
+    cached = result_cache.get(query, page)
+    if cached is None:
+        version = result_cache.version()
+        executed = with_limit(query, offset + limit + 1)
+        try:
+            with db_pool.connection() as conn:
+                verdict = sql_guard.check(conn, query, offset + limit + 1)
+                if not verdict["allowed"]:
+                    SQL_ERRORS.inc()
+                    return ["Ошибка"], [[f"Ошибка: {verdict['reason']} (SQL: {query})"]], None
+                cursor = conn.cursor()
+                try:
+                    with time_limit(conn, SQL_TIMEOUT):
+                        cursor.execute(executed)
+                        columns = [description[0] for description in cursor.description or []]
+                        _skip_rows(cursor, offset)
+                        # Лишняя строка показывает, есть ли следующая страница
+                        results = [row for chunk in _iter_chunks(cursor, limit + 1) for row in chunk]
+                    result_cache.put(query, columns, results, page, version)
+                except Exception as e:
+                    SQL_ERRORS.inc()
+                    return ["Ошибка"], [[f"Ошибка: {_sql_error_text(e)} (SQL: {query})"]], None
+                finally:
+                    cursor.close()
+        except TimeoutError as e:
+            # Все соединения пула заняты дольше db_pool.timeout
+            SQL_ERRORS.inc()
+            return ["Ошибка"], [[f"Ошибка: {e} (SQL: {query})"]], None
+    else:
+        columns, results = cached
+    next_cursor = offset + limit if len(results) > limit else None
+    return columns, results[:limit], next_cursor
+
+# Курсор /rows содержит сам SQL и смещение, подписанные HMAC: следующие страницы
+# выполняют тот же запрос, даже если кэш вопросов истёк или модель подменили.
+# Ключ общий для воркеров gunicorn, если задан SQLBOT_CURSOR_SECRET (иначе — ключ процесса;
+# с preload_app он создаётся в мастере до fork и тоже общий)
+CURSOR_SECRET = os.environ.get("SQLBOT_CURSOR_SECRET", "").encode() or os.urandom(32)
+
+def make_cursor(query, offset):
+    payload = base64.urlsafe_b64encode(json.dumps([query, offset], ensure_ascii=False).encode()).decode()
+    signature = hmac.new(CURSOR_SECRET, payload.encode(), hashlib.sha256).hexdigest()[:32]
+    return f"{payload}.{signature}"
+
+def read_cursor(cursor):
+    """
+    (query, offset) из курсора make_cursor или None, если курсор испорчен или подделан.
+    """
+    payload, _, signature = cursor.partition(".")
+    expected = hmac.new(CURSOR_SECRET, payload.encode(), hashlib.sha256).hexdigest()[:32]
+    if not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        query, offset = json.loads(base64.urlsafe_b64decode(payload.encode()))
+    except ValueError:
+        return None
+    if not isinstance(query, str) or not isinstance(offset, int) or offset < 0:
+        return None
+    return query, offset
+
+def stream_query_rows(query, offset=0, limit=STREAM_ROW_LIMIT):
+    """
+    Генератор NDJSON: строка со столбцами, затем по строке на запись
+    и в конце {"next_cursor": ...} (курсор make_cursor или null).
+    Страница (не больше limit строк) читается целиком и соединение
+    возвращается в пул до первой отправленной строки: медленный клиент
+    не держит соединение, пока читает ответ.
+    """
+    executed = with_limit(query, offset + limit + 1)
+    error = None
+    try:
+        with db_pool.connection() as conn:
+            verdict = sql_guard.check(conn, query, offset + limit + 1)
+            if not verdict["allowed"]:
+                error = verdict["reason"]
+            else:
+                cursor = conn.cursor()
+                try:
+                    with time_limit(conn, SQL_TIMEOUT):
+                        cursor.execute(executed)
+                        columns = [description[0] for description in cursor.description or []]
+                        _skip_rows(cursor, offset)
+                        # Лишняя строка показывает, есть ли следующая страница
+                        rows = [row for chunk in _iter_chunks(cursor, limit + 1) for row in chunk]
+                except Exception as e:
+                    error = _sql_error_text(e)
+                finally:
+                    cursor.close()
+    except TimeoutError as e:
+        error = str(e)
+    if error is not None:
+        yield json.dumps({"error": f"{error} (SQL: {query})"}, ensure_ascii=False) + "\n"
+        return
+    yield json.dumps({"columns": columns}, ensure_ascii=False) + "\n"
+    page = rows[:limit]
+    for start in range(0, len(page), FETCH_CHUNK):
+        yield "".join(json.dumps(list(row), ensure_ascii=False, default=str) + "\n"
+                      for row in page[start:start + FETCH_CHUNK])
+    has_more = len(rows) > limit
+    yield json.dumps({"next_cursor": make_cursor(query, offset + limit) if has_more else None}) + "\n"
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     response = None
     columns = []
     encouragement = None
+    user_input = None
+    next_cursor = None
+    trace = None
     if request.method == "POST":
+        trace = Trace("index")
         user_input = request.form["query"]
-        sql_query = get_sql_query(user_input)
-        print(sql_query)
-        columns, response = execute_query(sql_query)
+        [(sql_query, sql_source)] = get_sql_queries([user_input], trace)
+        with trace.stage("execute"):
+            columns, response, next_cursor = execute_query(sql_query)
+        if next_cursor is not None:
+            next_cursor = make_cursor(sql_query, next_cursor)
         encouragement = random.choice(ENCOURAGEMENTS)
-        log_interaction(user_input, sql_query)
-    return render_template("index.html", response=response, columns=columns, year=datetime.now().year, encouragement=encouragement)
+        with trace.stage("log"):
+            log_interaction(user_input, sql_query, sql_valid=columns != ["Ошибка"], source=sql_source,
+                            latency_ms=trace.elapsed_ms(), trace_id=trace.trace_id)
+    with timed(trace, "render"):
+        page = render_template("index.html", response=response, columns=columns, year=datetime.now().year,
+                               encouragement=encouragement, question=user_input, next_cursor=next_cursor,
+                               trace_id=trace.trace_id if trace is not None else None)
+    if trace is None:
+        return page
+    trace.finish()
+    return Response(page, headers=trace_headers(trace))
+
+# JSON API: /api/v1/query (один вопрос) и /api/v1/query:batch (много вопросов за один запрос)
+API_MAX_BATCH = int(os.environ.get("SQLBOT_API_MAX_BATCH", "500"))
+
+def trace_headers(trace):
+    return {"X-Trace-Id": trace.trace_id, "Server-Timing": trace.server_timing()}
+
+def _json_response(payload, status=200, trace=None):
+    # default=str: значения BLOB и прочие нестандартные типы SQLite отдаются строкой
+    headers = None
+    if trace is not None:
+        trace.finish()
+        headers = trace_headers(trace)
+    return Response(json.dumps(payload, ensure_ascii=False, default=str), status=status,
+                    mimetype="application/json", headers=headers)
+
+class ApiError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_api_request(data, batch=False):
+    """
+    Проверяет тело запроса к API и возвращает (questions, cursor, limit):
+    cursor — (query, offset) из подписанного next_cursor прошлого ответа
+    или None. При ошибке — ApiError с HTTP-статусом.
+    """
+    if not isinstance(data, dict):
+        raise ApiError("Тело запроса должно быть JSON-объектом")
+    if batch:
+        questions = data.get("questions")
+        if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+            raise ApiError("Поле questions должно быть непустым списком строк")
+        if len(questions) > API_MAX_BATCH:
+            raise ApiError(f"Не больше {API_MAX_BATCH} вопросов за запрос", 413)
+    else:
+        question = data.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise ApiError("Поле question должно быть непустой строкой")
+        questions = [question]
+    cursor = data.get("cursor")
+    if cursor is not None:
+        if batch:
+            raise ApiError("cursor не поддерживается в пакетном запросе: следующие страницы — через /api/v1/query")
+        cursor = read_cursor(cursor) if isinstance(cursor, str) else None
+        if cursor is None:
+            raise ApiError("cursor должен быть значением next_cursor из предыдущего ответа")
+    try:
+        limit = min(ROW_LIMIT, max(1, int(data.get("limit") or ROW_LIMIT)))
+    except (TypeError, ValueError, OverflowError):
+        raise ApiError("limit должен быть целым числом")
+    return questions, cursor, limit
+
+def api_sql_queries(questions, trace=None):
+    """
+    get_sql_queries для API: сбой модели — ApiError 503, а не HTML-страница 500.
+    """
+    try:
+        return get_sql_queries(questions, trace)
+    except Exception as e:
+        raise ApiError(f"Модель недоступна: {e}", 503)
+
+def api_result(question, sql_query, source, generate_ms, offset, limit, trace=None):
+    """
+    Выполняет SQL одного вопроса, пишет лог и собирает элемент ответа API.
+    """
+    started = time.perf_counter()
+    with timed(trace, "execute"):
+        columns, result_rows, next_offset = execute_query(sql_query, offset, limit)
+    execute_ms = (time.perf_counter() - started) * 1000
+    error = None
+    if columns == ["Ошибка"]:
+        error, columns, result_rows = result_rows[0][0], [], []
+    with timed(trace, "log"):
+        log_interaction(question, sql_query, sql_valid=error is None, source=source,
+                        latency_ms=generate_ms + execute_ms, trace_id=trace.trace_id if trace is not None else None)
+    return {
+        "question": question,
+        "sql": sql_query,
+        "source": source,
+        "columns": columns,
+        "rows": [list(row) for row in result_rows],
+        # Следующая страница выполняет тот же SQL, без повторной генерации
+        "next_cursor": make_cursor(sql_query, next_offset) if next_offset is not None else None,
+        "error": error,
+        "timing_ms": {"execute": round(execute_ms, 2)},
+    }
+
+def api_batch_response(results, generate_ms, started):
+    return {
+        "results": results,
+        "timing_ms": {
+            "generate": round(generate_ms, 2),
+            "execute": round(sum(r["timing_ms"]["execute"] for r in results), 2),
+            "total": round((time.perf_counter() - started) * 1000, 2),
+        },
+    }
+
+@app.route("/api/v1/query", methods=["POST"])
+def api_query():
+    """
+    {"question": "...", "limit": 100, "cursor": "<next_cursor>"} ->
+    {"sql", "source", "columns", "rows", "next_cursor", "error", "timing_ms"}
+    """
+    started = time.perf_counter()
+    trace = Trace("api")
+    try:
+        [question], cursor, limit = parse_api_request(request.get_json(silent=True) or {})
+        if cursor is None:
+            [(sql_query, source)] = api_sql_queries([question], trace)
+            offset = 0
+        else:
+            (sql_query, offset), source = cursor, "cursor"
+    except ApiError as e:
+        return _json_response({"error": str(e)}, e.status, trace)
+    generate_ms = (time.perf_counter() - started) * 1000
+    result = api_result(question, sql_query, source, generate_ms, offset, limit, trace)
+    result["timing_ms"].update(generate=round(generate_ms, 2), total=round((time.perf_counter() - started) * 1000, 2))
+    result["trace_id"] = trace.trace_id
+    return _json_response(result, trace=trace)
+
+@app.route("/api/v1/query:batch", methods=["POST"])
+def api_query_batch():
+    """
+    {"questions": ["...", ...], "limit": 100} -> {"results": [...], "timing_ms": {...}}
+    Вопросы, которым нужна модель, генерируются общими пакетами через BatchScheduler.
+    """
+    started = time.perf_counter()
+    trace = Trace("api_batch")
+    try:
+        questions, _, limit = parse_api_request(request.get_json(silent=True) or {}, batch=True)
+        queries = api_sql_queries(questions, trace)
+    except ApiError as e:
+        return _json_response({"error": str(e)}, e.status, trace)
+    generate_ms = (time.perf_counter() - started) * 1000
+    results = [api_result(question, sql_query, source, generate_ms, 0, limit, trace)
+               for question, (sql_query, source) in zip(questions, queries)]
+    response = api_batch_response(results, generate_ms, started)
+    response["trace_id"] = trace.trace_id
+    return _json_response(response, trace=trace)
+
+@app.route("/feedback", methods=["POST"])
+def feedback():
+    """
+    Отметка пользователя об ответе: {"trace_id": "...", "correct": true}
+    и необязательный "question" (в пакетном API trace_id общий для вопросов).
+    continuous_finetune.py дообучает модель только на ответах с отметкой "верно".
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("correct"), bool) \
+            or not isinstance(data.get("trace_id"), str) or not re.fullmatch(r"[\w-]{1,64}", data["trace_id"]):
+        return _json_response({"error": "Нужны trace_id и correct (true или false)"}, 400)
+    question = data.get("question")
+    log_interaction(question if isinstance(question, str) else "", "", source="feedback",
+                    notes=FEEDBACK_CORRECT if data["correct"] else FEEDBACK_WRONG, trace_id=data["trace_id"])
+    return _json_response({"ok": True})
+
+@app.route("/ready")
+def ready():
+    # Проверка готовности для балансировщика: 200, когда модель загружена
+    status = model_manager.status()
+    if model_manager.version is None and not model_manager.ready:
+        status["error"] = status["error"] or f"Модель не найдена в {model_dir}: обучите её (model/train_model.py)"
+    return jsonify(status), 200 if model_manager.ready else 503
+
+# Показатели компонентов, которые вычисляются при каждом запросе /metrics
+REGISTRY.gauge("sqlbot_model_ready", "1, если модель загружена", lambda: int(model_manager.ready))
+REGISTRY.gauge("sqlbot_question_cache_size", "Записей в кэше вопросов", lambda: question_cache.stats()["size"])
+REGISTRY.gauge("sqlbot_result_cache_hit_rate", "Доля попаданий в кэш результатов", lambda: result_cache.stats()["hit_rate"])
+REGISTRY.gauge("sqlbot_db_pool_wait_avg_ms", "Среднее ожидание соединения SQLite, мс", lambda: db_pool.stats()["wait_avg_ms"])
+REGISTRY.gauge("sqlbot_sql_guard_rejected", "Уникальных запросов, отклонённых проверкой SQL",
+               lambda: sql_guard.stats()["rejected"])
+REGISTRY.gauge("sqlbot_scheduler_avg_batch_size", "Средний размер пакета генерации", lambda: scheduler.stats()["avg_batch_size"])
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+@app.route("/rows")
+def rows():
+    # Следующие страницы результата в формате NDJSON: SQL и смещение берутся из курсора
+    cursor = read_cursor(request.args.get("cursor", ""))
+    if cursor is None:
+        return Response('{"error": "Неверный курсор"}\n', status=400, mimetype="application/x-ndjson")
+    sql_query, offset = cursor
+    limit = min(STREAM_ROW_LIMIT, max(1, request.args.get("limit", STREAM_ROW_LIMIT, type=int)))
+    trace = Trace("rows")
+
+    def traced_rows():
+        # Длительность /rows — до последней отправленной строки (или обрыва клиентом)
+        try:
+            yield from stream_query_rows(sql_query, offset, limit)
+        finally:
+            trace.finish()
+
+    return Response(stream_with_context(traced_rows()), mimetype="application/x-ndjson")
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
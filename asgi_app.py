@@ -0,0 +1,233 @@
+"""
+ASGI-режим для JSON API (тот же /api/v1/query, /api/v1/query:batch, /ready
+и /metrics).
+
+Запрос обрабатывается в цикле событий и не занимает поток, пока ждёт
+модель: вопрос ставится в BatchScheduler из app.py, а его Future
+ожидается через asyncio.wrap_future. Поэтому сотни открытых соединений
+не требуют сотен потоков. Обращения к SQLite (кэш вопросов, выполнение
+SQL) идут в отдельный небольшой пул потоков через run_in_executor.
+
+Обратное давление: одновременно в модели не больше SQLBOT_ASGI_MAX_PENDING
+вопросов, сверх этого сразу отвечаем 503 с Retry-After; вопрос, который не
+дождался модели за SQLBOT_ASGI_DEADLINE секунд, отменяется (504).
+
+Остальные пути (HTML-форма, /rows) обслуживает Flask-приложение через
+asgiref, если пакет установлен.
+
+Запуск (нужен pip install uvicorn):
+    uvicorn asgi_app:app --host 127.0.0.1 --port 8000
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as sync_app
+import telemetry
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+MAX_PENDING = int(os.environ.get("SQLBOT_ASGI_MAX_PENDING", "64"))
+DEADLINE = float(os.environ.get("SQLBOT_ASGI_DEADLINE", "30"))
+MAX_BODY_BYTES = 1024 * 1024
+
+# Потоки только для SQLite: поиск в кэше вопросов и выполнение SQL
+db_executor = ThreadPoolExecutor(sync_app.db_pool.size, thread_name_prefix="asgi-db")
+flask_asgi = WsgiToAsgi(sync_app.app) if WsgiToAsgi is not None else None
+
+
+class Overloaded(Exception):
+    pass
+
+
+ASGI_REJECTED = telemetry.REGISTRY.counter("sqlbot_asgi_rejected_total", "Запросов, отклонённых с 503 (ASGI)")
+
+
+class InferenceGate:
+    """
+    Счётчик вопросов, ожидающих модель. Работает в одном цикле событий,
+    поэтому блокировка не нужна.
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+
+    def acquire(self, n):
+        if self.pending + n > self.max_pending:
+            self.rejected += 1
+            ASGI_REJECTED.inc()
+            raise Overloaded(f"Модель перегружена: в очереди {self.pending} вопросов")
+        self.pending += n
+
+    def release(self, n):
+        self.pending -= n
+
+
+gate = InferenceGate(MAX_PENDING)
+telemetry.REGISTRY.gauge("sqlbot_asgi_pending", "Вопросов, ожидающих модель (ASGI)", lambda: gate.pending)
+
+
+async def resolve_sql(questions, deadline, trace):
+    """
+    Асинхронный аналог app.get_sql_queries: [(sql, source), ...].
+    Поиск и запись в кэш — те же app.lookup_sql_queries и app.finish_sql_queries.
+    """
+    loop = asyncio.get_running_loop()
+
+    def lookup():
+        with trace.stage("lookup"):
+            return sync_app.lookup_sql_queries(questions)
+
+    results, pending, version = await loop.run_in_executor(db_executor, lookup)
+    if not pending:
+        return sync_app.finish_sql_queries(questions, results, {}, version)
+
+    gate.acquire(len(pending))
+    futures = sync_app.scheduler.submit_many(list(pending.values()))
+    try:
+        with trace.stage("generate"):
+            generated = await asyncio.wait_for(
+                asyncio.gather(*(asyncio.wrap_future(f) for f in futures)),
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+    except asyncio.TimeoutError:
+        # Отменённые вопросы BatchScheduler в модель уже не отправит
+        for future in futures:
+            future.cancel()
+        raise
+    except Exception as e:
+        raise sync_app.ApiError(f"Модель недоступна: {e}", 503)
+    finally:
+        gate.release(len(pending))
+
+    return await loop.run_in_executor(db_executor, sync_app.finish_sql_queries, questions, results,
+                                      dict(zip(pending, generated)), version)
+
+
+async def handle_query(data, batch, trace):
+    started = time.perf_counter()
+    deadline = time.monotonic() + DEADLINE
+    questions, cursor, limit = sync_app.parse_api_request(data, batch)
+    if cursor is None:
+        queries = await resolve_sql(questions, deadline, trace)
+        offset = 0
+    else:
+        # Следующая страница: SQL из подписанного курсора, модель не нужна
+        query, offset = cursor
+        queries = [(query, "cursor")]
+    generate_ms = (time.perf_counter() - started) * 1000
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(db_executor, sync_app.api_result, question, sql_query, source, generate_ms, offset, limit,
+                             trace)
+        for question, (sql_query, source) in zip(questions, queries)
+    ))
+    if batch:
+        response = sync_app.api_batch_response(list(results), generate_ms, started)
+    else:
+        response = results[0]
+        response["timing_ms"].update(generate=round(generate_ms, 2),
+                                     total=round((time.perf_counter() - started) * 1000, 2))
+    response["trace_id"] = trace.trace_id
+    return 200, response
+
+
+async def handle_ready(_, trace):
+    status = sync_app.model_manager.status()
+    status.update(pending=gate.pending, max_pending=gate.max_pending, rejected=gate.rejected)
+    return (200 if sync_app.model_manager.ready else 503), status
+
+
+ROUTES = {
+    ("POST", "/api/v1/query"): ("api", lambda data, trace: handle_query(data, False, trace)),
+    ("POST", "/api/v1/query:batch"): ("api_batch", lambda data, trace: handle_query(data, True, trace)),
+    ("GET", "/ready"): ("ready", handle_ready),
+}
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise sync_app.ApiError("Слишком большое тело запроса", 413)
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def send_body(send, status, body, content_type, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    await send_body(send, status, body, "application/json", headers)
+
+
+def trace_headers(trace):
+    trace.finish()
+    return [(b"x-trace-id", trace.trace_id.encode()), (b"server-timing", trace.server_timing().encode())]
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            db_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if (scope["method"], scope["path"]) == ("GET", "/metrics"):
+        await send_body(send, 200, telemetry.render().encode("utf-8"), telemetry.CONTENT_TYPE)
+        return
+    route = ROUTES.get((scope["method"], scope["path"]))
+    if route is None:
+        if flask_asgi is not None:
+            await flask_asgi(scope, receive, send)
+        else:
+            await send_json(send, 404, {"error": "Не найдено"})
+        return
+    endpoint, handler = route
+    trace = telemetry.Trace(endpoint)
+    try:
+        body = await read_body(receive)
+        data = json.loads(body) if body else {}
+        status, payload = await handler(data, trace)
+    except json.JSONDecodeError:
+        status, payload = 400, {"error": "Некорректный JSON"}
+    except sync_app.ApiError as e:
+        status, payload = e.status, {"error": str(e)}
+    except Overloaded as e:
+        await send_json(send, 503, {"error": str(e)}, [(b"retry-after", b"1")] + trace_headers(trace))
+        return
+    except asyncio.TimeoutError:
+        status, payload = 504, {"error": f"SQL не сгенерирован за {DEADLINE} с"}
+    await send_json(send, status, payload, trace_headers(trace))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi_app:app", host="127.0.0.1", port=8000)
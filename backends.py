@@ -0,0 +1,134 @@
+"""
+Бэкенды инференса для генерации SQL.
+
+- "torch": исходная модель T5 в fp32 на PyTorch.
+- "int8":  динамическая int8-квантизация линейных слоёв (torch.quantization.quantize_dynamic).
+- "onnx":  энкодер/декодер, экспортированные в ONNX, с KV-кэшем на ONNX Runtime
+           (нужен пакет optimum[onnxruntime]). Экспорт хранится в <model_dir>_onnx
+           и повторяется, если модель изменилась с момента экспорта.
+
+Перед тем как бэкенд начнёт обслуживать запросы, он проходит проверку
+точности: exact match на test_t5_sql_generation.test_cases не должен быть
+ниже, чем у fp32-модели (с допуском tolerance). Иначе используется "torch".
+"""
+import os
+import shutil
+
+import torch
+
+from inference import generate_sql_batch, load_model
+from question_cache import model_fingerprint
+from test_t5_sql_generation import normalize_sql, test_cases
+
+# Отпечаток модели (question_cache.model_fingerprint), из которой сделан экспорт ONNX
+ONNX_FINGERPRINT = "model_fingerprint.txt"
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_dir, device=torch.device("cpu")):
+        self.model_dir = model_dir
+        self.device = device
+        self.tokenizer, self.model = load_model(model_dir, device)
+
+    def generate(self, texts, max_length=128, num_beams=1, logits_processor=None):
+        return generate_sql_batch(self.tokenizer, self.model, texts, max_length=max_length,
+                                  num_beams=num_beams, device=self.device, logits_processor=logits_processor)
+
+
+class QuantizedBackend(TorchBackend):
+    name = "int8"
+
+    def __init__(self, model_dir, device=torch.device("cpu"), base=None):
+        if base is None:
+            super().__init__(model_dir, device)
+            base_model = self.model
+        else:
+            self.model_dir, self.device, self.tokenizer = base.model_dir, base.device, base.tokenizer
+            base_model = base.model
+        # Веса nn.Linear хранятся в int8, активации квантуются на лету
+        self.model = torch.quantization.quantize_dynamic(base_model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+
+
+class OnnxBackend(TorchBackend):
+    name = "onnx"
+
+    def __init__(self, model_dir, device=torch.device("cpu")):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError:
+            raise RuntimeError("Для бэкенда onnx установите пакет optimum[onnxruntime]")
+        from transformers import T5Tokenizer
+
+        self.model_dir = model_dir
+        self.device = torch.device("cpu")
+        self.tokenizer = T5Tokenizer.from_pretrained(model_dir)
+        onnx_dir = model_dir.rstrip("/") + "_onnx"
+        fingerprint = model_fingerprint(model_dir)
+        if _read_fingerprint(onnx_dir) == fingerprint:
+            self.model = ORTModelForSeq2SeqLM.from_pretrained(onnx_dir, use_cache=True)
+        else:
+            # Первый запуск или модель переобучена: экспортируем энкодер и декодер
+            # (с past_key_values) и сохраняем рядом с моделью вместе с её отпечатком
+            self.model = ORTModelForSeq2SeqLM.from_pretrained(model_dir, export=True, use_cache=True)
+            tmp_dir = f"{onnx_dir}.tmp{os.getpid()}"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            self.model.save_pretrained(tmp_dir)
+            with open(os.path.join(tmp_dir, ONNX_FINGERPRINT), "w", encoding="utf-8") as f:
+                f.write(fingerprint)
+            shutil.rmtree(onnx_dir, ignore_errors=True)
+            os.replace(tmp_dir, onnx_dir)
+
+
+def _read_fingerprint(onnx_dir):
+    try:
+        with open(os.path.join(onnx_dir, ONNX_FINGERPRINT), encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "int8": QuantizedBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def exact_match(backend, cases=test_cases, max_length=128):
+    """
+    Доля вопросов из cases, для которых нормализованный SQL совпал с эталоном.
+    """
+    preds = backend.generate([case["input"] for case in cases], max_length=max_length)
+    matches = sum(normalize_sql(pred) == normalize_sql(case["target_sql"]) for pred, case in zip(preds, cases))
+    return matches / len(cases)
+
+
+def create_backend(name, model_dir, device=torch.device("cpu"), tolerance=0.0):
+    """
+    Создаёт бэкенд по имени. Для всего, кроме "torch", сначала проверяется
+    точность относительно fp32; не прошедший проверку бэкенд не используется.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд: {name}. Доступны: {', '.join(BACKENDS)}")
+    reference = TorchBackend(model_dir, device)
+    if name == "torch":
+        return reference
+
+    try:
+        if name == "int8":
+            candidate = QuantizedBackend(model_dir, device, base=reference)
+        else:
+            candidate = BACKENDS[name](model_dir, device)
+    except RuntimeError as e:
+        print(f"Бэкенд {name} недоступен ({e}), используется torch")
+        return reference
+
+    reference_score = exact_match(reference)
+    candidate_score = exact_match(candidate)
+    print(f"Проверка бэкенда {name}: exact match {candidate_score:.2%} (fp32: {reference_score:.2%})")
+    if candidate_score + tolerance < reference_score:
+        print(f"Бэкенд {name} не прошёл проверку точности, используется torch")
+        return reference
+    return candidate
@@ -0,0 +1,116 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchScheduler:
+    """
+    Динамический батчинг запросов к модели.
+
+    Запросы из разных потоков складываются в очередь; фоновый поток
+    собирает их в пакет, пока не наберётся max_batch_size вопросов или
+    не истечёт max_wait_ms с момента прихода первого, и выполняет один
+    вызов generate_batch(texts) -> list[str] на весь пакет.
+    Каждый вызывающий получает Future со своим результатом.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait_ms=5.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size должен быть не меньше 1")
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._fork_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._closed = False
+        self._start_worker()
+
+    def _start_worker(self):
+        # Потоки не переживают fork: в дочернем процессе (воркер gunicorn
+        # с preload_app) очередь и поток создаются заново при первом submit.
+        # _pid публикуется последним: поток, увидевший свой pid, уже
+        # получает новую очередь, а не унаследованную
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._worker.start()
+        self._pid = os.getpid()
+
+    def submit(self, text):
+        """
+        Ставит вопрос в очередь и возвращает Future с SQL.
+        """
+        if self._closed:
+            raise RuntimeError("BatchScheduler уже остановлен")
+        if self._pid != os.getpid():
+            with self._fork_lock:
+                if self._pid != os.getpid():
+                    self._lock = threading.Lock()
+                    self._batches = self._items = 0
+                    self._start_worker()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def submit_many(self, texts):
+        return [self.submit(text) for text in texts]
+
+    def close(self, timeout=None):
+        """
+        Останавливает фоновый поток; уже поставленные запросы будут обработаны.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            batches, items = self._batches, self._items
+        return {
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": items / batches if batches else 0.0,
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Возвращаем сигнал остановки, чтобы завершиться после этого пакета
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            # Отменённые клиентом запросы в модель не отправляем
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.generate_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
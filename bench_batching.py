@@ -0,0 +1,86 @@
+"""
+Нагрузочный тест динамического батчинга (batching.BatchScheduler).
+
+Запускает N клиентских потоков, которые одновременно отправляют вопросы
+через планировщик, и для каждой комбинации настроек батчинга печатает
+p50/p99 задержки и пропускную способность (запросов в секунду).
+
+Пример:
+    python bench_batching.py --requests 200 --concurrency 16 --batch-sizes 1,4,8,16 --waits 0,5,10
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from batching import BatchScheduler
+from inference import DEFAULT_MODEL_DIR, generate_sql_batch, load_model
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def run_setting(generate, questions, concurrency, max_batch_size, max_wait_ms):
+    scheduler = BatchScheduler(generate, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def one_request(question):
+        start = time.perf_counter()
+        scheduler.submit(question).result()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one_request, questions))
+    elapsed = time.perf_counter() - start
+    stats = scheduler.stats()
+    scheduler.close()
+    return {
+        "max_batch_size": max_batch_size,
+        "max_wait_ms": max_wait_ms,
+        "requests": len(questions),
+        "qps": len(questions) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "avg_batch_size": stats["avg_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--data", default="data/training_data.csv")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--waits", default="0,5,10", help="max_wait_ms через запятую")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tokenizer, model = load_model(args.model_dir)
+    generate = partial(generate_sql_batch, tokenizer, model, max_length=128)
+
+    texts = pd.read_csv(args.data)["text"].dropna().tolist()
+    random.seed(args.seed)
+    questions = [random.choice(texts) for _ in range(args.requests)]
+
+    # Прогрев, чтобы первая настройка не платила за инициализацию
+    generate(questions[:2])
+
+    print(f"{'batch':>5} {'wait_ms':>8} {'qps':>8} {'p50_ms':>9} {'p99_ms':>9} {'avg_batch':>9}")
+    for max_batch_size in [int(x) for x in args.batch_sizes.split(",")]:
+        for max_wait_ms in [float(x) for x in args.waits.split(",")]:
+            r = run_setting(generate, questions, args.concurrency, max_batch_size, max_wait_ms)
+            print(f"{r['max_batch_size']:>5} {r['max_wait_ms']:>8.1f} {r['qps']:>8.2f} "
+                  f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['avg_batch_size']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Бенчмарк скорости инференса модели T5 (data/model_t5_sql).
+
+Вопросы берутся из test_t5_sql_generation.test_cases и из
+data/training_data.csv. Перебираются настройки декодирования (num_beams,
+max_length), число потоков torch и размер пакета; для каждой комбинации
+измеряются время токенизации, энкодера и декодера, токенов/с, пиковый RSS
+и p50/p95/p99 задержки пакета. Каждая комбинация выполняется в отдельном
+процессе (модель загружается заново), поэтому пиковый RSS относится к ней,
+а не к самой тяжёлой из предыдущих. Результат пишется в JSON, который
+удобно сравнивать между коммитами.
+
+Пример:
+    python bench_inference.py --threads 1,4 --batch-sizes 1,8 --num-beams 1,4 --output bench_before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+import torch
+import transformers
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bench_batching import percentile
+from inference import DEFAULT_MODEL_DIR, PROMPT_PREFIX, load_model
+from test_t5_sql_generation import test_cases
+
+
+def int_list(value):
+    return [int(x) for x in value.split(",")]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_question_sets(data_path, sample_size, seed):
+    texts = pd.read_csv(data_path)["text"].dropna().tolist()
+    random.seed(seed)
+    return {
+        "test_cases": [case["input"] for case in test_cases],
+        "training_sample": random.sample(texts, min(sample_size, len(texts))),
+    }
+
+
+def run_batch(tokenizer, model, texts, max_length, num_beams):
+    """
+    Прогоняет один пакет, раздельно замеряя токенизацию, энкодер и декодер.
+    """
+    t0 = time.perf_counter()
+    inputs = tokenizer([PROMPT_PREFIX + t for t in texts], return_tensors="pt", padding=True,
+                       max_length=max_length, truncation=True)
+    t1 = time.perf_counter()
+    with torch.no_grad():
+        encoder_outputs = model.get_encoder()(**inputs)
+        t2 = time.perf_counter()
+        outputs = model.generate(encoder_outputs=encoder_outputs, attention_mask=inputs["attention_mask"],
+                                 max_length=max_length, num_beams=num_beams)
+    t3 = time.perf_counter()
+    # Первый токен — decoder_start_token, паддинг не считаем
+    generated = int((outputs[:, 1:] != tokenizer.pad_token_id).sum())
+    return t1 - t0, t2 - t1, t3 - t2, generated
+
+
+def bench_setting(tokenizer, model, questions, threads, batch_size, max_length, num_beams):
+    torch.set_num_threads(threads)
+    batches = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    run_batch(tokenizer, model, batches[0], max_length, num_beams)  # прогрев
+    tokenize = encode = decode = 0.0
+    tokens = 0
+    latencies = []
+    for batch in batches:
+        t_tok, t_enc, t_dec, generated = run_batch(tokenizer, model, batch, max_length, num_beams)
+        tokenize += t_tok
+        encode += t_enc
+        decode += t_dec
+        tokens += generated
+        latencies.append(t_tok + t_enc + t_dec)
+    total = tokenize + encode + decode
+    return {
+        "threads": threads,
+        "batch_size": batch_size,
+        "max_length": max_length,
+        "num_beams": num_beams,
+        "questions": len(questions),
+        "tokenize_ms": tokenize * 1000,
+        "encoder_ms": encode * 1000,
+        "decoder_ms": decode * 1000,
+        "generated_tokens": tokens,
+        "tokens_per_sec": tokens / (encode + decode) if encode + decode else 0.0,
+        "questions_per_sec": len(questions) / total if total else 0.0,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_setting(args, setting):
+    """
+    Одна комбинация настроек в отдельном процессе; возвращает её результат.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), "--model-dir", args.model_dir, "--data", args.data,
+           "--sample-size", str(args.sample_size), "--seed", str(args.seed), "--setting", json.dumps(setting)]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_single(args):
+    """
+    Режим дочернего процесса (--setting): загрузка модели и замер одной
+    комбинации, результат — JSON последней строкой stdout.
+    """
+    setting = json.loads(args.setting)
+    torch.manual_seed(args.seed)
+    load_start = time.perf_counter()
+    tokenizer, model = load_model(args.model_dir)
+    load_time = time.perf_counter() - load_start
+    questions = load_question_sets(args.data, args.sample_size, args.seed)[setting["question_set"]]
+    r = bench_setting(tokenizer, model, questions, setting["threads"], setting["batch_size"],
+                      setting["max_length"], setting["num_beams"])
+    r["question_set"] = setting["question_set"]
+    r["model_load_sec"] = load_time
+    print(json.dumps(r))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=DEFAULT_MODEL_DIR)
+    parser.add_argument("--data", default="data/training_data.csv")
+    parser.add_argument("--sample-size", type=int, default=64, help="Сколько вопросов взять из обучающих данных")
+    parser.add_argument("--threads", type=int_list, default=[1, torch.get_num_threads()])
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 8])
+    parser.add_argument("--max-lengths", type=int_list, default=[64, 128])
+    parser.add_argument("--num-beams", type=int_list, default=[1, 4])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="data/bench_inference.json")
+    parser.add_argument("--setting", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setting:
+        bench_single(args)
+        return
+
+    results = []
+    for set_name in load_question_sets(args.data, args.sample_size, args.seed):
+        for threads in args.threads:
+            for batch_size in args.batch_sizes:
+                for max_length in args.max_lengths:
+                    for num_beams in args.num_beams:
+                        r = run_setting(args, {"question_set": set_name, "threads": threads, "batch_size": batch_size,
+                                               "max_length": max_length, "num_beams": num_beams})
+                        results.append(r)
+                        print(f"{set_name:>16} threads={threads} batch={batch_size} max_len={max_length} "
+                              f"beams={num_beams}: {r['questions_per_sec']:.2f} q/s, "
+                              f"{r['tokens_per_sec']:.1f} tok/s, p50={r['latency_p50_ms']:.0f} мс, "
+                              f"p99={r['latency_p99_ms']:.0f} мс")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "model_dir": args.model_dir,
+            "model_load_sec": percentile([r["model_load_sec"] for r in results], 50),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Замер холодного старта app.py и памяти воркеров gunicorn.
+
+1. Для каждого режима SQLBOT_MODEL_LOAD в отдельном процессе измеряется
+   время импорта app.py, время до готовности модели и пиковый RSS.
+   "eager" соответствует прежнему поведению (модель грузится при импорте).
+2. С --gunicorn запускается gunicorn -c gunicorn.conf.py с preload_app и
+   без него; для мастера и каждого воркера читается /proc/<pid>/smaps_rollup:
+   RSS, PSS (RSS с долей общих страниц) и объём общих страниц. Только Linux.
+
+Пример:
+    python bench_startup.py --modes eager,lazy,background --gunicorn --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.model_manager.get()
+ready = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss = rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+except ImportError:
+    rss = None
+print(json.dumps({"import_sec": imported - start, "ready_sec": ready - start, "peak_rss_mb": rss}))
+"""
+
+
+def bench_import(mode):
+    env = dict(os.environ, SQLBOT_MODEL_LOAD=mode)
+    out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["mode"] = mode
+    return result
+
+
+def memory_kb(pid):
+    # Значения smaps_rollup в килобайтах
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss_mb": values.get("Rss", 0) / 1024,
+        "pss_mb": values.get("Pss", 0) / 1024,
+        "shared_mb": (values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)) / 1024,
+    }
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_ready(url, workers, timeout):
+    # Запросы попадают в разные воркеры: ждём несколько успешных ответов подряд
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                streak = streak + 1 if response.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError):
+            streak = 0
+        if streak >= workers * 2:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def bench_gunicorn(workers, preload, bind, timeout):
+    env = dict(os.environ, SQLBOT_WORKERS=str(workers), SQLBOT_BIND=bind,
+               SQLBOT_PRELOAD="1" if preload else "0", SQLBOT_MODEL_LOAD="eager")
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"], env=env)
+    try:
+        if not wait_ready(f"http://{bind}/ready", workers, timeout):
+            raise RuntimeError(f"gunicorn не ответил на /ready за {timeout} с")
+        ready_sec = time.perf_counter() - start
+        master = memory_kb(server.pid)
+        worker_memory = [memory_kb(pid) for pid in children(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    return {
+        "preload": preload,
+        "workers": workers,
+        "ready_sec": ready_sec,
+        "master": master,
+        "workers_memory": worker_memory,
+        "total_pss_mb": master["pss_mb"] + sum(w["pss_mb"] for w in worker_memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="eager,lazy,background")
+    parser.add_argument("--gunicorn", action="store_true", help="Замерить память воркеров gunicorn")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bind", default="127.0.0.1:8765")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", default="data/bench_startup.json")
+    args = parser.parse_args()
+
+    report = {"import": [], "gunicorn": []}
+    for mode in args.modes.split(","):
+        r = bench_import(mode)
+        report["import"].append(r)
+        print(f"{mode:>10}: импорт {r['import_sec']:.2f} с, модель готова через {r['ready_sec']:.2f} с, "
+              f"пиковый RSS {r['peak_rss_mb'] or 0:.0f} МБ")
+
+    if args.gunicorn:
+        for preload in (False, True):
+            r = bench_gunicorn(args.workers, preload, args.bind, args.timeout)
+            report["gunicorn"].append(r)
+            per_worker = ", ".join(f"{w['rss_mb']:.0f}/{w['pss_mb']:.0f}" for w in r["workers_memory"])
+            print(f"gunicorn preload={preload}: готов через {r['ready_sec']:.1f} с, "
+                  f"RSS/PSS воркеров (МБ): {per_worker}, суммарный PSS {r['total_pss_mb']:.0f} МБ")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Декодирование SQL с ограничениями по схеме базы данных.
+
+SchemaLogitsProcessor на каждом шаге генерации смотрит на уже
+сгенерированный текст, определяет, какой идентификатор сейчас ожидается
+(таблица после FROM/JOIN, столбец после "Таблица.", выражение после
+SELECT/WHERE/AND/...) и запрещает токены, после которых получится
+идентификатор, которого нет в data/database.db. Дополнительно запрос
+обязан начинаться с SELECT/WITH, а завершить генерацию можно только вне
+строкового литерала, при закрытых скобках, законченном идентификаторе и
+не на ключевом слове, после которого ожидается продолжение.
+
+Маски разрешённых токенов кэшируются по состоянию (текущий префикс слова
+и вид ожидаемого идентификатора). Для нового состояния словарь не
+перебирается: токены из одного слова (с пробелом в начале или без)
+заранее разложены по своему слову, и разрешённые находятся по префиксам
+допустимых идентификаторов; там, где ограничений нет, разрешены все такие
+токены сразу. Поштучно проверяются только токены со знаками препинания.
+"""
+import bisect
+import re
+from collections import OrderedDict
+
+import torch
+from transformers import LogitsProcessor
+
+from sql_schema import CTE_NAME
+
+START_KEYWORDS = {"SELECT", "WITH"}
+TABLE_KEYWORDS = {"FROM", "JOIN"}
+EXPR_KEYWORDS = {"SELECT", "WHERE", "AND", "OR", "BY", "ON", "DISTINCT", "HAVING", "NOT"}
+# Ключевые слова и функции, допустимые на месте выражения
+EXPR_WORDS = {
+    "SELECT", "DISTINCT", "ALL", "NOT", "NULL", "IS", "IN", "LIKE", "BETWEEN", "EXISTS",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "CAST", "AS", "TRUE", "FALSE",
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "LOWER", "UPPER", "LENGTH", "ROUND", "ABS",
+    "COALESCE", "IFNULL", "SUBSTR", "TRIM", "STRFTIME", "DATE",
+}
+
+# Слова, которые не могут быть псевдонимами таблиц
+NON_ALIAS_WORDS = EXPR_WORDS | TABLE_KEYWORDS | EXPR_KEYWORDS | {
+    "WHERE", "GROUP", "ORDER", "LIMIT", "OFFSET", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS",
+    "UNION", "EXCEPT", "INTERSECT", "ASC", "DESC",
+}
+
+_WORD_TAIL = re.compile(r"\w+$")
+_ALIAS = re.compile(r"(?:\b(?:FROM|JOIN)\s+\w+\s+(?:AS\s+)?|\bAS\s+)(\w+)", re.IGNORECASE)
+
+
+class _WordSet:
+    # Множество допустимых слов с проверкой префикса через бинарный поиск
+    def __init__(self, words, keywords=()):
+        self.words = set(words)
+        self.keywords = set(keywords)
+        self._sorted = sorted(self.words)
+        self._sorted_keywords = sorted(self.keywords)
+
+    def complete(self, word):
+        return word in self.words or word.upper() in self.keywords
+
+    def prefix(self, word):
+        for items, w in ((self._sorted, word), (self._sorted_keywords, word.upper())):
+            i = bisect.bisect_left(items, w)
+            if i < len(items) and items[i].startswith(w):
+                return True
+        return False
+
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    def __init__(self, tokenizer, schema, cache_size=4096):
+        self.tokenizer = tokenizer
+        self.schema = schema
+        self.eos_token_id = tokenizer.eos_token_id
+        self.special_ids = set(tokenizer.all_special_ids)
+        vocab_size = len(tokenizer)
+        self.pieces = [
+            "" if i in self.special_ids else tokenizer.convert_ids_to_tokens(i).replace("▁", " ")
+            for i in range(vocab_size)
+        ]
+        columns = {c for cols in schema.values() for c in cols}
+        self.word_sets = {
+            "start": _WordSet((), START_KEYWORDS),
+            "table": _WordSet(schema),
+            "expr": _WordSet(columns | set(schema), EXPR_WORDS),
+        }
+        for table, cols in schema.items():
+            self.word_sets[("column", table)] = _WordSet(cols)
+        self._index_pieces()
+        self._masks = OrderedDict()
+        self._cache_size = cache_size
+
+    def _index_pieces(self):
+        # Токены из одного слова (и, возможно, пробелов перед ним) раскладываются
+        # по слову: группа "nospace" продолжает текущее слово, "space" начинает новое.
+        # Остальные токены (со знаками препинания) проверяются _token_ok
+        groups = {name: {"words": {}, "upper": {}, "digit": [], "all": []} for name in ("nospace", "space")}
+        self._space_only = []
+        self._other_ids = []
+        for token_id, piece in enumerate(self.pieces):
+            if not piece:
+                continue
+            word = piece.lstrip()
+            if not all(ch.isalnum() or ch == "_" for ch in word):
+                self._other_ids.append(token_id)
+                continue
+            if not word:
+                self._space_only.append(token_id)
+                continue
+            group = groups["space" if word != piece else "nospace"]
+            group["words"].setdefault(word, []).append(token_id)
+            group["upper"].setdefault(word.upper(), []).append(token_id)
+            if word[0].isdigit():
+                group["digit"].append(token_id)
+            group["all"].append(token_id)
+        self._groups = groups
+
+    def _group_ids(self, group, prefix, kind, aliases):
+        """
+        Токены группы, слово которых после prefix даёт допустимое
+        (незаконченное) слово вида kind — то же, что _word_ok(..., complete=False).
+        """
+        group = self._groups[group]
+        if kind is None:
+            return group["all"]
+        ids = []
+        if kind == "expr":
+            # Числа допустимы внутри выражений
+            if prefix[:1].isdigit():
+                return group["all"]
+            if not prefix:
+                ids.extend(group["digit"])
+        words = self.word_sets[kind]
+        candidates = [(w, group["words"], prefix) for w in aliases if w.startswith(prefix)]
+        if not prefix[:1].isdigit():
+            candidates += [(w, group["words"], prefix) for w in words.words if w.startswith(prefix)]
+            upper = prefix.upper()
+            candidates += [(w, group["upper"], upper) for w in words.keywords if w.startswith(upper)]
+        for word, table, start in candidates:
+            for end in range(len(start) + 1, len(word) + 1):
+                ids.extend(table.get(word[len(start):end], ()))
+        return ids
+
+    # --- разбор уже сгенерированного текста ---
+
+    def _context_kind(self, text):
+        """
+        Какой идентификатор ожидается в конце text: "start", "table",
+        ("column", таблица), "expr" или None (без ограничений).
+        """
+        text = text.rstrip()
+        if not text:
+            return "start"
+        last = text[-1]
+        if last == ".":
+            word = _WORD_TAIL.search(text[:-1])
+            if word and word.group() in self.schema:
+                return ("column", word.group())
+            return None
+        if last in ",(":
+            return "expr"
+        word = _WORD_TAIL.search(text)
+        if word is None:
+            return None
+        upper = word.group().upper()
+        if upper in TABLE_KEYWORDS:
+            return "table"
+        if upper in EXPR_KEYWORDS:
+            return "expr"
+        return None
+
+    def _kind_after(self, word, punctuation, kind_before):
+        # Вид следующего слова, если после word идут символы punctuation
+        stripped = punctuation.strip()
+        if stripped:
+            last = stripped[-1]
+            if last == "." and word in self.schema:
+                return ("column", word)
+            if last in ",(":
+                return "expr"
+            return None
+        if not word:
+            return kind_before
+        upper = word.upper()
+        if upper in TABLE_KEYWORDS:
+            return "table"
+        if upper in EXPR_KEYWORDS:
+            return "expr"
+        return None
+
+    def _state(self, ids):
+        text = "".join(self.pieces[i] for i in ids)
+        code = re.sub(r"'(?:[^']|'')*'", "''", text)
+        if code.count("'") % 2:
+            return ("string",)
+        depth = code.count("(") - code.count(")")
+        tail = _WORD_TAIL.search(code)
+        partial = tail.group() if tail else ""
+        before = code[:len(code) - len(partial)]
+        # Объявленные псевдонимы (AS x, FROM Таблица x) и имена из WITH допустимы наравне со схемой
+        aliases = frozenset(a for a in _ALIAS.findall(before) + CTE_NAME.findall(before)
+                            if a.upper() not in NON_ALIAS_WORDS)
+        return ("code", partial, self._context_kind(before), depth > 0, aliases)
+
+    # --- проверка токенов ---
+
+    def _word_ok(self, word, kind, aliases, complete):
+        if kind is None or not word:
+            return True
+        if word in aliases:
+            return True
+        if word[0].isdigit():
+            # Числа допустимы только внутри выражений
+            return kind == "expr"
+        words = self.word_sets[kind]
+        if complete:
+            return words.complete(word)
+        return words.prefix(word) or any(a.startswith(word) for a in aliases)
+
+    @staticmethod
+    def _punctuation_ok(ch, kind):
+        # Грамматика: запрос начинается со слова, после FROM/JOIN — таблица
+        # или подзапрос, после "Таблица." — столбец или *
+        if kind == "start":
+            return False
+        if kind == "table":
+            return ch == "("
+        if isinstance(kind, tuple):
+            return ch == "*"
+        return True
+
+    def _token_ok(self, piece, partial, kind, aliases):
+        word, current_kind, i = partial, kind, 0
+        while i < len(piece):
+            ch = piece[i]
+            if ch.isalnum() or ch == "_":
+                word += ch
+                i += 1
+                continue
+            # Слово закончилось: оно должно быть допустимым целиком
+            if not self._word_ok(word, current_kind, aliases, complete=True):
+                return False
+            # Проверяем знаки препинания по виду ожидаемого в этом месте идентификатора
+            expected = self._kind_after(word, "", current_kind if not word else None)
+            j = i
+            while j < len(piece) and not (piece[j].isalnum() or piece[j] == "_"):
+                c = piece[j]
+                if not c.isspace():
+                    if not self._punctuation_ok(c, expected):
+                        return False
+                    if c == "'":
+                        return True  # начался строковый литерал — дальше не проверяем
+                    expected = self._kind_after(word, c, None)
+                j += 1
+            current_kind = expected
+            word, i = "", j
+        return self._word_ok(word, current_kind, aliases, complete=False)
+
+    def _mask(self, state):
+        mask = self._masks.get(state)
+        if mask is not None:
+            self._masks.move_to_end(state)
+            return mask
+        mask = torch.zeros(len(self.pieces), dtype=torch.bool)
+        if state[0] == "string":
+            mask[:] = True
+            mask[self.eos_token_id] = False
+        else:
+            _, partial, kind, open_parens, aliases = state
+            allowed = self._group_ids("nospace", partial, kind, aliases)
+            # Пробел заканчивает текущее слово: оно должно быть допустимым целиком
+            if self._word_ok(partial, kind, aliases, complete=True):
+                after = self._kind_after(partial, "", kind if not partial else None)
+                allowed = allowed + self._space_only + self._group_ids("space", "", after, aliases)
+            allowed = allowed + [token_id for token_id in self._other_ids
+                                 if self._token_ok(self.pieces[token_id], partial, kind, aliases)]
+            if allowed:
+                mask[torch.tensor(allowed, dtype=torch.long)] = True
+            # Нельзя закончить на SELECT/FROM/WHERE/"Таблица." и т.п.: после них ожидается продолжение
+            can_finish = (not open_parens and self._kind_after(partial, "", kind) is None
+                          and self._word_ok(partial, kind, aliases, complete=True))
+            mask[self.eos_token_id] = can_finish
+        self._masks[state] = mask
+        if len(self._masks) > self._cache_size:
+            self._masks.popitem(last=False)
+        return mask
+
+    def __call__(self, input_ids, scores):
+        for row in range(input_ids.shape[0]):
+            ids = [i for i in input_ids[row].tolist() if i not in self.special_ids]
+            mask = self._mask(self._state(ids))
+            if mask.shape[0] < scores.shape[1]:
+                mask = torch.cat([mask, torch.zeros(scores.shape[1] - mask.shape[0], dtype=torch.bool)])
+            if mask.any():
+                scores[row, ~mask[:scores.shape[1]]] = -float("inf")
+        return scores
@@ -0,0 +1,376 @@
+"""
+Дообучение модели на новых вопросах из лога взаимодействий.
+
+Один запуск:
+1. Сбор пар: из logs/interaction_log*.csv берутся только ответы, которые
+   пользователь отметил как верные (POST /feedback, строка с тем же
+   trace_id) после прошлого запуска, и SQL которых выполнился. Ответы без
+   отметки не берутся: иначе модель дообучалась бы на собственных
+   непроверенных ответах и закрепляла свои ошибки. Каждый SQL заново
+   проверяется на текущей базе: проходит SqlGuard и возвращает хотя бы
+   одну строку. Вопросы, которые уже есть в обучающем датасете,
+   пропускаются; из повторов берётся последний.
+2. Обучение: новые пары вместе с повтором случайных старых (--replay,
+   чтобы модель не забыла выученное) дообучают текущую модель через
+   model/train_model.py — кандидат сохраняется в каталог запуска.
+3. Проверка: кандидат и текущая модель оцениваются на тестовой выборке
+   metrics.py (Exact Match и execution accuracy). Кандидат не должен
+   уступать больше чем на --max-regression.
+4. Выкладка: кандидат переносится в data/models/<версия>, а
+   data/model_t5_sql становится символической ссылкой на него; ссылка
+   подменяется атомарно (os.replace). Работающее приложение замечает
+   новую версию (SQLBOT_MODEL_WATCH_INTERVAL), грузит её в фоне и
+   подменяет модель без перезапуска; кэш вопросов сбрасывается.
+   Последние --keep версий остаются на диске для отката.
+
+Если новых пар меньше --min-pairs или кандидат не прошёл проверку,
+отметка времени не сдвигается: пары будут использованы в следующий раз.
+
+Пример:
+    python continuous_finetune.py --dry-run
+    python continuous_finetune.py --epochs 1 --nproc 4
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from db_pool import execute_with_timeout
+from log_interaction import FEEDBACK_CORRECT, LOG_FILE, log_files, parse_sql_valid
+from question_cache import model_fingerprint, normalize_question
+from sql_guard import SqlGuard
+
+try:
+    import fcntl
+except ImportError:  # Windows: защита от параллельных запусков недоступна
+    fcntl = None
+
+DB_PATH = "data/database.db"
+DATA_PATH = "data/training_data.csv"
+MODEL_DIR = "data/model_t5_sql"
+MODELS_ROOT = "data/models"
+WORK_DIR = "data/finetune"
+STATE_FILE = os.path.join(WORK_DIR, "state.json")
+# Пары, на которых уже дообучалась выложенная модель: они тоже идут в повтор
+ACCEPTED_FILE = os.path.join(WORK_DIR, "accepted_pairs.csv")
+# Отметки в notes, после которых пара не годится для обучения
+NEGATIVE_NOTES = ("неверно", "ошибка", "wrong", "bad")
+
+
+def harvest(files, since=""):
+    """
+    Пары (timestamp отметки, вопрос, SQL) с отметкой "верно" новее since.
+    Отметка относится к ответам с тем же trace_id, а если в ней указан
+    вопрос — только к нему (в пакетном API trace_id у вопросов общий).
+    Решает последняя отметка; ответ с ошибкой в notes или невыполнившимся
+    SQL не берётся даже с отметкой.
+    """
+    answers = []
+    verdicts = {}
+    for path in files:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                trace_id = row.get("trace_id") or ""
+                question = (row.get("user_input") or "").strip()
+                if not trace_id:
+                    continue
+                if row.get("source") == "feedback":
+                    verdicts[(trace_id, normalize_question(question))] = (row.get("timestamp") or "",
+                                                                         (row.get("notes") or "").strip())
+                    continue
+                sql = (row.get("predicted_sql") or row.get("generated_sql") or "").strip()
+                if not question or not sql or parse_sql_valid(row.get("sql_valid", "")) != 1:
+                    continue
+                if any(mark in (row.get("notes") or "").lower() for mark in NEGATIVE_NOTES):
+                    continue
+                answers.append((trace_id, question, sql))
+    pairs = []
+    for trace_id, question, sql in answers:
+        verdict = verdicts.get((trace_id, normalize_question(question))) or verdicts.get((trace_id, ""))
+        if verdict is not None and verdict[1] == FEEDBACK_CORRECT and verdict[0] > since:
+            pairs.append((verdict[0], question, sql))
+    return sorted(pairs)
+
+
+def validate(pairs, db_path=DB_PATH, timeout=2.0):
+    """
+    Оставляет пары, SQL которых проходит SqlGuard и возвращает строки
+    на текущей базе. Возвращает (пары, {причина: число}).
+    """
+    guard = SqlGuard(db_path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    valid, rejected = [], {}
+    checked = {}
+    try:
+        for ts, question, sql in pairs:
+            if sql not in checked:
+                verdict = guard.check(conn, sql)
+                reason = verdict["reason"]
+                if verdict["allowed"]:
+                    try:
+                        _, rows = execute_with_timeout(conn, sql, timeout, max_rows=1)
+                        reason = None if rows else "пустой результат"
+                    except sqlite3.Error as e:
+                        reason = str(e)
+                checked[sql] = reason
+            reason = checked[sql]
+            if reason is None:
+                valid.append((ts, question, sql))
+            else:
+                reason = reason.split(":")[0]
+                rejected[reason] = rejected.get(reason, 0) + 1
+    finally:
+        conn.close()
+    return valid, rejected
+
+
+def read_pairs(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["text"], row["sql"]) for row in csv.DictReader(f) if row.get("text") and row.get("sql")]
+
+
+def write_pairs(path, pairs, append=False):
+    new_file = not append or not os.path.exists(path)
+    with open(path, "a" if append else "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["text", "sql"])
+        writer.writerows(pairs)
+
+
+def select_delta(pairs, known_questions):
+    """
+    Новые пары: по одной на нормализованный вопрос (последний SQL), без
+    вопросов, которые уже есть в обучающих данных.
+    """
+    latest = {}
+    for _, question, sql in pairs:
+        key = normalize_question(question)
+        if key not in known_questions:
+            latest[key] = (question, sql)
+    return list(latest.values())
+
+
+def build_training_set(delta, replay_pool, replay, seed=42):
+    """
+    Новые пары и replay x len(delta) случайных старых, перемешанные:
+    train_model.py берёт последние 10% в валидацию.
+    """
+    rng = random.Random(seed)
+    sample = rng.sample(replay_pool, min(len(replay_pool), int(len(delta) * replay)))
+    pairs = list(delta) + sample
+    rng.shuffle(pairs)
+    return pairs
+
+
+def fine_tune(base_model, data_path, run_dir, epochs=1.0, learning_rate=1e-4, nproc=1):
+    """
+    Дообучает base_model через model/train_model.py; возвращает каталог кандидата.
+    """
+    candidate = os.path.join(run_dir, "candidate")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "train_model.py")
+    launcher = [sys.executable]
+    if nproc > 1:
+        launcher += ["-m", "torch.distributed.run", "--nproc_per_node", str(nproc)]
+    subprocess.run(launcher + [
+        script,
+        "--model-name", base_model,
+        "--data", data_path,
+        "--model-dir", candidate,
+        "--output-dir", os.path.join(run_dir, "checkpoints"),
+        "--epochs", str(epochs),
+        "--learning-rate", str(learning_rate),
+    ], check=True)
+    return candidate
+
+
+def evaluate(model_dir, texts, gold, db_path=DB_PATH, batch_size=32):
+    """
+    Exact Match и execution accuracy модели на (texts, gold).
+    """
+    from execution_accuracy import ExecutionEvaluator
+    from inference import generate_sql_batch, load_model
+    from metrics import MAX_LENGTH, make_batches
+
+    tokenizer, model = load_model(model_dir)
+    preds = [None] * len(texts)
+    for batch in make_batches(list(enumerate(texts)), batch_size):
+        outputs = generate_sql_batch(tokenizer, model, [text for _, text in batch], max_length=MAX_LENGTH)
+        for (idx, _), pred in zip(batch, outputs):
+            preds[idx] = pred
+    exact = sum(p.strip().lower() == g.strip().lower() for p, g in zip(preds, gold)) / len(gold)
+    evaluator = ExecutionEvaluator(db_path)
+    try:
+        matches = [match for _, _, match, _ in evaluator.evaluate(gold, preds)]
+    finally:
+        evaluator.close()
+    return {"exact_match": exact, "execution_accuracy": sum(matches) / len(matches)}
+
+
+def passes_gate(candidate, baseline, max_regression):
+    return all(candidate[name] >= baseline[name] - max_regression for name in ("exact_match", "execution_accuracy"))
+
+
+def promote(candidate, model_dir=MODEL_DIR, models_root=MODELS_ROOT, keep=3):
+    """
+    Выкладывает кандидата: переносит в models_root/<версия> и атомарно
+    переключает на него символическую ссылку model_dir. Возвращает путь версии.
+    """
+    os.makedirs(models_root, exist_ok=True)
+    # Суффикс -2, -3, ... если версия с той же секундой уже есть: shutil.move
+    # в существующий каталог положил бы кандидата внутрь него
+    stamp = "t5_sql-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+    version_dir = os.path.join(models_root, stamp)
+    n = 1
+    while os.path.lexists(version_dir):
+        n += 1
+        version_dir = os.path.join(models_root, f"{stamp}-{n}")
+    shutil.move(candidate, version_dir)
+    # Ссылка готовится заранее: между переносом исходного каталога при первой
+    # выкладке и подменой остаются только два переименования подряд
+    link_dir = os.path.dirname(os.path.abspath(model_dir))
+    tmp_link = f"{model_dir}.tmp{os.getpid()}"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.relpath(os.path.abspath(version_dir), link_dir), tmp_link)
+    try:
+        if os.path.isdir(model_dir) and not os.path.islink(model_dir):
+            # Первая выкладка: исходный каталог модели становится первой версией
+            os.replace(model_dir, os.path.join(models_root, "t5_sql-initial"))
+        os.replace(tmp_link, model_dir)
+    except OSError:
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        raise
+
+    # Версии — каталоги с моделью; экспорт ONNX (<версия>_onnx) удаляется вместе с версией
+    versions = sorted(os.path.join(models_root, name) for name in os.listdir(models_root)
+                      if name.startswith("t5_sql-") and name != "t5_sql-initial"
+                      and not name.endswith("_onnx")
+                      and os.path.isfile(os.path.join(models_root, name, "config.json")))
+    current = os.path.realpath(model_dir)
+    for old in versions[:-keep]:
+        if os.path.realpath(old) != current:
+            shutil.rmtree(old)
+            shutil.rmtree(old + "_onnx", ignore_errors=True)
+    return version_dir
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {"since": "", "evaluations": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def run(args):
+    state = load_state()
+    pairs = harvest(log_files(args.log), state["since"])
+    valid, rejected = validate(pairs, args.db)
+    known = {normalize_question(text) for text, _ in read_pairs(args.data) + read_pairs(ACCEPTED_FILE)}
+    delta = select_delta(valid, known)
+    print(f"Строк в логе после {state['since'] or 'начала'}: {len(pairs)}, "
+          f"прошли проверку: {len(valid)}, новых вопросов: {len(delta)}")
+    for reason, count in sorted(rejected.items(), key=lambda item: -item[1]):
+        print(f"  отклонено {count:>5}: {reason}")
+    if args.dry_run:
+        return
+    if len(delta) < args.min_pairs:
+        print(f"Новых пар меньше {args.min_pairs}, дообучение не нужно")
+        return
+
+    # Тестовая выборка metrics.py не попадает в повтор, иначе оценка кандидата завышена
+    from metrics import load_test_split
+
+    test = load_test_split(args.data)
+    if args.eval_limit:
+        test = test.iloc[:args.eval_limit]
+    test_questions = {normalize_question(text) for text in test["text"]}
+    replay_pool = [(text, sql) for text, sql in read_pairs(args.data) + read_pairs(ACCEPTED_FILE)
+                   if normalize_question(text) not in test_questions]
+
+    run_dir = os.path.join(WORK_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(run_dir, exist_ok=True)
+    train_path = os.path.join(run_dir, "train.csv")
+    write_pairs(train_path, build_training_set(delta, replay_pool, args.replay))
+
+    base_model = os.path.realpath(MODEL_DIR)
+    start = time.perf_counter()
+    candidate = fine_tune(base_model, train_path, run_dir, args.epochs, args.learning_rate, args.nproc)
+    print(f"Кандидат обучен за {time.perf_counter() - start:.0f} с: {candidate}")
+
+    texts, gold = test["text"].tolist(), test["sql"].tolist()
+    # Оценка текущей модели не меняется, пока не меняется её версия
+    baseline_key = f"{model_fingerprint(base_model)}:{len(texts)}"
+    baseline = state["evaluations"].get(baseline_key) or evaluate(base_model, texts, gold, args.db)
+    state["evaluations"] = {baseline_key: baseline}
+    result = evaluate(candidate, texts, gold, args.db)
+    for name in ("exact_match", "execution_accuracy"):
+        print(f"{name}: текущая {baseline[name]:.2%}, кандидат {result[name]:.2%}")
+    with open(os.path.join(run_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump({"delta": len(delta), "baseline": baseline, "candidate": result}, f, indent=2)
+
+    if not passes_gate(result, baseline, args.max_regression):
+        print("Кандидат хуже текущей модели, выкладка отменена")
+        save_state(state)
+        return
+    if args.no_promote:
+        print(f"Кандидат прошёл проверку и оставлен в {candidate} (--no-promote)")
+        save_state(state)
+        return
+    version_dir = promote(candidate, keep=args.keep)
+    write_pairs(ACCEPTED_FILE, delta, append=True)
+    state["since"] = pairs[-1][0]
+    state["evaluations"] = {f"{model_fingerprint(version_dir)}:{len(texts)}": result}
+    save_state(state)
+    shutil.rmtree(os.path.join(run_dir, "checkpoints"), ignore_errors=True)
+    print(f"Выложена версия {version_dir}; приложение подменит модель в течение SQLBOT_MODEL_WATCH_INTERVAL")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=LOG_FILE)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--data", default=DATA_PATH, help="Исходный обучающий датасет")
+    parser.add_argument("--min-pairs", type=int, default=50, help="Минимум новых пар для дообучения")
+    parser.add_argument("--replay", type=float, default=4.0, help="Старых пар на одну новую")
+    parser.add_argument("--epochs", type=float, default=1.0)
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    parser.add_argument("--nproc", type=int, default=1, help="Процессов обучения (torchrun)")
+    parser.add_argument("--eval-limit", type=int, default=None, help="Вопросов тестовой выборки для проверки")
+    parser.add_argument("--max-regression", type=float, default=0.005,
+                        help="Насколько кандидат может уступить текущей модели по каждой метрике")
+    parser.add_argument("--keep", type=int, default=3, help="Сколько версий модели хранить")
+    parser.add_argument("--no-promote", action="store_true", help="Обучить и проверить, но не выкладывать")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, сколько пар собрано")
+    args = parser.parse_args()
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    with open(os.path.join(WORK_DIR, ".lock"), "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print("Дообучение уже запущено")
+                return
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
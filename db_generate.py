@@ -0,0 +1,258 @@
+"""
+Генератор большой базы для нагрузочных замеров.
+
+Заполняет Сотрудники и Научные_работы миллионами правдоподобных строк:
+- подразделения и журналы распределены по закону Ципфа (несколько крупных
+  институтов и много мелких), годы публикаций смещены к последним годам;
+- должность определяет категорию персонала, звание, степень и возраст;
+- автор каждой работы — ФИО существующего сотрудника, а число работ на
+  автора имеет тяжёлый хвост (у большинства 0–2 работы, у немногих десятки).
+  ФИО вычисляется по номеру сотрудника, поэтому связь ФИО ↔ автор
+  согласована без хранения всех имён в памяти; совпадения имён, как в
+  жизни, различаются числовым суффиксом.
+
+Схема (и индексы, если они есть) копируется из data/database.db, которую
+создаёт db_init.py. Загрузка идёт пачками executemany в одной транзакции
+с journal_mode=OFF и synchronous=OFF; индексы строятся после загрузки.
+
+Пример:
+    python db_generate.py --employees 1000000 --publications 3000000 --db data/database_large.db
+    SQLBOT_DB_PATH=data/database_large.db python app.py
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from person_names import fio
+
+TEMPLATE_DB = "data/database.db"
+OUTPUT_DB = "data/database_large.db"
+
+# Подразделение -> кафедры (оргструктура); порядок задаёт размер (закон Ципфа)
+DEPARTMENTS = {
+    "Институт математики и информатики": ["Кафедра дискретной математики", "Кафедра компьютерных наук",
+                                          "Кафедра теоретической информатики", "Кафедра прикладной математики"],
+    "Физико-технический институт": ["Кафедра нанофизики", "Кафедра общей физики", "Кафедра радиофизики"],
+    "Институт экономики и управления": ["Кафедра финансов", "Кафедра управления", "Кафедра маркетинга",
+                                        "Кафедра бухгалтерского учета"],
+    "Институт химии": ["Кафедра органической химии", "Кафедра аналитической химии", "Кафедра физической химии"],
+    "Институт строительства": ["Кафедра архитектурного проектирования", "Кафедра строительных материалов"],
+    "Институт биологии": ["Кафедра генетики", "Кафедра ботаники", "Кафедра зоологии"],
+    "Институт филологии": ["Кафедра русского языка", "Кафедра иностранных языков"],
+    "Институт истории": ["Кафедра отечественной истории", "Кафедра всеобщей истории"],
+    "Юридический институт": ["Кафедра гражданского права", "Кафедра уголовного права"],
+    "Институт наук о Земле": ["Кафедра геологии", "Кафедра географии"],
+    "Медицинский институт": ["Кафедра терапии", "Кафедра хирургии", "Кафедра фармакологии"],
+    "Институт психологии": ["Кафедра общей психологии"],
+}
+# Должность: (доля, категория, звание, степень и её вероятность, средний возраст)
+POSITIONS = {
+    "Профессор": (0.08, "Преподавательский состав", "Профессор", "Доктор наук", 0.9, 60),
+    "Доцент": (0.22, "Преподавательский состав", "Доцент", "Кандидат наук", 0.85, 47),
+    "Старший преподаватель": (0.2, "Преподавательский состав", "", "Кандидат наук", 0.35, 40),
+    "Ассистент": (0.15, "Учебно-вспомогательный персонал", "", "", 0.0, 30),
+    "Лаборант": (0.12, "Учебно-вспомогательный персонал", "", "", 0.0, 27),
+    "Научный сотрудник": (0.15, "Научные работники", "", "Кандидат наук", 0.6, 38),
+    "Заведующий кафедрой": (0.08, "Преподавательский состав", "Профессор", "Доктор наук", 0.8, 58),
+}
+EMPLOYMENT = (["Основное место работы", "Совместительство"], [0.8, 0.2])
+RATES = ([1.0, 0.75, 0.5, 0.25], [0.7, 0.12, 0.13, 0.05])
+
+JOURNALS = [
+    "Журнал нанотехнологий", "Вестник информатики", "Химический журнал", "Экономика и управление",
+    "Вестник математики", "Строительство XXI века", "Химия и жизнь", "Физика и техника", "Экономика сегодня",
+    "Дискретная математика", "Архитектура и проектирование", "Бухгалтерский учет сегодня", "Экономика образования",
+    "Архитектура и строительство", "Химические исследования", "Биологический вестник", "Вопросы истории",
+    "Филологические науки", "Правовые исследования", "Науки о Земле", "Медицинский журнал", "Вопросы психологии",
+]
+CITATION_BASES = (["РИНЦ", "Scopus", "Web of Science"], [0.55, 0.3, 0.15])
+TITLE_WORDS = [
+    "Исследование", "Анализ", "Моделирование", "Методы", "Разработка", "Оптимизация", "Синтез", "Свойства",
+    "Применение", "Оценка", "Проектирование", "Теория", "Алгоритмы", "Структура", "Динамика", "Эффективность",
+]
+TITLE_TOPICS = [
+    "наноматериалов", "органических соединений", "графовых алгоритмов", "финансовой устойчивости",
+    "строительных материалов", "дискретных структур", "нейронных сетей", "экономических систем",
+    "квантовых систем", "биологических процессов", "правовых норм", "исторических источников",
+    "языковых моделей", "геологических процессов", "лекарственных препаратов", "когнитивных процессов",
+]
+TITLE_CONTEXTS = ["", "в условиях севера", "на практике", "в образовании", "для промышленности",
+                  "в цифровой экономике", "нового поколения", "при низких температурах"]
+YEARS = (1990, 2024)
+
+def zipf_weights(n, s=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def _pick(rng, values, p, size):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=np.asarray(p) / np.sum(p))]
+
+
+def employee_rows(rng, start, size):
+    departments = list(DEPARTMENTS)
+    dept_idx = rng.choice(len(departments), size=size, p=zipf_weights(len(departments)))
+    positions = list(POSITIONS)
+    pos_idx = rng.choice(len(positions), size=size, p=[POSITIONS[p][0] for p in positions])
+    rates = _pick(rng, *RATES, size)
+    employment = _pick(rng, *EMPLOYMENT, size)
+    degree_roll = rng.random(size)
+    age_noise = rng.normal(0, 7, size)
+    unit_roll = rng.random(size)
+    # Списки Python вместо массивов NumPy: поэлементный доступ к ним в разы быстрее
+    columns = zip(range(start, start + size), dept_idx.tolist(), pos_idx.tolist(), rates.tolist(),
+                  employment.tolist(), degree_roll.tolist(), age_noise.tolist(), unit_roll.tolist())
+    rows = []
+    for i, dept, pos, rate, employment_kind, degree_roll_k, noise, unit in columns:
+        department = departments[dept]
+        position = positions[pos]
+        _, category, title, degree, degree_p, mean_age = POSITIONS[position]
+        units = DEPARTMENTS[department]
+        rows.append((
+            fio(i), department, position, rate, employment_kind, category, title,
+            degree if degree_roll_k < degree_p else "", int(min(75, max(21, mean_age + noise))),
+            units[int(unit * len(units))],
+        ))
+    return rows
+
+
+def author_weights(rng, employees):
+    # Продуктивность авторов: логнормальное распределение, у немногих — десятки и сотни работ
+    weights = rng.lognormal(0.0, 1.2, employees)
+    return weights / weights.sum()
+
+
+def publication_rows(rng, weights, size):
+    employees = len(weights)
+    authors = rng.choice(employees, size=size, p=weights)
+    coauthor_counts = rng.poisson(1.2, size)
+    coauthor_pool = rng.integers(0, employees, int(coauthor_counts.sum()))
+    coauthor_end = np.cumsum(coauthor_counts)
+    years = np.arange(YEARS[0], YEARS[1] + 1)
+    year_p = 1.12 ** (years - YEARS[0])
+    year_values = rng.choice(years, size=size, p=year_p / year_p.sum())
+    journals = _pick(rng, JOURNALS, zipf_weights(len(JOURNALS), 0.9), size)
+    bases = _pick(rng, *CITATION_BASES, size)
+    words = rng.integers(0, [len(TITLE_WORDS), len(TITLE_TOPICS), len(TITLE_CONTEXTS)], size=(size, 3))
+    subtitle_roll = rng.random(size)
+    doi_roll = rng.random(size)
+    ids = rng.integers(0, 16 ** 8, size)
+    coauthor_pool = coauthor_pool.tolist()
+    columns = zip(authors.tolist(), (coauthor_end - coauthor_counts).tolist(), coauthor_end.tolist(),
+                  words.tolist(), subtitle_roll.tolist(), doi_roll.tolist(), ids.tolist(), year_values.tolist(),
+                  journals.tolist(), bases.tolist())
+    rows = []
+    for author_i, co_start, co_end, (w, t, c), subtitle_k, doi_k, pub_id, year, journal, base in columns:
+        author = fio(author_i)
+        coauthors = [fio(j) for j in coauthor_pool[co_start:co_end]]
+        title = f"{TITLE_WORDS[w]} {TITLE_TOPICS[t]} {TITLE_CONTEXTS[c]}".strip()
+        subtitle = f"{TITLE_WORDS[(w + 3) % len(TITLE_WORDS)]} {TITLE_TOPICS[(t + 5) % len(TITLE_TOPICS)]}" \
+            if subtitle_k < 0.3 else ""
+        doi = f"10.{1000 + pub_id % 9000}/{pub_id:08x}" if doi_k < 0.7 else ""
+        rows.append((
+            author, title, subtitle, year, ", ".join([author] + coauthors), doi,
+            journal, base, f"https://example.com/pub/{pub_id:08x}",
+        ))
+    return rows
+
+
+def copy_schema(template_db):
+    """
+    (CREATE TABLE ..., CREATE INDEX ...) из шаблонной базы.
+    """
+    conn = sqlite3.connect(template_db)
+    try:
+        tables = [r[0] for r in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        indexes = [r[0] for r in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+        return tables, indexes
+    finally:
+        conn.close()
+
+
+def load(conn, table, columns, batches):
+    """
+    Вставляет пачки строк; возвращает (строк, секунд).
+    """
+    placeholders = ", ".join("?" * columns)
+    start = time.perf_counter()
+    total = 0
+    for rows in batches:
+        conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+        total += len(rows)
+        elapsed = time.perf_counter() - start
+        print(f"\r{table}: {total} строк, {total / elapsed:,.0f} строк/с", end="", flush=True)
+    print()
+    return total, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=OUTPUT_DB)
+    parser.add_argument("--template", default=TEMPLATE_DB, help="База, из которой берётся схема и индексы")
+    parser.add_argument("--employees", type=int, default=1_000_000)
+    parser.add_argument("--publications", type=int, default=3_000_000)
+    parser.add_argument("--chunk", type=int, default=50_000, help="Строк в одном executemany")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-indexes", action="store_true", help="Не создавать индексы шаблонной базы")
+    parser.add_argument("--force", action="store_true", help="Перезаписать существующий файл --db")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath(args.template):
+        parser.error("--db не должен совпадать с шаблонной базой")
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} уже существует, используйте --force")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    tables, indexes = copy_schema(args.template)
+    rng = np.random.default_rng(args.seed)
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")
+
+    started = time.perf_counter()
+    conn.execute("BEGIN")
+    for sql in tables:
+        conn.execute(sql)
+    chunks = range(0, args.employees, args.chunk)
+    employees, employees_sec = load(conn, "Сотрудники", 10, (
+        employee_rows(rng, start, min(args.chunk, args.employees - start)) for start in chunks))
+    weights = author_weights(rng, args.employees)
+    chunks = range(0, args.publications, args.chunk)
+    publications, publications_sec = load(conn, "Научные_работы", 9, (
+        publication_rows(rng, weights, min(args.chunk, args.publications - start)) for start in chunks))
+    conn.execute("COMMIT")
+
+    index_start = time.perf_counter()
+    if not args.no_indexes and indexes:
+        for sql in indexes:
+            conn.execute(sql)
+        conn.execute("ANALYZE")
+    index_sec = time.perf_counter() - index_start
+
+    # Обычный режим журнала для приложения (ConnectionPool переведёт базу в WAL)
+    conn.execute("PRAGMA locking_mode=NORMAL")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+    total = time.perf_counter() - started
+    print(f"Сотрудники: {employees} строк за {employees_sec:.1f} с ({employees / max(employees_sec, 1e-9):,.0f} строк/с)")
+    print(f"Научные_работы: {publications} строк за {publications_sec:.1f} с "
+          f"({publications / max(publications_sec, 1e-9):,.0f} строк/с)")
+    if not args.no_indexes and indexes:
+        print(f"Индексы ({len(indexes)}) и ANALYZE: {index_sec:.1f} с")
+    print(f"Всего {total:.1f} с, {(employees + publications) / total:,.0f} строк/с, "
+          f"файл {os.path.getsize(args.db) / 1024 / 1024:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def enable_wal(db_path):
+    """
+    Переводит базу в режим WAL (настройка хранится в самом файле БД).
+    В WAL читатели не блокируют писателя и друг друга.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@contextmanager
+def time_limit(conn, timeout):
+    """
+    Внутри блока with обработчик прогресса SQLite прерывает запросы
+    соединения после timeout секунд (sqlite3.OperationalError: interrupted).
+    """
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def execute_with_timeout(conn, sql, timeout, max_rows=None):
+    """
+    Выполняет запрос с ограничением по времени.
+    Возвращает (columns, rows); при max_rows читает не больше max_rows + 1 строк.
+    """
+    with time_limit(conn, timeout):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            columns = [description[0] for description in cursor.description or []]
+            rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows + 1)
+            return columns, rows
+        finally:
+            cursor.close()
+
+
+class ConnectionPool:
+    """
+    Пул соединений SQLite только для чтения.
+
+    Соединения открываются лениво (не больше size), через URI mode=ro,
+    с увеличенным кэшем страниц, mmap и кэшем подготовленных выражений,
+    и переиспользуются между потоками WSGI-сервера. После fork пул
+    в дочернем процессе начинается заново.
+    """
+
+    def __init__(self, db_path, size=4, timeout=10.0, cache_size_kb=16 * 1024,
+                 mmap_size=256 * 1024 * 1024, cached_statements=256, wal=False):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._uri = Path(db_path).absolute().as_uri() + "?mode=ro"
+        self._fork_lock = threading.Lock()
+        self._reset()
+        if wal:
+            try:
+                enable_wal(db_path)
+            except sqlite3.Error:
+                # Например, файл БД доступен только на чтение — работаем в текущем режиме
+                pass
+
+    def _reset(self):
+        # _pid публикуется последним: поток, увидевший свой pid, уже
+        # получает новую очередь соединений, а не соединения родителя
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._acquired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._pid = os.getpid()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self._uri,
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _acquire(self):
+        if self._pid != os.getpid():
+            # Соединения SQLite нельзя использовать после fork: дочерний процесс
+            # (воркер gunicorn с preload_app) открывает свои, унаследованные не трогаем
+            with self._fork_lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Нет свободного соединения с {self.db_path} за {self.timeout} с")
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдаёт соединение из пула на время блока with.
+        """
+        start = time.perf_counter()
+        conn = self._acquire()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": self._idle.qsize(),
+                "acquired": self._acquired,
+                "wait_avg_ms": self._wait_total / self._acquired * 1000 if self._acquired else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,135 @@
+"""
+Execution accuracy: эталонный и предсказанный SQL выполняются на
+data/database.db (только чтение, с таймаутом), а их результаты
+сравниваются как мультимножества строк без учёта порядка.
+
+Каждый уникальный запрос (по каноническому SQL) выполняется один раз,
+запросы выполняются параллельно через пул соединений.
+
+Пример:
+    python execution_accuracy.py --input data/evaluation_results.csv --workers 8
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from db_pool import ConnectionPool, execute_with_timeout
+from result_cache import canonical_sql
+
+DB_PATH = "data/database.db"
+OUTPUT_FILE = "data/execution_results.csv"
+
+
+def _normalize_value(value):
+    # 1 и 1.0 из разных запросов должны совпадать; числа с плавающей точкой округляем
+    if isinstance(value, float):
+        value = round(value, 6)
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def result_multiset(rows):
+    return Counter(tuple(_normalize_value(v) for v in row) for row in rows)
+
+
+class ExecutionEvaluator:
+    """
+    Выполняет SQL и кэширует результаты по каноническому тексту запроса:
+    повторяющиеся эталоны (и одинаковые предсказания) выполняются однажды.
+    """
+
+    def __init__(self, db_path=DB_PATH, workers=4, timeout=5.0, max_rows=100_000):
+        self.pool = ConnectionPool(db_path, size=workers, wal=False)
+        self.workers = workers
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self._results = {}
+
+    def _run(self, sql):
+        try:
+            with self.pool.connection() as conn:
+                _, rows = execute_with_timeout(conn, sql, self.timeout, self.max_rows)
+        except Exception as e:
+            return None, str(e)
+        if len(rows) > self.max_rows:
+            return None, f"больше {self.max_rows} строк"
+        return result_multiset(rows), None
+
+    def execute_all(self, queries):
+        """
+        Выполняет все ещё не выполненные запросы параллельно. Канонический
+        текст служит только ключом: выполняется исходный SQL (первый с этим
+        ключом).
+        """
+        pending = {}
+        for sql in queries:
+            key = canonical_sql(sql)
+            if key not in self._results:
+                pending.setdefault(key, sql)
+        with ThreadPoolExecutor(self.workers) as executor:
+            for key, outcome in zip(pending, executor.map(self._run, pending.values())):
+                self._results[key] = outcome
+
+    def outcome(self, sql):
+        return self._results[canonical_sql(sql)]
+
+    def compare(self, gold_sql, pred_sql):
+        """
+        Возвращает (gold_ok, pred_ok, match, error).
+        """
+        gold, gold_error = self.outcome(gold_sql)
+        pred, pred_error = self.outcome(pred_sql)
+        if gold_error:
+            return False, pred_error is None, False, f"эталон: {gold_error}"
+        if pred_error:
+            return True, False, False, pred_error
+        return True, True, gold == pred, ""
+
+    def evaluate(self, gold_queries, pred_queries):
+        self.execute_all(list(gold_queries) + list(pred_queries))
+        return [self.compare(g, p) for g, p in zip(gold_queries, pred_queries)]
+
+    def close(self):
+        self.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="data/evaluation_results.csv",
+                        help="CSV с колонками Input, Expected SQL, Predicted SQL")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=5.0, help="Таймаут одного запроса, с")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input).fillna("")
+    evaluator = ExecutionEvaluator(args.db, workers=args.workers, timeout=args.timeout)
+    start = time.perf_counter()
+    outcomes = evaluator.evaluate(df["Expected SQL"].tolist(), df["Predicted SQL"].tolist())
+    elapsed = time.perf_counter() - start
+    evaluator.close()
+
+    for i, column in enumerate(["Gold OK", "Predicted OK", "Execution Match", "Error"]):
+        df[column] = [outcome[i] for outcome in outcomes]
+    df.to_csv(args.output, index=False)
+
+    total = len(df)
+    if not total:
+        print("Нет примеров для оценки")
+        return
+    gold_ok = int(df["Gold OK"].sum())
+    matches = int(df["Execution Match"].sum())
+    print(f"Execution Accuracy: {matches / total:.2%}")
+    if gold_ok:
+        print(f"Execution Accuracy (только исполнимые эталоны): {matches / gold_ok:.2%} ({gold_ok} из {total})")
+    print(f"Предсказанный SQL выполнился: {df['Predicted OK'].mean():.2%}")
+    print(f"Время: {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} пар/с), результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
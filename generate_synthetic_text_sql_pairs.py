@@ -1,5 +1,59 @@
-import random
+"""
+Генерация синтетического датасета (русский текст ↔ SQL).
+
+Пространство шаблонов вычисляется один раз: каждый шаблон с конечным слотом
+раскрывается во все свои пары (текст, SQL), а шаблоны NAME_TEMPLATES
+подставляют ФИО сотрудника по номеру (person_names.fio), поэтому дают
+миллионы разных вопросов, согласованных с базой из db_generate.py.
+Шаблон выбирается с весом: по умолчанию вес группы (select, join, names)
+делится поровну между её шаблонами; --weights задаёт веса групп или
+отдельных шаблонов (ключ — текст шаблона). Доля группы в файле — квота:
+группа, набравшая свою долю от --count, больше не выбирается. Если у
+группы кончились уникальные пары, её недобор делится между группами, где
+пары ещё есть (обычно names), так что --count набирается, а доли
+смещаются. Итоговые доли групп печатаются после генерации. ФИО в тексте вопроса склоняется там, где
+этого требует шаблон ("публикации автора Ивановой Анны Сергеевны"),
+в SQL остаётся именительный падеж, как в базе.
+
+Генерация идёт потоком в нескольких процессах (--shards). У шарда своё
+зерно (seed и номер шарда), поэтому результат воспроизводим. Повторы
+отбрасываются: ключ пары — 8-байтовый blake2b, хранится во множестве или
+в фильтре Блума (--dedup bloom: меньше памяти, изредка теряет новую пару).
+Пары распределены между шардами (ФИО — по остатку номера, прочие — по
+ключу), так что повторов нет и между шардами. Каждый шард пишет свою часть
+пачками по --chunk строк; части склеиваются в один файл. Формат — по
+расширению: .csv, .csv.gz или .parquet (нужен pyarrow).
+
+Когда уникальные пары кончаются во всех группах (без шаблонов с ФИО их
+чуть больше сотни), шард останавливается раньше: шаблоны без ФИО выбывают,
+исчерпав свои пары, а выбор ФИО прекращается после --patience повторов
+подряд. Тогда скрипт завершается с кодом 1. Чтобы сохранить заданные доли
+при малом числе уникальных пар в группах select и join, уменьшите их веса
+или отключите дедупликацию (--dedup none).
+
+По умолчанию пишет data/synthetic.csv; synthetic_rus_text_sql.csv
+в репозитории — корпус для retrieval.py, генератор его не перезаписывает.
+
+Пример:
+    python generate_synthetic_text_sql_pairs.py
+    python generate_synthetic_text_sql_pairs.py --count 5000000 --shards 8 --output data/synthetic.csv.gz
+    python generate_synthetic_text_sql_pairs.py --weights join=0.5,names=0.1 --output data/synthetic.parquet
+"""
+import argparse
 import csv
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from person_names import NAME_SPACE, fio, fio_genitive
 
 # --- Возможные значения для генерации ---
 sotr_fields = [
@@ -34,188 +88,503 @@ zhurnaly = [
 bazy = ["Scopus", "РИНЦ", "Web of Science"]
 years = list(range(2005, 2025))
 
-# --- Примитивные шаблоны текстов и SQL ---
-def get_russian_select_text_sql():
+# --- Пространство шаблонов ---
+# Шаблон: (слот или None, текст, SQL). Значение слота подставляется в текст и SQL
+# через str.format; пустые значения слота (например, звание "") пар не дают.
+SLOT_VALUES = {
+    "sotr_field": sotr_fields,
+    "nauka_field": nauka_fields,
+    "pod": podrazdeleniya,
+    "dol": doljnosti,
+    "zv": zvaniya,
+    "st": stepeni,
+    "age": list(range(25, 66)),
+    "zh": zhurnaly,
+    "baz": bazy,
+    "year": years,
+}
+# Числовые слоты: в вопросе может встретиться любое число, а не только из SLOT_VALUES
+NUMERIC_SLOTS = {"age", "year"}
+
+SELECT_TEMPLATES = [
     # 1. Простейшие селекты
-    queries = []
     # Все из таблицы
-    queries.append((
-        "Показать всех сотрудников.",
-        "SELECT * FROM Сотрудники;"
-    ))
-    queries.append((
-        "Показать все научные работы.",
-        "SELECT * FROM Научные_работы;"
-    ))
+    (None, "Показать всех сотрудников.", "SELECT * FROM Сотрудники;"),
+    (None, "Показать все научные работы.", "SELECT * FROM Научные_работы;"),
     # По полю
-    field = random.choice(sotr_fields)
-    queries.append((
-        f"Вывести {field} всех сотрудников.",
-        f"SELECT {field} FROM Сотрудники;"
-    ))
-    field = random.choice(nauka_fields)
-    queries.append((
-        f"Показать значение поля \"{field}\" для всех научных работ.",
-        f"SELECT {field} FROM Научные_работы;"
-    ))
+    ("sotr_field", "Вывести {sotr_field} всех сотрудников.", "SELECT {sotr_field} FROM Сотрудники;"),
+    ("nauka_field", "Показать значение поля \"{nauka_field}\" для всех научных работ.",
+     "SELECT {nauka_field} FROM Научные_работы;"),
     # С фильтром по подразделению
-    pod = random.choice(podrazdeleniya)
-    queries.append((
-        f"Список сотрудников из {pod}.",
-        f"SELECT * FROM Сотрудники WHERE подразделение = '{pod}';"
-    ))
+    ("pod", "Список сотрудников из {pod}.", "SELECT * FROM Сотрудники WHERE подразделение = '{pod}';"),
     # По должности
-    dol = random.choice(doljnosti)
-    queries.append((
-        f"Показать всех сотрудников с должностью {dol}.",
-        f"SELECT * FROM Сотрудники WHERE должность = '{dol}';"
-    ))
+    ("dol", "Показать всех сотрудников с должностью {dol}.", "SELECT * FROM Сотрудники WHERE должность = '{dol}';"),
     # По ученому званию
-    zv = random.choice(zvaniya)
-    if zv:
-        queries.append((
-            f"Показать сотрудников со званием {zv}.",
-            f"SELECT * FROM Сотрудники WHERE ученое_звание = '{zv}';"
-        ))
-
+    ("zv", "Показать сотрудников со званием {zv}.", "SELECT * FROM Сотрудники WHERE ученое_звание = '{zv}';"),
     # По степени
-    st = random.choice(stepeni)
-    if st:
-        queries.append((
-            f"Показать сотрудников с ученой степенью {st}.",
-            f"SELECT * FROM Сотрудники WHERE ученая_степень = '{st}';"
-        ))
-
+    ("st", "Показать сотрудников с ученой степенью {st}.", "SELECT * FROM Сотрудники WHERE ученая_степень = '{st}';"),
     # По возрасту
-    age = random.randint(25, 65)
-    queries.append((
-        f"Показать сотрудников старше {age} лет.",
-        f"SELECT * FROM Сотрудники WHERE возраст > {age};"
-    ))
-
+    ("age", "Показать сотрудников старше {age} лет.", "SELECT * FROM Сотрудники WHERE возраст > {age};"),
     # По журналу
-    zh = random.choice(zhurnaly)
-    queries.append((
-        f"Показать научные работы, опубликованные в журнале {zh}.",
-        f"SELECT * FROM Научные_работы WHERE название_журнала = '{zh}';"
-    ))
-
+    ("zh", "Показать научные работы, опубликованные в журнале {zh}.",
+     "SELECT * FROM Научные_работы WHERE название_журнала = '{zh}';"),
     # По базе цитирования
-    baz = random.choice(bazy)
-    queries.append((
-        f"Показать все публикации из базы цитирования {baz}.",
-        f"SELECT * FROM Научные_работы WHERE база_цитирования = '{baz}';"
-    ))
-
+    ("baz", "Показать все публикации из базы цитирования {baz}.",
+     "SELECT * FROM Научные_работы WHERE база_цитирования = '{baz}';"),
     # По году
-    y = random.choice(years)
-    queries.append((
-        f"Показать публикации за {y} год.",
-        f"SELECT * FROM Научные_работы WHERE год = {y};"
-    ))
-
+    ("year", "Показать публикации за {year} год.", "SELECT * FROM Научные_работы WHERE год = {year};"),
     # Группировка и агрегаты
-    queries.append((
-        "Посчитать количество сотрудников в каждом подразделении.",
-        "SELECT подразделение, COUNT(*) FROM Сотрудники GROUP BY подразделение;"
-    ))
-    queries.append((
-        "Посчитать количество публикаций в каждом журнале.",
-        "SELECT название_журнала, COUNT(*) FROM Научные_работы GROUP BY название_журнала;"
-    ))
-    queries.append((
-        "Показать средний возраст сотрудников по подразделениям.",
-        "SELECT подразделение, AVG(возраст) FROM Сотрудники GROUP BY подразделение;"
-    ))
-    queries.append((
-        "Показать количество публикаций по каждому автору.",
-        "SELECT автор, COUNT(*) FROM Научные_работы GROUP BY автор;"
-    ))
-    queries.append((
-        "Показать сотрудников без ученой степени.",
-        "SELECT * FROM Сотрудники WHERE ученая_степень = '';"
-    ))
-    queries.append((
-        "Показать научные работы без вторых названий.",
-        "SELECT * FROM Научные_работы WHERE второе_название = '';"
-    ))
+    (None, "Посчитать количество сотрудников в каждом подразделении.",
+     "SELECT подразделение, COUNT(*) FROM Сотрудники GROUP BY подразделение;"),
+    (None, "Посчитать количество публикаций в каждом журнале.",
+     "SELECT название_журнала, COUNT(*) FROM Научные_работы GROUP BY название_журнала;"),
+    (None, "Показать средний возраст сотрудников по подразделениям.",
+     "SELECT подразделение, AVG(возраст) FROM Сотрудники GROUP BY подразделение;"),
+    (None, "Показать количество публикаций по каждому автору.",
+     "SELECT автор, COUNT(*) FROM Научные_работы GROUP BY автор;"),
+    (None, "Показать сотрудников без ученой степени.", "SELECT * FROM Сотрудники WHERE ученая_степень = '';"),
+    (None, "Показать научные работы без вторых названий.", "SELECT * FROM Научные_работы WHERE второе_название = '';"),
     # LIKE и IN
-    queries.append((
-        "Показать публикации, где в авторах есть Иванов.",
-        "SELECT * FROM Научные_работы WHERE авторы LIKE '%Иванов%';"
-    ))
-    queries.append((
-        "Показать сотрудников из кафедры нанофизики или кафедры архитектурного проектирования.",
-        "SELECT * FROM Сотрудники WHERE оргструктура IN ('Кафедра нанофизики', 'Кафедра архитектурного проектирования');"
-    ))
+    (None, "Показать публикации, где в авторах есть Иванов.",
+     "SELECT * FROM Научные_работы WHERE авторы LIKE '%Иванов%';"),
+    (None, "Показать сотрудников из кафедры нанофизики или кафедры архитектурного проектирования.",
+     "SELECT * FROM Сотрудники WHERE оргструктура IN ('Кафедра нанофизики', 'Кафедра архитектурного проектирования');"),
     # LIMIT
-    queries.append((
-        "Показать 5 самых молодых сотрудников.",
-        "SELECT * FROM Сотрудники ORDER BY возраст ASC LIMIT 5;"
-    ))
+    (None, "Показать 5 самых молодых сотрудников.", "SELECT * FROM Сотрудники ORDER BY возраст ASC LIMIT 5;"),
     # ORDER BY
-    queries.append((
-        "Показать научные работы, отсортированные по году публикации.",
-        "SELECT * FROM Научные_работы ORDER BY год DESC;"
-    ))
+    (None, "Показать научные работы, отсортированные по году публикации.",
+     "SELECT * FROM Научные_работы ORDER BY год DESC;"),
+]
+
+# Join по автору и ФИО
+JOIN_TEMPLATES = [
+    (None, "Показать ФИО сотрудников и количество их научных работ.",
+     "SELECT Сотрудники.ФИО, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор GROUP BY Сотрудники.ФИО;"),
+    (None, "Показать все публикации сотрудников из Института химии.",
+     "SELECT Научные_работы.* FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Сотрудники.подразделение = 'Институт химии';"),
+    (None, "Показать должности сотрудников и названия их публикаций.",
+     "SELECT Сотрудники.должность, Научные_работы.название FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор;"),
+    (None, "Показать авторов и названия журналов, в которых есть публикации сотрудников старше 50 лет.",
+     "SELECT Научные_работы.автор, Научные_работы.название_журнала FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Сотрудники.возраст > 50;"),
+    (None, "Показать ФИО сотрудников и годы публикаций их научных работ.",
+     "SELECT Сотрудники.ФИО, Научные_работы.год FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор;"),
+    (None, "Показать ФИО сотрудников и количество публикаций в Scopus.",
+     "SELECT Сотрудники.ФИО, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.база_цитирования = 'Scopus' GROUP BY Сотрудники.ФИО;"),
+    (None, "Показать ФИО сотрудников, которые имеют публикации в журнале 'Журнал нанотехнологий'.",
+     "SELECT DISTINCT Сотрудники.ФИО FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.название_журнала = 'Журнал нанотехнологий';"),
+    (None, "Показать всех сотрудников, у которых нет научных работ.",
+     "SELECT Сотрудники.ФИО FROM Сотрудники LEFT JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.автор IS NULL;"),
+    (None, "Показать ФИО сотрудников и названия их публикаций за 2022 год.",
+     "SELECT Сотрудники.ФИО, Научные_работы.название FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.год = 2022;"),
+    (None, "Показать подразделения и количество публикаций их сотрудников.",
+     "SELECT Сотрудники.подразделение, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор GROUP BY Сотрудники.подразделение;"),
+]
+
+# Вопросы о конкретном сотруднике: ФИО подставляется по номеру (person_names.fio),
+# поэтому enumerate_templates эти шаблоны не перечисляет. В тексте {fio} —
+# именительный падеж, {fio_gen} — родительный; в SQL всегда {fio}
+NAME_TEMPLATES = [
+    ("fio", "Показать научные работы автора {fio_gen}.", "SELECT * FROM Научные_работы WHERE автор = '{fio}';"),
+    ("fio", "Сколько публикаций у сотрудника {fio_gen}?", "SELECT COUNT(*) FROM Научные_работы WHERE автор = '{fio}';"),
+    ("fio", "В каком подразделении работает {fio}?", "SELECT подразделение FROM Сотрудники WHERE ФИО = '{fio}';"),
+    ("fio", "Показать должность и ученую степень сотрудника {fio_gen}.",
+     "SELECT должность, ученая_степень FROM Сотрудники WHERE ФИО = '{fio}';"),
+    ("fio", "В каких журналах есть публикации автора {fio_gen}?",
+     "SELECT DISTINCT название_журнала FROM Научные_работы WHERE автор = '{fio}';"),
+    ("fio", "Показать публикации автора {fio_gen} в Scopus.",
+     "SELECT * FROM Научные_работы WHERE автор = '{fio}' AND база_цитирования = 'Scopus';"),
+]
+
+TEMPLATE_GROUPS = {"select": SELECT_TEMPLATES, "join": JOIN_TEMPLATES, "names": NAME_TEMPLATES}
+DEFAULT_GROUP_WEIGHTS = {"select": 0.6, "join": 0.15, "names": 0.25}
+
+
+def fill_template(template, value=None):
+    slot, text, sql = template
+    if slot is None:
+        return text, sql
+    return text.format(**{slot: value}), sql.format(**{slot: value})
+
+
+def fill_name_template(template, i):
+    """
+    Шаблон из NAME_TEMPLATES с ФИО сотрудника номер i.
+    """
+    _, text, sql = template
+    name = fio(i)
+    return text.format(fio=name, fio_gen=fio_genitive(i)), sql.format(fio=name)
+
+
+def _sample_slot(slot):
+    if slot == "age":
+        return random.randint(25, 65)
+    return random.choice(SLOT_VALUES[slot])
+
+
+def _sample_templates(templates):
+    # Для каждого шаблона выбирается одно случайное значение слота
+    queries = []
+    for template in templates:
+        value = _sample_slot(template[0]) if template[0] else None
+        if template[0] and value == "":
+            continue
+        queries.append(fill_template(template, value))
     return queries
 
+
+def enumerate_templates(templates=None):
+    """
+    Все пары (текст, SQL), которые могут дать шаблоны: каждый шаблон
+    со всеми непустыми значениями своего слота.
+    """
+    for template in templates or SELECT_TEMPLATES + JOIN_TEMPLATES:
+        slot = template[0]
+        for value in (SLOT_VALUES[slot] if slot else [None]):
+            if value != "":
+                yield fill_template(template, value)
+
+
+# --- Примитивные шаблоны текстов и SQL ---
+def get_russian_select_text_sql():
+    return _sample_templates(SELECT_TEMPLATES)
+
 def get_russian_join_text_sql():
-    # Join по автору и ФИО
-    joins = []
-    joins.append((
-        "Показать ФИО сотрудников и количество их научных работ.",
-        "SELECT Сотрудники.ФИО, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор GROUP BY Сотрудники.ФИО;"
-    ))
-    joins.append((
-        "Показать все публикации сотрудников из Института химии.",
-        "SELECT Научные_работы.* FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Сотрудники.подразделение = 'Институт химии';"
-    ))
-    joins.append((
-        "Показать должности сотрудников и названия их публикаций.",
-        "SELECT Сотрудники.должность, Научные_работы.название FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор;"
-    ))
-    joins.append((
-        "Показать авторов и названия журналов, в которых есть публикации сотрудников старше 50 лет.",
-        "SELECT Научные_работы.автор, Научные_работы.название_журнала FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Сотрудники.возраст > 50;"
-    ))
-    joins.append((
-        "Показать ФИО сотрудников и годы публикаций их научных работ.",
-        "SELECT Сотрудники.ФИО, Научные_работы.год FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор;"
-    ))
-    joins.append((
-        "Показать ФИО сотрудников и количество публикаций в Scopus.",
-        "SELECT Сотрудники.ФИО, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.база_цитирования = 'Scopus' GROUP BY Сотрудники.ФИО;"
-    ))
-    joins.append((
-        "Показать ФИО сотрудников, которые имеют публикации в журнале 'Журнал нанотехнологий'.",
-        "SELECT DISTINCT Сотрудники.ФИО FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.название_журнала = 'Журнал нанотехнологий';"
-    ))
-    joins.append((
-        "Показать всех сотрудников, у которых нет научных работ.",
-        "SELECT Сотрудники.ФИО FROM Сотрудники LEFT JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.автор IS NULL;"
-    ))
-    joins.append((
-        "Показать ФИО сотрудников и названия их публикаций за 2022 год.",
-        "SELECT Сотрудники.ФИО, Научные_работы.название FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор WHERE Научные_работы.год = 2022;"
-    ))
-    joins.append((
-        "Показать подразделения и количество публикаций их сотрудников.",
-        "SELECT Сотрудники.подразделение, COUNT(*) FROM Сотрудники JOIN Научные_работы ON Сотрудники.ФИО = Научные_работы.автор GROUP BY Сотрудники.подразделение;"
-    ))
-    return joins
-
-# --- Генерация датасета ---
-random.seed(42)
-
-with open("synthetic_rus_text_sql.csv", "w", encoding="utf-8", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["text", "sql"])
-    for i in range(10000):
-        # 20% JOIN, 80% обычные SELECT
-        if random.random() < 0.2:
-            text_sqls = get_russian_join_text_sql()
+    return _sample_templates(JOIN_TEMPLATES)
+
+# --- Потоковая генерация датасета ---
+def parse_weights(spec):
+    """
+    Веса из строки "join=0.5,names=0.1" или из JSON-файла {ключ: вес}.
+    Ключ — имя группы из TEMPLATE_GROUPS или текст шаблона.
+    """
+    if not spec:
+        return {}
+    if spec.endswith(".json"):
+        with open(spec, encoding="utf-8") as f:
+            return {key: float(value) for key, value in json.load(f).items()}
+    weights = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        weights[key.strip()] = float(value)
+    return weights
+
+
+def template_space(weights=None):
+    """
+    Пространство шаблонов: список (группа, шаблон, пары, вес). У шаблона
+    с конечным слотом пары — все его непустые (текст, SQL); у шаблона с ФИО — None.
+    """
+    weights = weights or {}
+    known = set(TEMPLATE_GROUPS) | {t[1] for templates in TEMPLATE_GROUPS.values() for t in templates}
+    unknown = set(weights) - known
+    if unknown:
+        raise ValueError(f"неизвестные ключи весов: {', '.join(sorted(unknown))}")
+    group_weights = {**DEFAULT_GROUP_WEIGHTS, **{k: v for k, v in weights.items() if k in TEMPLATE_GROUPS}}
+    space = []
+    for group, templates in TEMPLATE_GROUPS.items():
+        for template in templates:
+            weight = weights.get(template[1], group_weights[group] / len(templates))
+            if weight <= 0:
+                continue
+            pairs = None if template[0] == "fio" else tuple(enumerate_templates([template]))
+            space.append((group, template, pairs, weight))
+    if not space:
+        raise ValueError("у всех шаблонов нулевой вес")
+    return space
+
+
+def group_shares(space):
+    """
+    Доли групп {группа: доля} по суммарным весам их шаблонов.
+    """
+    totals = {}
+    for group, _, _, weight in space:
+        totals[group] = totals.get(group, 0.0) + weight
+    total = sum(totals.values())
+    return {group: weight / total for group, weight in totals.items()}
+
+
+def group_quotas(shares, count):
+    """
+    Квоты групп, в сумме ровно count: округление методом наибольших остатков.
+    """
+    exact = {group: share * count for group, share in shares.items()}
+    quotas = {group: int(value) for group, value in exact.items()}
+    rest = sorted(exact, key=lambda group: exact[group] - quotas[group], reverse=True)
+    for group in rest[:count - sum(quotas.values())]:
+        quotas[group] += 1
+    return quotas
+
+
+def pair_key(text, sql):
+    return int.from_bytes(hashlib.blake2b(f"{text}\x1f{sql}".encode(), digest_size=8).digest(), "big")
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для ключей pair_key: около 1.8 байта на пару при доле
+    ложных срабатываний error_rate (такая доля новых пар будет отброшена).
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        """
+        Добавляет ключ; True, если его ещё не было.
+        """
+        # Двойное хеширование: k позиций из двух половин 64-битного ключа
+        h1, h2 = key >> 32, (key & 0xFFFFFFFF) | 1
+        new = False
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % self.size
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                new = True
+        return new
+
+
+class _KeySet(set):
+    def add(self, key):
+        if key in self:
+            return False
+        super().add(key)
+        return True
+
+
+def output_format(path):
+    if path.endswith(".parquet"):
+        return "parquet"
+    return "gzip" if path.endswith(".gz") else "csv"
+
+
+class ChunkWriter:
+    """
+    Запись пар пачками в CSV, CSV.gz или Parquet.
+    """
+
+    def __init__(self, path, fmt, header=True):
+        self.fmt = fmt
+        if fmt == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Для формата parquet установите пакет pyarrow")
+            self._pa = pa
+            self._schema = pa.schema([("text", pa.string()), ("sql", pa.string())])
+            self._writer = pq.ParquetWriter(path, self._schema)
+            return
+        if fmt == "gzip":
+            # mtime=0 и пустое имя в заголовке: при том же seed файл совпадает побайтово
+            self._raw = open(path, "wb")
+            self._file = io.TextIOWrapper(
+                gzip.GzipFile(filename="", fileobj=self._raw, mode="wb", compresslevel=6, mtime=0),
+                encoding="utf-8", newline="")
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        if header:
+            self._writer.writerow(["text", "sql"])
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.fmt == "parquet":
+            texts, sqls = zip(*rows)
+            self._writer.write_table(self._pa.table({"text": texts, "sql": sqls}, schema=self._schema))
         else:
-            text_sqls = get_russian_select_text_sql()
-        text, sql = random.choice(text_sqls)
-        writer.writerow([text, sql])
\ No newline at end of file
+            self._writer.writerows(rows)
+
+    def close(self):
+        if self.fmt == "parquet":
+            self._writer.close()
+            return
+        self._file.close()
+        if self.fmt == "gzip":
+            self._raw.close()
+
+
+def generate_shard(space, count, shard, shards, path, fmt, seed=42, names=NAME_SPACE,
+                   dedup="set", chunk=50_000, patience=100_000):
+    """
+    Пишет в path до count пар шарда shard из shards; возвращает статистику шарда.
+    С дедупликацией шаблоны без ФИО выдают свои пары без возвращения
+    и выбывают, когда пары кончились: повторы не тратят выборку.
+    Группа, набравшая свою квоту, не выбирается; недобор исчерпанной
+    группы переходит к группам, у которых пары ещё есть (обычно names).
+    """
+    start = time.perf_counter()
+    rng = random.Random(f"{seed}:{shard}")
+    groups = [group for group, _, _, _ in space]
+    templates = [template for _, template, _, _ in space]
+    base_weights = [weight for _, _, _, weight in space]
+    pools = [list(pairs) if pairs is not None else None for _, _, pairs, _ in space]
+    shares = group_shares(space)
+    quotas = group_quotas(shares, count)
+    realized = dict.fromkeys(quotas, 0)
+    if dedup != "none":
+        # Пара без ФИО принадлежит одному шарду — по ключу
+        pools = [[p for p in pool if pair_key(*p) % shards == shard] if pool is not None else None
+                 for pool in pools]
+        for pool in pools:
+            if pool is not None:
+                rng.shuffle(pool)
+    # Шаблон с пустым пулом выбывает; в режиме none пары берутся с возвращением
+    alive = [pool is None or bool(pool) for pool in pools]
+
+    def rebalance():
+        # Недобор групп без живых шаблонов делится между остальными по их долям
+        open_groups = {g for g, ok in zip(groups, alive) if ok}
+        shortfall = 0
+        for group in quotas:
+            if group not in open_groups and quotas[group] > realized[group]:
+                shortfall += quotas[group] - realized[group]
+                quotas[group] = realized[group]
+        if shortfall and open_groups:
+            total = sum(shares[g] for g in open_groups)
+            extra = group_quotas({g: shares[g] / total for g in open_groups}, shortfall)
+            for group, n in extra.items():
+                quotas[group] += n
+        return [w if ok and realized[g] < quotas[g] else 0.0
+                for w, ok, g in zip(base_weights, alive, groups)]
+
+    weights = rebalance()
+    # ФИО шарда — номера с остатком shard, поэтому между шардами не совпадают
+    name_slots = max(1, (names - shard + shards - 1) // shards)
+    if dedup == "bloom":
+        seen = BloomFilter(count)
+    elif dedup == "set":
+        seen = _KeySet()
+    else:
+        seen = None
+
+    writer = ChunkWriter(path, fmt, header=shard == 0)
+    written = drawn = misses = 0
+    try:
+        while written < count and misses < patience and any(weights):
+            rows = []
+            for i in rng.choices(range(len(space)), weights=weights, k=min(chunk, count - written)):
+                if not weights[i]:
+                    # Шаблон выбыл внутри пачки
+                    continue
+                if realized[groups[i]] >= quotas[groups[i]]:
+                    weights = rebalance()
+                    continue
+                pool = pools[i]
+                if pool is None:
+                    text, sql = fill_name_template(templates[i], shard + shards * rng.randrange(name_slots))
+                elif seen is None:
+                    text, sql = rng.choice(pool)
+                else:
+                    text, sql = pool.pop()
+                    if not pool:
+                        alive[i] = False
+                        weights = rebalance()
+                drawn += 1
+                if seen is not None and not seen.add(pair_key(text, sql)):
+                    misses += 1
+                    continue
+                misses = 0
+                realized[groups[i]] += 1
+                rows.append((text, sql))
+            writer.write(rows)
+            written += len(rows)
+            weights = rebalance()
+    finally:
+        writer.close()
+    return {"shard": shard, "written": written, "drawn": drawn, "groups": realized,
+            "exhausted": written < count, "seconds": time.perf_counter() - start}
+
+
+def merge_parts(parts, output, fmt):
+    """
+    Склеивает части шардов по порядку. CSV (заголовок только в части 0)
+    и gzip склеиваются побайтово: несколько gzip-потоков подряд — корректный gzip.
+    """
+    if len(parts) == 1:
+        os.replace(parts[0], output)
+        return
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = None
+        for part in parts:
+            source = pq.ParquetFile(part)
+            writer = writer or pq.ParquetWriter(output, source.schema_arrow)
+            for i in range(source.num_row_groups):
+                writer.write_table(source.read_row_group(i))
+        writer.close()
+    else:
+        with open(output, "wb") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+    for part in parts:
+        os.remove(part)
+
+
+def generate(output, count, shards=1, seed=42, weights=None, names=NAME_SPACE,
+             dedup="set", chunk=50_000, patience=100_000):
+    """
+    Генерирует count пар в output в shards процессах; возвращает статистику шардов.
+    """
+    if names < shards:
+        # ФИО делятся между шардами по остатку номера: шарду без своих ФИО подставлять нечего
+        raise ValueError(f"--names ({names}) должно быть не меньше --shards ({shards})")
+    space = template_space(weights)
+    fmt = output_format(output)
+    parts = [output if shards == 1 else f"{output}.part{shard:03d}" for shard in range(shards)]
+    quotas = [count // shards + (shard < count % shards) for shard in range(shards)]
+    args = [(space, quotas[shard], shard, shards, parts[shard], fmt, seed, names, dedup, chunk, patience)
+            for shard in range(shards)]
+    if shards == 1:
+        stats = [generate_shard(*args[0])]
+    else:
+        with ProcessPoolExecutor(shards) as pool:
+            stats = list(pool.map(generate_shard, *zip(*args)))
+    merge_parts(parts, output, fmt)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="data/synthetic.csv", help=".csv, .csv.gz или .parquet")
+    parser.add_argument("--count", type=int, default=10000, help="Сколько пар сгенерировать")
+    parser.add_argument("--shards", type=int, default=1, help="Число процессов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--weights", help="Веса: \"select=0.6,join=0.15,names=0.25\" или JSON-файл {группа или текст шаблона: вес}")
+    parser.add_argument("--names", type=int, default=NAME_SPACE,
+                        help="Сколько разных сотрудников подставлять в шаблоны с ФИО (как --employees в db_generate.py)")
+    parser.add_argument("--dedup", choices=["set", "bloom", "none"], default="set")
+    parser.add_argument("--chunk", type=int, default=50_000, help="Строк в одной пачке записи")
+    parser.add_argument("--patience", type=int, default=100_000,
+                        help="Остановить шард после стольких повторов подряд")
+    args = parser.parse_args()
+    if args.names < args.shards:
+        parser.error("--names должно быть не меньше --shards")
+
+    start = time.perf_counter()
+    stats = generate(args.output, args.count, shards=args.shards, seed=args.seed,
+                     weights=parse_weights(args.weights), names=args.names, dedup=args.dedup,
+                     chunk=args.chunk, patience=args.patience)
+    elapsed = time.perf_counter() - start
+    written = sum(s["written"] for s in stats)
+    drawn = sum(s["drawn"] for s in stats)
+    print(f"{args.output}: {written} пар за {elapsed:.1f} с ({written / elapsed:,.0f} пар/с), "
+          f"отброшено повторов: {drawn - written}")
+    shares = group_shares(template_space(parse_weights(args.weights)))
+    for group, share in shares.items():
+        realized = sum(s["groups"][group] for s in stats)
+        print(f"  {group:>7}: {realized} пар, {realized / max(written, 1):.1%} (задано {share:.1%})")
+    if any(s["exhausted"] for s in stats):
+        print(f"Уникальные пары закончились: записано {written} из {args.count}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Конфигурация gunicorn для app.py:
+    gunicorn -c gunicorn.conf.py app:app
+
+Модель загружается один раз в мастер-процессе (preload_app), воркеры
+получают её через fork и делят страницы с весами (copy-on-write).
+gc.freeze() перед fork переносит объекты мастера в постоянное поколение:
+сборщик мусора воркеров их не обходит и не "пачкает" общие страницы.
+"""
+import gc
+import os
+
+bind = os.environ.get("SQLBOT_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("SQLBOT_WORKERS", "2"))
+threads = int(os.environ.get("SQLBOT_THREADS", "4"))
+preload_app = os.environ.get("SQLBOT_PRELOAD", "1") == "1"
+timeout = 120
+
+# В мастере модель грузится сразу: фоновый поток не пережил бы fork
+os.environ.setdefault("SQLBOT_MODEL_LOAD", "eager")
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Делим ядра между воркерами, иначе потоки torch в разных процессах конкурируют за CPU
+    import torch
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
@@ -0,0 +1,407 @@
+"""
+Подбор индексов для data/database.db по реальным запросам.
+
+1. Из лога взаимодействий и обучающих CSV собираются SQL-запросы (с частотой)
+   и столбцы, по которым они фильтруют (WHERE), соединяют (JOIN ... ON),
+   группируют и сортируют (GROUP BY/ORDER BY). Условия LIKE '%...%' индекс
+   не ускоряет, они не учитываются.
+2. Для каждой формы запроса предлагается индекс: сначала столбцы с
+   равенством, затем столбец диапазона или сортировки; если запрос читает
+   из таблицы несколько явных столбцов, они добавляются в конец, и индекс
+   становится покрывающим (таблицу читать не нужно).
+3. На увеличенной копии базы (--scale) кандидаты создаются, выполняется
+   ANALYZE, и по EXPLAIN QUERY PLAN остаются только индексы, которые SQLite
+   действительно выбирает. Затем каждый индекс по очереди удаляется: если
+   без него запросы, которые его используют, не медленнее (например, фильтр
+   по столбцу с тремя значениями), индекс не нужен. Время самых частых
+   запросов замеряется до и после.
+4. С --apply выбранные индексы создаются в рабочей базе.
+
+Пример:
+    python index_advisor.py --scale 1000
+    python index_advisor.py --scale 1000 --apply
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+from db_pool import time_limit
+from log_interaction import LOG_FILE, log_files
+from result_cache import canonical_sql
+from sql_guard import with_limit
+from sql_schema import load_schema, unknown_identifiers
+
+DB_PATH = "data/database.db"
+TRAINING_FILES = ["data/training_data.csv", "synthetic_rus_text_sql.csv"]
+OUTPUT_FILE = "data/index_advisor.json"
+# Столбцов в одном индексе, включая добавленные для покрытия
+MAX_INDEX_COLUMNS = 4
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_CLAUSE = re.compile(r"\b(SELECT|FROM|JOIN|ON|WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|UNION|EXCEPT|INTERSECT)\b",
+                     re.IGNORECASE)
+_SOURCE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_COLUMN = re.compile(r"(?:(\w+)\.)?(\w+)")
+_EQ_AFTER = re.compile(r"\s*(?:==?|IN\b|IS\b(?!\s+NOT))", re.IGNORECASE)
+_RANGE_AFTER = re.compile(r"\s*(?:<=|>=|<(?!>)|>|BETWEEN\b)", re.IGNORECASE)
+_EQ_BEFORE = re.compile(r"(?:[^<>!=]==?|\bIN|\bIS)\s*$", re.IGNORECASE)
+_INDEX_USED = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+_NOT_ALIAS = {"WHERE", "JOIN", "ON", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "GROUP", "ORDER",
+              "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "USING", "AS"}
+
+
+def load_queries(log_file=LOG_FILE, training_files=TRAINING_FILES):
+    """
+    Частоты запросов (по каноническому SQL) из лога (с ротированными копиями) и обучающих CSV.
+    """
+    counts = Counter()
+    sources = [(path, ("predicted_sql", "generated_sql")) for path in log_files(log_file)]
+    for path, columns in sources + [(f, ("sql",)) for f in training_files]:
+        if not os.path.exists(path):
+            continue
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                sql = next((row[c] for c in columns if row.get(c)), "")
+                if sql.strip():
+                    counts[canonical_sql(sql)] += 1
+    return counts
+
+
+def query_usage(sql, schema):
+    """
+    Как запрос использует столбцы таблиц:
+    {таблица: {"eq": [...], "range": [...], "order": [...], "join": [...], "select": [...] или None}}.
+    join — столбцы из условий ON (входят и в eq); select = None, если из
+    таблицы читаются все столбцы (SELECT *).
+    """
+    code = _LITERALS.sub("''", sql)
+    aliases = {}
+    tables = []
+    for table, alias in _SOURCE.findall(code):
+        if table in schema:
+            tables.append(table)
+            aliases[table] = table
+            if alias and alias.upper() not in _NOT_ALIAS:
+                aliases[alias] = table
+    usage = {table: {"eq": [], "range": [], "order": [], "join": [], "select": []} for table in tables}
+
+    def resolve(prefix, column):
+        if prefix:
+            table = aliases.get(prefix)
+            return table if table in usage and column in schema[table] else None
+        owners = [t for t in usage if column in schema[t]]
+        return owners[0] if len(owners) == 1 else None
+
+    def add(table, kind, column):
+        if column not in usage[table][kind]:
+            usage[table][kind].append(column)
+
+    bounds = [(m.start(), m.end(), " ".join(m.group(1).upper().split())) for m in _CLAUSE.finditer(code)]
+    for i, (_, end, clause) in enumerate(bounds):
+        text = code[end:bounds[i + 1][0] if i + 1 < len(bounds) else len(code)]
+        if clause == "SELECT" and re.search(r"(?:^|[\s,])\*", text):
+            for table in usage:
+                usage[table]["select"] = None
+        for m in _COLUMN.finditer(text):
+            table = resolve(m.group(1), m.group(2))
+            if table is None:
+                continue
+            column = m.group(2)
+            if clause in ("WHERE", "ON"):
+                if _EQ_AFTER.match(text, m.end()) or _EQ_BEFORE.search(text[:m.start()]):
+                    add(table, "eq", column)
+                    if clause == "ON":
+                        add(table, "join", column)
+                elif _RANGE_AFTER.match(text, m.end()):
+                    add(table, "range", column)
+            elif clause in ("GROUP BY", "ORDER BY"):
+                add(table, "order", column)
+            elif clause == "SELECT" and usage[table]["select"] is not None:
+                add(table, "select", column)
+    return usage
+
+
+def candidate_indexes(usage):
+    """
+    Варианты столбцов индекса для одной таблицы запроса. Если таблица и
+    фильтруется, и соединяется, предлагаются оба порядка: с фильтра
+    (таблица во внешнем цикле) и со столбца соединения (во внутреннем).
+    """
+    filters = [c for c in usage["eq"] if c not in usage["join"]]
+    orders = [filters + usage["join"]]
+    if filters and usage["join"]:
+        orders.append(usage["join"] + filters)
+    candidates = []
+    for key in orders:
+        if usage["range"]:
+            key = key + [usage["range"][0]]
+        else:
+            key = key + [c for c in usage["order"] if c not in key]
+        if not key:
+            continue
+        if usage["select"] is not None:
+            extra = [c for c in usage["select"] if c not in key]
+            if extra and len(key) + len(extra) <= MAX_INDEX_COLUMNS:
+                key = key + extra
+        candidates.append(tuple(key[:MAX_INDEX_COLUMNS]))
+    return candidates
+
+
+def index_name(table, columns):
+    return "idx_" + "_".join((table,) + tuple(columns))
+
+
+def create_index_sql(table, columns):
+    cols = ", ".join(f'"{c}"' for c in columns)
+    return f'CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}" ON "{table}" ({cols})'
+
+
+def propose(counts, schema):
+    """
+    Кандидаты {(таблица, столбцы): вес}, список (sql, частота) запросов,
+    которые выполнимы на схеме, и множество (таблица, столбец) из условий ON.
+    """
+    candidates = Counter()
+    queries = []
+    join_columns = set()
+    for sql, count in counts.items():
+        if unknown_identifiers(sql, schema) or not _SOURCE.search(sql):
+            continue
+        usage = query_usage(sql, schema)
+        if not usage:
+            continue
+        queries.append((sql, count))
+        for table, used in usage.items():
+            for columns in candidate_indexes(used):
+                candidates[(table, columns)] += count
+        for table, used in usage.items():
+            join_columns.update((table, c) for c in used["join"])
+    return candidates, queries, join_columns
+
+
+def build_scaled_copy(db_path, target, scale, join_columns):
+    """
+    Копия базы, в которой каждая таблица повторена scale раз. Значения
+    join-столбцов получают суффикс копии, поэтому соединение по ним
+    остаётся таким же избирательным, как в исходных данных.
+    """
+    source = sqlite3.connect(db_path)
+    conn = sqlite3.connect(target)
+    source.backup(conn)
+    source.close()
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    schema = load_schema(target)
+    if scale <= 1:
+        return conn
+    with conn:
+        for table, columns in schema.items():
+            values = ", ".join(
+                f'"{c}" || \' #\' || copy.n' if (table, c) in join_columns else f'"{c}"' for c in columns
+            )
+            cols = ", ".join(f'"{c}"' for c in columns)
+            conn.execute(f'CREATE TEMP TABLE base AS SELECT * FROM "{table}"')
+            conn.execute(
+                f"WITH RECURSIVE copy(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM copy WHERE n < ?) "
+                f'INSERT INTO "{table}" ({cols}) SELECT {values} FROM base, copy',
+                (scale - 1,)
+            )
+            conn.execute("DROP TABLE temp.base")
+    return conn
+
+
+def benchmark(conn, queries, repeat, limit, timeout):
+    """
+    Медиана времени выполнения каждого запроса (мс); None — не уложился в timeout.
+    """
+    timings = {}
+    for sql, _ in queries:
+        runnable = with_limit(sql, limit) if limit else sql
+        samples = []
+        try:
+            with time_limit(conn, timeout):
+                conn.execute(runnable).fetchall()  # прогрев кэша страниц
+            for _ in range(repeat):
+                start = time.perf_counter()
+                with time_limit(conn, timeout):
+                    conn.execute(runnable).fetchall()
+                samples.append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError:
+            timings[sql] = None
+            continue
+        timings[sql] = statistics.median(samples)
+    return timings
+
+
+def indexes_used(conn, sql):
+    try:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    except sqlite3.Error:
+        return set()
+    return {name for _, _, _, detail in plan for name in _INDEX_USED.findall(detail)}
+
+
+def select_indexes(conn, candidates, queries, max_candidates):
+    """
+    Создаёт кандидатов на копии базы и оставляет те, что выбирает планировщик.
+    Возвращает {(таблица, столбцы): вес запросов, которые используют индекс}.
+    """
+    top = [key for key, _ in candidates.most_common(max_candidates)]
+    with conn:
+        for table, columns in top:
+            conn.execute(create_index_sql(table, columns))
+    conn.execute("ANALYZE")
+    by_name = {index_name(table, columns): (table, columns) for table, columns in top}
+    used = Counter()
+    for sql, count in queries:
+        for name in indexes_used(conn, sql):
+            if name in by_name:
+                used[by_name[name]] += count
+    with conn:
+        for table, columns in top:
+            if (table, columns) not in used:
+                conn.execute(f'DROP INDEX "{index_name(table, columns)}"')
+    conn.execute("ANALYZE")
+    return used
+
+
+def weighted_ms(timings, queries, timeout):
+    # Превысившие таймаут запросы считаются выполнявшимися timeout секунд
+    return sum(count * (timings[sql] if timings[sql] is not None else timeout * 1000) for sql, count in queries)
+
+
+def prune_indexes(conn, used, queries, repeat, limit, timeout, min_gain):
+    """
+    Удаляет индексы, без которых запросы, выбирающие их, замедляются
+    меньше чем в min_gain раз. Возвращает {(таблица, столбцы): ускорение}.
+    """
+    gains = {}
+    for table, columns in [key for key, _ in used.most_common()]:
+        name = index_name(table, columns)
+        affected = [(sql, count) for sql, count in queries if name in indexes_used(conn, sql)]
+        with_index = weighted_ms(benchmark(conn, affected, repeat, limit, timeout), affected, timeout)
+        with conn:
+            conn.execute(f'DROP INDEX "{name}"')
+        without = weighted_ms(benchmark(conn, affected, repeat, limit, timeout), affected, timeout)
+        gain = without / with_index if with_index else float("inf")
+        if affected and gain >= min_gain:
+            with conn:
+                conn.execute(create_index_sql(table, columns))
+            conn.execute(f'ANALYZE "{name}"')
+            gains[(table, columns)] = gain
+        else:
+            del used[(table, columns)]
+    return gains
+
+
+def apply_indexes(db_path, indexes):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for table, columns in indexes:
+                conn.execute(create_index_sql(table, columns))
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def _ms(value):
+    return f"{value:9.2f}" if value is not None else "  таймаут"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--log", default=LOG_FILE)
+    parser.add_argument("--training", nargs="*", default=TRAINING_FILES)
+    parser.add_argument("--scale", type=int, default=1000, help="Во сколько раз увеличить таблицы для замеров")
+    parser.add_argument("--scaled-db", help="Сохранить увеличенную копию базы в этот файл")
+    parser.add_argument("--max-candidates", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=30, help="Сколько самых частых запросов замерять")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=501, help="LIMIT, как в приложении (0 — без LIMIT)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--min-gain", type=float, default=1.1,
+                        help="Во сколько раз индекс должен ускорять запросы, которые его используют")
+    parser.add_argument("--apply", action="store_true", help="Создать выбранные индексы в --db")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    schema = load_schema(args.db)
+    counts = load_queries(args.log, args.training)
+    candidates, queries, join_columns = propose(counts, schema)
+    queries.sort(key=lambda item: -item[1])
+    print(f"Запросов: {sum(counts.values())}, уникальных: {len(counts)}, выполнимых на схеме: {len(queries)}")
+    print(f"Кандидатов в индексы: {len(candidates)}")
+
+    workdir = None
+    if args.scaled_db:
+        target = args.scaled_db
+        if os.path.exists(target):
+            os.remove(target)
+    else:
+        workdir = tempfile.mkdtemp(prefix="index_advisor_")
+        target = os.path.join(workdir, "scaled.db")
+    try:
+        start = time.perf_counter()
+        conn = build_scaled_copy(args.db, target, args.scale, join_columns)
+        sizes = {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in schema}
+        print(f"Копия x{args.scale} за {time.perf_counter() - start:.1f} с: "
+              + ", ".join(f"{t} — {n} строк" for t, n in sizes.items()))
+
+        bench_queries = queries[:args.queries]
+        # Холостой прогон: первые замеры после заполнения копии заметно медленнее
+        benchmark(conn, bench_queries, 1, args.limit, args.timeout)
+        before = benchmark(conn, bench_queries, args.repeat, args.limit, args.timeout)
+        used = select_indexes(conn, candidates, queries, args.max_candidates)
+        gains = prune_indexes(conn, used, queries, args.repeat, args.limit, args.timeout, args.min_gain)
+        after = benchmark(conn, bench_queries, args.repeat, args.limit, args.timeout)
+        conn.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\n=== Выбранные индексы (вес — частота запросов, которые их используют; ускорение этих запросов) ===")
+    for (table, columns), weight in used.most_common():
+        print(f"{weight:>7}  x{gains[(table, columns)]:<6.1f} {create_index_sql(table, columns)};")
+
+    print("\n=== Время запросов на копии, мс (до / после) ===")
+    for sql, count in bench_queries:
+        b, a = before[sql], after[sql]
+        speedup = f"x{b / a:.1f}" if b is not None and a else ""
+        print(f"{_ms(b)} {_ms(a)} {speedup:>7}  ({count}) {sql[:90]}")
+    weighted = [(before[sql], after[sql], count) for sql, count in bench_queries
+                if before[sql] is not None and after[sql] is not None]
+    if weighted:
+        total_before = sum(b * c for b, _, c in weighted)
+        total_after = sum(a * c for _, a, c in weighted)
+        print(f"\nСумма времени с учётом частоты запросов: {total_before:.1f} -> {total_after:.1f} мс")
+
+    report = {
+        "scale": args.scale,
+        "rows": sizes,
+        "indexes": [{"sql": create_index_sql(t, c), "table": t, "columns": list(c), "weight": w,
+                     "gain": gains[(t, c)]}
+                    for (t, c), w in used.most_common()],
+        "queries": [{"sql": sql, "count": count, "before_ms": before[sql], "after_ms": after[sql]}
+                    for sql, count in bench_queries],
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.apply:
+        apply_indexes(args.db, list(used))
+        print(f"Индексы созданы в {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import importlib.util
+
+import torch
+from transformers import T5ForConditionalGeneration, T5Tokenizer
+
+from telemetry import BATCH_SIZE, GENERATED_TOKENS, STAGE_SECONDS
+
+PROMPT_PREFIX = "translate Russian to SQL: "
+DEFAULT_MODEL_DIR = "data/model_t5_sql"
+
+
+def load_model(model_dir=DEFAULT_MODEL_DIR, device=torch.device("cpu")):
+    """
+    Загружает токенизатор и модель T5 и переводит модель в режим инференса.
+    Веса из model.safetensors читаются через mmap; с пакетом accelerate
+    модель создаётся без промежуточной случайной инициализации.
+    """
+    tokenizer = T5Tokenizer.from_pretrained(model_dir)
+    model = T5ForConditionalGeneration.from_pretrained(
+        model_dir,
+        low_cpu_mem_usage=importlib.util.find_spec("accelerate") is not None
+    )
+    model = model.to(device)
+    model.eval()
+    return tokenizer, model
+
+
+def generate_sql_batch(tokenizer, model, texts, max_length=128, num_beams=1, device=torch.device("cpu"),
+                       logits_processor=None):
+    """
+    Генерирует SQL сразу для нескольких вопросов одним вызовом model.generate.
+
+    Вопросы дополняются паддингом до длины самого длинного в пакете,
+    результат возвращается в том же порядке, что и texts.
+    logits_processor (например, SchemaLogitsProcessor) ограничивает
+    допустимые токены на каждом шаге декодирования.
+    """
+    prompts = [PROMPT_PREFIX + text for text in texts]
+    with STAGE_SECONDS.time(stage="tokenize"):
+        inputs = tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            max_length=max_length,
+            truncation=True
+        ).to(device)
+    with torch.no_grad(), STAGE_SECONDS.time(stage="decode"):
+        outputs = model.generate(**inputs, max_length=max_length, num_beams=num_beams,
+                                 logits_processor=logits_processor)
+    BATCH_SIZE.observe(len(texts))
+    # Первый токен — decoder_start_token, паддинг не считаем
+    GENERATED_TOKENS.inc(int((outputs[:, 1:] != tokenizer.pad_token_id).sum()))
+    with STAGE_SECONDS.time(stage="detokenize"):
+        return tokenizer.batch_decode(outputs, skip_special_tokens=True)
@@ -0,0 +1,132 @@
+"""
+Аналитика по логу взаимодействий в SQLite (logs/interactions.db).
+
+Запросы читают сводные таблицы question_stats / daily_stats и индексы,
+которые поддерживает log_interaction.SqliteLogSink, поэтому не требуют
+полного прохода по логу.
+
+Примеры:
+    python log_analytics.py --import-csv logs/interaction_log.csv
+    python log_analytics.py --top 10
+"""
+import argparse
+import csv
+
+from log_interaction import LOG_DB, connect_log_db, parse_latency, parse_sql_valid
+
+
+def top_questions(conn, limit=10):
+    """
+    Самые частые вопросы: [(user_input, total, last_ts), ...].
+    """
+    return conn.execute(
+        "SELECT user_input, total, last_ts FROM question_stats ORDER BY total DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+
+
+def error_rate_per_day(conn, since=None):
+    """
+    Доля невалидного SQL по дням: [(day, total, error_rate), ...].
+    Учитываются только записи, где sql_valid был проверен.
+    """
+    return conn.execute(
+        "SELECT day, total, CASE WHEN checked > 0 THEN 1.0 * (checked - valid) / checked END "
+        "FROM daily_stats WHERE day >= ? ORDER BY day",
+        (since or "",)
+    ).fetchall()
+
+
+def sql_validity_ratio(conn):
+    """
+    Доля валидного SQL среди всех проверенных запросов.
+    """
+    checked, valid = conn.execute("SELECT sum(checked), sum(valid) FROM daily_stats").fetchone()
+    return valid / checked if checked else None
+
+
+def latency_percentiles(conn, percentiles=(50, 95, 99)):
+    """
+    Перцентили времени обработки запроса, мс: {50: ..., 95: ..., 99: ...}.
+    Значения берутся по индексу idx_interactions_latency без сортировки таблицы.
+    """
+    count = conn.execute(
+        "SELECT count(*) FROM interactions INDEXED BY idx_interactions_latency WHERE latency_ms IS NOT NULL"
+    ).fetchone()[0]
+    result = {}
+    for p in percentiles:
+        if not count:
+            result[p] = None
+            continue
+        offset = min(count - 1, int(p / 100 * count))
+        result[p] = conn.execute(
+            "SELECT latency_ms FROM interactions INDEXED BY idx_interactions_latency "
+            "WHERE latency_ms IS NOT NULL ORDER BY latency_ms LIMIT 1 OFFSET ?",
+            (offset,)
+        ).fetchone()[0]
+    return result
+
+
+def import_csv(conn, csv_path):
+    """
+    Загружает CSV-лог (в том числе старого формата) в SQLite. Возвращает число строк.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [
+            (
+                row["timestamp"],
+                row["timestamp"][:10],
+                row.get("user_input") or "",
+                row.get("predicted_sql") or row.get("generated_sql") or "",
+                parse_sql_valid(row.get("sql_valid", "")),
+                row.get("source") or "",
+                row.get("notes") or "",
+                parse_latency(row.get("latency_ms")),
+                row.get("trace_id") or None,
+            )
+            for row in csv.DictReader(f)
+            if row.get("timestamp")
+        ]
+    with conn:
+        conn.executemany(
+            "INSERT INTO interactions "
+            "(ts, day, user_input, predicted_sql, sql_valid, source, notes, latency_ms, trace_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=LOG_DB)
+    parser.add_argument("--import-csv", help="Сначала загрузить CSV-лог в базу")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--since", help="Начальная дата для статистики по дням (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    conn = connect_log_db(args.db)
+    if args.import_csv:
+        print(f"Загружено строк: {import_csv(conn, args.import_csv)}")
+
+    print("=== Частые вопросы ===")
+    for user_input, total, last_ts in top_questions(conn, args.top):
+        print(f"{total:>6}  {last_ts}  {user_input}")
+
+    print("\n=== Ошибки по дням ===")
+    for day, total, error_rate in error_rate_per_day(conn, args.since):
+        rate = f"{error_rate:.1%}" if error_rate is not None else "—"
+        print(f"{day}  запросов: {total:>6}  ошибок: {rate}")
+
+    ratio = sql_validity_ratio(conn)
+    print(f"\nДоля валидного SQL: {ratio:.1%}" if ratio is not None else "\nДоля валидного SQL: нет данных")
+
+    latency = latency_percentiles(conn)
+    print("Задержка, мс: " + ", ".join(
+        f"p{p}={v:.1f}" if v is not None else f"p{p}=—" for p, v in latency.items()
+    ))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
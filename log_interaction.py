@@ -1,39 +1,426 @@
+import atexit
 import csv
+import glob
+import io
 import os
+import queue
+import re
+import sqlite3
+import threading
+import time
 from datetime import datetime
 from typing import Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
 LOG_FILE = "logs/interaction_log.csv"
+LOG_DB = "logs/interactions.db"
+# Отметки пользователя об ответе: notes строки с source="feedback" (POST /feedback в app.py)
+FEEDBACK_CORRECT = "верно"
+FEEDBACK_WRONG = "неверно"
+LOG_HEADER = ["timestamp", "user_input", "predicted_sql", "sql_valid", "source", "notes", "latency_ms", "trace_id"]
+# Куда писать лог: "csv", "sqlite" или "csv,sqlite"
+LOG_BACKEND = os.environ.get("SQLBOT_LOG_BACKEND", "csv")
+
+# Параметры буферизации и ротации
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 1.0  # секунды
+LOG_MAX_BYTES = 50 * 1024 * 1024
+
+
+def log_files(log_file=LOG_FILE):
+    """
+    Ротированные копии лога (interaction_log.2025-06-01.csv,
+    interaction_log.2025-06-01.1.csv, ...) в порядке записи и затем сам лог.
+    Читателям лога нужны все файлы: ротация переименовывает текущий.
+    """
+    base, ext = os.path.splitext(log_file)
+    pattern = re.compile(re.escape(os.path.basename(base)) + r"\.(\d{4}-\d{2}-\d{2})(?:\.(\d+))?" + re.escape(ext) + "$")
+    rotated = []
+    for path in glob.glob(f"{glob.escape(base)}.*{ext}"):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            rotated.append((match.group(1), int(match.group(2) or 0), path))
+    files = [path for _, _, path in sorted(rotated)]
+    if os.path.exists(log_file):
+        files.append(log_file)
+    return files
+
+
+class BufferedLogWriter:
+    """
+    Фоновая запись лога взаимодействий.
+
+    Строки попадают в ограниченную очередь, поток-писатель забирает их
+    пачками и передаёт в каждый из sinks (CsvLogSink, SqliteLogSink),
+    когда набралось batch_size строк или прошло flush_interval секунд.
+    """
+
+    def __init__(self, sinks, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="interaction-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        if self._closed:
+            self._write_rows([row])
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Очередь переполнена: пишем синхронно, чтобы не потерять запись
+            self._write_rows([row])
+
+    def flush(self):
+        """
+        Блокирует вызывающего, пока все поставленные в очередь строки не будут записаны.
+        """
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        for sink in self.sinks:
+            sink.close()
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write_rows(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                break
+
+    def _write_rows(self, rows):
+        with self._write_lock:
+            for sink in self.sinks:
+                try:
+                    sink.write_rows(rows)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"Не удалось записать лог взаимодействий ({type(sink).__name__}): {e}")
+
+
+class CsvLogSink:
+    """
+    Дописывает пачки строк в CSV одним вызовом write. Файл ротируется
+    при превышении max_bytes и при смене даты. Запись защищена файловой
+    блокировкой, поэтому несколько процессов не перемешивают строки.
+    Лог со старым заголовком (не LOG_HEADER) перед первой записью уходит
+    в ротированную копию: читатели разбирают каждый файл по его заголовку.
+    """
+
+    def __init__(self, log_file=LOG_FILE, max_bytes=LOG_MAX_BYTES):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self._header_checked = False
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+    def write_rows(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        data = buffer.getvalue()
+        with _FileLock(self.log_file + ".lock"):
+            if not self._header_checked:
+                self._rotate_if_old_header()
+                self._header_checked = True
+            self._rotate_if_needed()
+            new_file = not os.path.exists(self.log_file)
+            with open(self.log_file, mode="a", newline='', encoding="utf-8") as f:
+                if new_file:
+                    csv.writer(f).writerow(LOG_HEADER)
+                f.write(data)
+
+    def close(self):
+        pass
+
+    def _rotate_if_old_header(self):
+        # Новые файлы создаются с LOG_HEADER, поэтому достаточно проверить один раз
+        try:
+            with open(self.log_file, newline='', encoding="utf-8") as f:
+                header = next(csv.reader(f), None)
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            return
+        if header is not None and header != LOG_HEADER:
+            self._rotate(datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d"))
+
+    def _rotate_if_needed(self):
+        try:
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            return
+        file_date = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d")
+        today = datetime.now().strftime("%Y-%m-%d")
+        if stat.st_size < self.max_bytes and file_date == today:
+            return
+        self._rotate(file_date)
+
+    def _rotate(self, file_date):
+        base, ext = os.path.splitext(self.log_file)
+        target = f"{base}.{file_date}{ext}"
+        n = 1
+        while os.path.exists(target):
+            target = f"{base}.{file_date}.{n}{ext}"
+            n += 1
+        os.replace(self.log_file, target)
+
+
+def parse_sql_valid(value):
+    value = str(value).strip().lower()
+    if value in ("true", "ok", "1"):
+        return 1
+    if value in ("false", "error", "0"):
+        return 0
+    return None
+
+
+def parse_latency(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SqliteLogSink:
+    """
+    Пишет лог в индексированную таблицу SQLite (logs/interactions.db).
+    Триггеры поддерживают сводные таблицы по вопросам и по дням,
+    поэтому аналитика (log_analytics.py) не сканирует весь лог.
+    """
+
+    def __init__(self, db_path=LOG_DB):
+        self.db_path = db_path
+        log_dir = os.path.dirname(db_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = connect_log_db(self.db_path)
+        return self._conn
+
+    def write_rows(self, rows):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO interactions "
+                "(ts, day, user_input, predicted_sql, sql_valid, source, notes, latency_ms, trace_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (ts, ts[:10], user_input, predicted_sql, parse_sql_valid(sql_valid), source, notes,
+                     parse_latency(latency), trace_id or None)
+                    for ts, user_input, predicted_sql, sql_valid, source, notes, latency, trace_id in rows
+                ]
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def connect_log_db(db_path=LOG_DB):
+    """
+    Открывает базу лога, создавая таблицы, индексы и триггеры при первом запуске.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS interactions (
+            id INTEGER PRIMARY KEY,
+            ts TEXT NOT NULL,
+            day TEXT NOT NULL,
+            user_input TEXT NOT NULL,
+            predicted_sql TEXT NOT NULL,
+            sql_valid INTEGER,
+            source TEXT,
+            notes TEXT,
+            latency_ms REAL,
+            trace_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_interactions_day ON interactions(day);
+        CREATE INDEX IF NOT EXISTS idx_interactions_latency ON interactions(latency_ms) WHERE latency_ms IS NOT NULL;
+
+        CREATE TABLE IF NOT EXISTS question_stats (
+            user_input TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            last_ts TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_question_stats_total ON question_stats(total);
+
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            checked INTEGER NOT NULL,
+            valid INTEGER NOT NULL
+        );
+    """)
+    # Базы, созданные до появления trace_id, дополняем колонкой
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(interactions)")}
+    if "trace_id" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE interactions ADD COLUMN trace_id TEXT")
+    trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_interactions_stats'"
+    ).fetchone()
+    if trigger is None or "feedback" not in trigger[0]:
+        # Старый триггер считал и отметки /feedback: заменяем его и пересчитываем сводки
+        with conn:
+            conn.execute("DROP TRIGGER IF EXISTS trg_interactions_stats")
+            conn.execute(STATS_TRIGGER)
+            if trigger is not None:
+                rebuild_stats(conn)
+    return conn
+
+
+# Сводки считают только запросы: отметки пользователя (source = 'feedback') не вопросы
+STATS_TRIGGER = """
+    CREATE TRIGGER trg_interactions_stats AFTER INSERT ON interactions
+    WHEN NEW.source IS NOT 'feedback'
+    BEGIN
+        INSERT INTO question_stats (user_input, total, last_ts) VALUES (NEW.user_input, 1, NEW.ts)
+            ON CONFLICT(user_input) DO UPDATE SET total = total + 1, last_ts = max(last_ts, NEW.ts);
+        INSERT INTO daily_stats (day, total, checked, valid)
+            VALUES (NEW.day, 1, NEW.sql_valid IS NOT NULL, coalesce(NEW.sql_valid, 0))
+            ON CONFLICT(day) DO UPDATE SET
+                total = total + 1,
+                checked = checked + (NEW.sql_valid IS NOT NULL),
+                valid = valid + coalesce(NEW.sql_valid, 0);
+    END
+"""
+
+
+def rebuild_stats(conn):
+    """
+    Пересчитывает question_stats и daily_stats по таблице interactions.
+    """
+    conn.execute("DELETE FROM question_stats")
+    conn.execute("DELETE FROM daily_stats")
+    conn.execute(
+        "INSERT INTO question_stats (user_input, total, last_ts) "
+        "SELECT user_input, count(*), max(ts) FROM interactions "
+        "WHERE source IS NOT 'feedback' GROUP BY user_input"
+    )
+    conn.execute(
+        "INSERT INTO daily_stats (day, total, checked, valid) "
+        "SELECT day, count(*), count(sql_valid), coalesce(sum(sql_valid), 0) FROM interactions "
+        "WHERE source IS NOT 'feedback' GROUP BY day"
+    )
+
+
+class _FileLock:
+    # Эксклюзивная блокировка через flock; без fcntl ничего не делает
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._f = open(self.path, "a")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def make_sinks(backend=LOG_BACKEND):
+    sinks = []
+    for name in backend.split(","):
+        name = name.strip()
+        if name == "csv":
+            sinks.append(CsvLogSink(LOG_FILE))
+        elif name == "sqlite":
+            sinks.append(SqliteLogSink(LOG_DB))
+        elif name:
+            raise ValueError(f"Неизвестный бэкенд лога: {name}")
+    return sinks
+
+
+def get_writer():
+    """
+    Возвращает писатель лога текущего процесса (после fork создаётся новый).
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = BufferedLogWriter(make_sinks())
+            atexit.register(_writer.close)
+        return _writer
 
-# Проверка, существует ли лог, иначе создаём с заголовком
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, mode="w", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "user_input", "predicted_sql", "sql_valid", "source", "notes"])
 
 def log_interaction(
     user_input: str,
     predicted_sql: str,
     sql_valid: Optional[bool] = None,
     source: str = "inference",
-    notes: Optional[str] = ""
+    notes: Optional[str] = "",
+    latency_ms: Optional[float] = None,
+    trace_id: Optional[str] = None
 ):
     """
     Логирует взаимодействие пользователя с моделью.
+    Запись ставится в очередь и сохраняется на диск фоновым потоком.
 
     :param user_input: Входной текст на естественном языке
     :param predicted_sql: Предсказанный SQL
     :param sql_valid: True/False, если выполнялась проверка синтаксиса SQL
-    :param source: "inference", "api", "batch_eval", "interactive", и т.п.
+    :param source: Откуда взят SQL ("model", "cache", "template", "retrieval"),
+                   "feedback" для отметки пользователя, "batch_eval" и т.п.
     :param notes: Доп. комментарии (например, ошибка, feedback)
+    :param latency_ms: Время обработки запроса в миллисекундах
+    :param trace_id: Идентификатор трассы запроса (заголовок X-Trace-Id)
     """
-    with open(LOG_FILE, mode="a", newline='', encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            user_input.strip(),
-            predicted_sql.strip(),
-            sql_valid if sql_valid is not None else "",
-            source,
-            notes
-        ])
+    get_writer().write([
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        user_input.strip(),
+        predicted_sql.strip(),
+        sql_valid if sql_valid is not None else "",
+        source,
+        notes,
+        round(latency_ms, 1) if latency_ms is not None else "",
+        trace_id or ""
+    ])
@@ -1,50 +1,171 @@
+"""
+Оценка точности (Exact Match) и BLEU модели на тестовой выборке.
+
+Вопросы сортируются по длине и генерируются пакетами; при --workers > 1
+пакеты распределяются по процессам, каждый со своей долей потоков torch.
+Предсказания дописываются в data/evaluation_results.partial.csv по мере
+готовности, поэтому прерванный запуск продолжается с места остановки.
+Каждая строка помечена отпечатком модели: файл от другой модели
+(например, после переобучения) отбрасывается.
+
+Пример:
+    python metrics.py --batch-size 32 --workers 2
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import torch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.metrics import accuracy_score
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 
-# Загружаем модель и токенизатор
-model_path = 'data/model_t5_sql'
-model = T5ForConditionalGeneration.from_pretrained(model_path)
-tokenizer = T5Tokenizer.from_pretrained(model_path)
-model.eval()
-
-# Загружаем и подготавливаем данные
-data = pd.read_csv('data/training_data.csv')[['text', 'sql']].dropna()
-train, test = train_test_split(data, test_size=0.1, random_state=42)
-
-# Функция для генерации SQL по тексту
-def generate_sql(input_text):
-    input_ids = tokenizer.encode("translate Russian to SQL: " + input_text, return_tensors="pt", max_length=64, truncation=True)
-    with torch.no_grad():
-        output_ids = model.generate(input_ids, max_length=64)
-    return tokenizer.decode(output_ids[0], skip_special_tokens=True)
-
-# Сравнение предсказаний с эталоном
-y_true = test['sql'].tolist()
-y_pred = [generate_sql(txt) for txt in test['text'].tolist()]
-
-# Приведение строк к нижнему регистру и удаление лишних пробелов
-y_true_clean = [s.strip().lower() for s in y_true]
-y_pred_clean = [s.strip().lower() for s in y_pred]
-
-# Accuracy — строгое совпадение
-exact_match_accuracy = accuracy_score(y_true_clean, y_pred_clean)
-
-# BLEU — оценка сходства текстов
-bleu_scores = [sentence_bleu([ref.split()], hyp.split(), smoothing_function=SmoothingFunction().method1)
-               for ref, hyp in zip(y_true_clean, y_pred_clean)]
-avg_bleu = sum(bleu_scores) / len(bleu_scores)
-
-print(f"Exact Match Accuracy: {exact_match_accuracy:.2%}")
-print(f"Average BLEU Score: {avg_bleu:.2f}")
-
-# Можно также сохранить результаты
-results = pd.DataFrame({
-    'Input': test['text'],
-    'Expected SQL': y_true,
-    'Predicted SQL': y_pred
-})
-results.to_csv('data/evaluation_results.csv', index=False)
\ No newline at end of file
+from inference import DEFAULT_MODEL_DIR, generate_sql_batch, load_model
+from question_cache import model_fingerprint
+
+RESULTS_FILE = 'data/evaluation_results.csv'
+PARTIAL_FILE = 'data/evaluation_results.partial.csv'
+MAX_LENGTH = 64
+
+
+def load_test_split(data_path='data/training_data.csv'):
+    # Загружаем и подготавливаем данные (то же разбиение, что и раньше)
+    data = pd.read_csv(data_path)[['text', 'sql']].dropna()
+    train, test = train_test_split(data, test_size=0.1, random_state=42)
+    return test.reset_index(drop=True)
+
+
+def make_batches(items, batch_size):
+    """
+    Разбивает [(idx, text), ...] на пакеты из вопросов близкой длины,
+    чтобы паддинг внутри пакета был минимальным.
+    """
+    ordered = sorted(items, key=lambda item: len(item[1]))
+    return [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+
+
+def read_partial(path, texts, fingerprint):
+    """
+    Уже посчитанные предсказания {idx: sql} из незавершённого запуска.
+    Строки, не совпадающие с текущей выборкой, игнорируются; файл,
+    записанный другой моделью, удаляется целиком.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    if 'model' not in (reader.fieldnames or []) or any(row['model'] != fingerprint for row in rows):
+        print(f"{path} записан другой моделью, начинаем заново")
+        os.remove(path)
+        return done
+    for row in rows:
+        idx = int(row['idx'])
+        if idx < len(texts) and texts[idx] == row['Input']:
+            done[idx] = row['Predicted SQL']
+    return done
+
+
+# Состояние процесса-воркера (для --workers > 1)
+_worker_model = None
+
+
+def _init_worker(model_dir, num_threads):
+    global _worker_model
+    torch.set_num_threads(num_threads)
+    _worker_model = load_model(model_dir)
+
+
+def _generate_batch_in_worker(batch):
+    tokenizer, model = _worker_model
+    preds = generate_sql_batch(tokenizer, model, [text for _, text in batch], max_length=MAX_LENGTH)
+    return [(idx, text, pred) for (idx, text), pred in zip(batch, preds)]
+
+
+def run_generation(texts, model_dir, batch_size, workers, partial_path):
+    fingerprint = model_fingerprint(model_dir)
+    done = read_partial(partial_path, texts, fingerprint)
+    pending = [(idx, text) for idx, text in enumerate(texts) if idx not in done]
+    batches = make_batches(pending, batch_size)
+    if done:
+        print(f"Продолжаем прерванный запуск: готово {len(done)} из {len(texts)}")
+
+    new_file = not os.path.exists(partial_path)
+    with open(partial_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['idx', 'Input', 'Predicted SQL', 'model'])
+
+        def save(results):
+            for idx, text, pred in results:
+                done[idx] = pred
+                writer.writerow([idx, text, pred, fingerprint])
+            f.flush()
+
+        if workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                     initargs=(model_dir, threads)) as pool:
+                for results in pool.map(_generate_batch_in_worker, batches):
+                    save(results)
+        else:
+            tokenizer, model = load_model(model_dir)
+            for batch in batches:
+                preds = generate_sql_batch(tokenizer, model, [text for _, text in batch], max_length=MAX_LENGTH)
+                save([(idx, text, pred) for (idx, text), pred in zip(batch, preds)])
+
+    return [done[idx] for idx in range(len(texts))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    parser.add_argument('--data', default='data/training_data.csv')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов генерации')
+    args = parser.parse_args()
+
+    test = load_test_split(args.data)
+    texts = test['text'].tolist()
+
+    start = time.perf_counter()
+    y_pred = run_generation(texts, args.model_dir, args.batch_size, args.workers, PARTIAL_FILE)
+    elapsed = time.perf_counter() - start
+
+    # Сравнение предсказаний с эталоном
+    y_true = test['sql'].tolist()
+
+    # Приведение строк к нижнему регистру и удаление лишних пробелов
+    y_true_clean = [s.strip().lower() for s in y_true]
+    y_pred_clean = [s.strip().lower() for s in y_pred]
+
+    # Accuracy — строгое совпадение
+    exact_match_accuracy = accuracy_score(y_true_clean, y_pred_clean)
+
+    # BLEU — оценка сходства текстов
+    bleu_scores = [sentence_bleu([ref.split()], hyp.split(), smoothing_function=SmoothingFunction().method1)
+                   for ref, hyp in zip(y_true_clean, y_pred_clean)]
+    avg_bleu = sum(bleu_scores) / len(bleu_scores)
+
+    print(f"Exact Match Accuracy: {exact_match_accuracy:.2%}")
+    print(f"Average BLEU Score: {avg_bleu:.2f}")
+    print(f"Время: {elapsed:.1f} с, {len(texts) / max(elapsed, 1e-9):.1f} примеров/с")
+
+    # Сохраняем результаты в исходном порядке и убираем промежуточный файл
+    results = pd.DataFrame({
+        'Input': test['text'],
+        'Expected SQL': y_true,
+        'Predicted SQL': y_pred
+    })
+    results.to_csv(RESULTS_FILE, index=False)
+    os.remove(PARTIAL_FILE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Кэш токенизированного обучающего датасета.
+
+Токенизация выполняется один раз: результат сохраняется через
+DatasetDict.save_to_disk (Arrow) и при следующих запусках открывается
+load_from_disk без повторного map — файлы отображаются в память, а не
+читаются целиком. Ключ кэша — хеш словаря токенизатора, контрольная сумма
+CSV и параметры токенизации, поэтому другие данные или другой токенизатор
+дают новый каталог, а не устаревший кэш.
+
+В каждой строке хранится столбец length (длина входа): с ним
+TrainingArguments(group_by_length=True) собирает батчи из примеров близкой
+длины, и DataCollatorForSeq2Seq почти не добавляет паддинг. Валидация
+отсортирована по длине по той же причине.
+
+Пример:
+    python model/dataset_cache.py --tokenizer cointegrated/rut5-small --batch-size 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+DATA_PATH = "data/training_data.csv"
+CACHE_ROOT = "data/tokenized_cache"
+PROMPT_PREFIX = "translate Russian to SQL: "
+# Меняется при изменении формата кэша: старые каталоги перестают подходить
+CACHE_FORMAT = 1
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    Хеш того, что влияет на токенизацию: модель SentencePiece (или словарь)
+    и специальные токены.
+    """
+    digest = hashlib.sha256(type(tokenizer).__name__.encode())
+    sp_model = getattr(tokenizer, "sp_model", None)
+    if sp_model is not None:
+        digest.update(sp_model.serialized_model_proto())
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode())
+    digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, ensure_ascii=False).encode())
+    digest.update(str(len(tokenizer)).encode())
+    return digest.hexdigest()
+
+
+def cache_key(tokenizer, data_path, max_length=64, val_fraction=0.1, prefix=PROMPT_PREFIX):
+    import datasets
+    import transformers
+
+    params = {
+        "format": CACHE_FORMAT,
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "data": file_checksum(data_path),
+        "max_length": max_length,
+        "val_fraction": val_fraction,
+        "prefix": prefix,
+        "transformers": transformers.__version__,
+        "datasets": datasets.__version__,
+    }
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return key, params
+
+
+def read_pairs(data_path):
+    import pandas as pd
+
+    data = pd.read_csv(data_path)
+    return data[["text", "sql"]].dropna()
+
+
+def build(tokenizer, data, max_length=64, val_fraction=0.1, prefix=PROMPT_PREFIX, num_proc=None):
+    """
+    DatasetDict train/validation с input_ids, attention_mask, labels и length.
+    Деление по порядку строк, как и раньше в train_model.py.
+    """
+    from datasets import Dataset, DatasetDict
+
+    split_idx = int(len(data) * (1 - val_fraction))
+    dataset = DatasetDict({
+        "train": Dataset.from_pandas(data.iloc[:split_idx], preserve_index=False),
+        "validation": Dataset.from_pandas(data.iloc[split_idx:], preserve_index=False),
+    })
+
+    def preprocess(batch):
+        encoded = tokenizer(
+            [prefix + text for text in batch["text"]],
+            text_target=batch["sql"],
+            max_length=max_length,
+            truncation=True,
+        )
+        encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+        return encoded
+
+    tokenized = dataset.map(preprocess, batched=True, num_proc=num_proc,
+                            remove_columns=dataset["train"].column_names)
+    tokenized["validation"] = tokenized["validation"].sort("length")
+    return tokenized
+
+
+def load_or_build(tokenizer, data_path=DATA_PATH, cache_root=CACHE_ROOT, max_length=64,
+                  val_fraction=0.1, prefix=PROMPT_PREFIX, num_proc=None, expected_rows=None):
+    """
+    Токенизированный датасет из кэша; при промахе строит и сохраняет его.
+    Каталог кэша записывается во временный и переименовывается целиком,
+    поэтому прерванная сборка не оставляет битого кэша.
+    """
+    from datasets import load_from_disk
+
+    key, params = cache_key(tokenizer, data_path, max_length, val_fraction, prefix)
+    path = os.path.join(cache_root, key)
+    if os.path.exists(os.path.join(path, "cache_meta.json")):
+        print(f"Токенизированный датасет из кэша {path}")
+        return load_from_disk(path)
+
+    start = time.perf_counter()
+    data = read_pairs(data_path)
+    if expected_rows is not None:
+        assert len(data) == expected_rows, f"В датасете {len(data)} строк, ожидается {expected_rows}"
+    tokenized = build(tokenizer, data, max_length, val_fraction, prefix, num_proc)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tokenized.save_to_disk(tmp_path)
+    meta = {**params, "data_path": data_path, "rows": {name: len(split) for name, split in tokenized.items()}}
+    with open(os.path.join(tmp_path, "cache_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Кэш с тем же ключом уже собрал параллельный запуск
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    print(f"Датасет токенизирован за {time.perf_counter() - start:.1f} с и сохранён в {path}")
+    return load_from_disk(path)
+
+
+def padding_share(lengths, batch_size, grouped, seed=0):
+    """
+    Доля паддинга во входах при батчах размера batch_size: случайные батчи
+    или сгруппированные по длине (как LengthGroupedSampler: мегабатчи
+    по 50 батчей, отсортированные внутри).
+    """
+    lengths = np.asarray(lengths)
+    order = np.random.default_rng(seed).permutation(len(lengths))
+    if grouped:
+        mega = batch_size * 50
+        order = np.concatenate([
+            chunk[np.argsort(-lengths[chunk], kind="stable")]
+            for chunk in np.array_split(order, max(1, -(-len(order) // mega)))
+        ])
+    padded = sum(lengths[order[i:i + batch_size]].max() * len(order[i:i + batch_size])
+                 for i in range(0, len(order), batch_size))
+    return 1 - lengths.sum() / padded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--tokenizer", default="cointegrated/rut5-small")
+    parser.add_argument("--cache-root", default=CACHE_ROOT)
+    parser.add_argument("--max-length", type=int, default=64)
+    parser.add_argument("--num-proc", type=int, default=None, help="Процессов для токенизации")
+    parser.add_argument("--batch-size", type=int, default=16, help="Для оценки доли паддинга")
+    args = parser.parse_args()
+
+    from transformers import T5Tokenizer
+
+    tokenizer = T5Tokenizer.from_pretrained(args.tokenizer)
+    tokenized = load_or_build(tokenizer, args.data, args.cache_root, args.max_length, num_proc=args.num_proc)
+    lengths = tokenized["train"]["length"]
+    print(f"train: {len(tokenized['train'])}, validation: {len(tokenized['validation'])}, "
+          f"средняя длина входа: {np.mean(lengths):.1f}, максимальная: {max(lengths)}")
+    for grouped in (False, True):
+        share = padding_share(lengths, args.batch_size, grouped)
+        print(f"Паддинг при батче {args.batch_size} ({'по длине' if grouped else 'случайные батчи'}): {share:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,252 @@
-import pandas as pd
-from transformers import T5ForConditionalGeneration, T5Tokenizer, Trainer, TrainingArguments, DataCollatorForSeq2Seq
-from datasets import Dataset, DatasetDict
+"""
+Обучение T5 для генерации SQL по тексту на русском.
+
+Режим CPU (по умолчанию, если нет CUDA):
+- несколько процессов с DDP (бэкенд gloo), запуск через torchrun;
+  каждый процесс закреплён за своей частью ядер, чтобы потоки процессов
+  не вытесняли друг друга;
+- накопление градиента (--grad-accum): эффективный батч
+  batch_size x grad_accum x число процессов;
+- bf16-autocast, если процессор умеет bf16 (avx512_bf16 / amx_bf16);
+- чекпойнты каждые --save-steps шагов; после прерывания обучение
+  продолжается с последнего чекпойнта в --output-dir, если это тот же
+  запуск: метка run.json (ключ кэша датасета и исходная модель) совпадает.
+  Чекпойнты другого запуска удаляются, после успешного обучения метка
+  снимается;
+- в лог пишется скорость обучения в примерах в секунду.
+
+Пример:
+    python model/train_model.py
+    torchrun --nproc_per_node 4 model/train_model.py --grad-accum 2
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
 import torch
+from transformers import (DataCollatorForSeq2Seq, T5ForConditionalGeneration, T5Tokenizer, Trainer,
+                          TrainerCallback, TrainingArguments)
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR, get_last_checkpoint
+
+from dataset_cache import DATA_PATH, cache_key, load_or_build
+
+MODEL_NAME = 'cointegrated/rut5-small'  # Лучше для русского, чем t5-small
+MODEL_DIR = 'data/model_t5_sql'
+OUTPUT_DIR = 'data/results_t5_sql'
+EXPECTED_ROWS = 11144
+# Метка незавершённого запуска в --output-dir
+RUN_MARKER = 'run.json'
+
+
+def cpu_supports_bf16():
+    """
+    Есть ли у процессора инструкции bf16: без них bf16-autocast медленнее fp32.
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def pin_threads(local_rank, local_world_size, threads=None):
+    """
+    Закрепляет процесс за своей долей доступных ядер и задаёт число потоков torch.
+    Возвращает список ядер процесса.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    per_rank = threads or max(1, len(cores) // local_world_size)
+    mine = cores[local_rank * per_rank:(local_rank + 1) * per_rank] or cores
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, mine)
+    torch.set_num_threads(len(mine))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Уже задано: межоперационный пул создаётся при первой параллельной операции
+        pass
+    return mine
+
+
+def base_model_id(model_name):
+    """
+    Исходная модель для метки запуска: имя на Hub или, для каталога, его
+    настоящий путь и отпечаток файлов (каталог могли переобучить на месте).
+    """
+    if not os.path.isdir(model_name):
+        return model_name
+    path = os.path.realpath(model_name)
+    digest = hashlib.sha1()
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if entry.is_file():
+            stat = entry.stat()
+            digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}|".encode())
+    return f"{path}@{digest.hexdigest()[:12]}"
+
+
+def resume_checkpoint(output_dir, run, resume=True, main=True):
+    """
+    Последний чекпойнт незавершённого запуска с той же меткой run или None.
+    Главный процесс удаляет чекпойнты другого запуска и записывает метку
+    текущего; остальные процессы только читают (после главного).
+    """
+    marker = os.path.join(output_dir, RUN_MARKER)
+    previous = None
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as f:
+            previous = json.load(f)
+    if previous == run:
+        checkpoint = get_last_checkpoint(output_dir)
+        if resume and checkpoint:
+            return checkpoint
+    if main:
+        if os.path.isdir(output_dir):
+            for name in os.listdir(output_dir):
+                if name.startswith(PREFIX_CHECKPOINT_DIR):
+                    shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+        os.makedirs(output_dir, exist_ok=True)
+        with open(marker, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+    return None
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Скорость обучения в примерах в секунду (по всем процессам) за каждые
+    logging_steps шагов; значения попадают и в state.log_history.
+    """
 
-# 1. Загружаем данные
-data = pd.read_csv('data/training_data.csv')
-data = data[['text', 'sql']].dropna()
-assert len(data) == 11144, f"В датасете {len(data)} строк, ожидается 11144"
-
-# 2. Делим на train/val (например, 90/10)
-split_idx = int(len(data) * 0.9)
-train_df = data.iloc[:split_idx]
-val_df = data.iloc[split_idx:]
-
-dataset = DatasetDict({
-    'train': Dataset.from_pandas(train_df.rename(columns={'text': 'input_text', 'sql': 'target_text'})),
-    'validation': Dataset.from_pandas(val_df.rename(columns={'text': 'input_text', 'sql': 'target_text'}))
-})
-
-# 3. Загружаем токенизатор и модель
-model_name = 'cointegrated/rut5-small'  # Лучше для русского, чем t5-small
-tokenizer = T5Tokenizer.from_pretrained(model_name)
-model = T5ForConditionalGeneration.from_pretrained(model_name)
-
-# 4. Токенизация
-def preprocess(example):
-    # example['input_text'] — это список строк
-    inputs = ['translate Russian to SQL: ' + txt for txt in example['input_text']]
-    targets = example['target_text']
-    return tokenizer(
-        inputs,
-        text_target=targets,
-        max_length=64,
-        truncation=True
+    def __init__(self):
+        self._start = None
+        self._step = 0
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self._start is None:
+            self._start = time.perf_counter()
+            self._step = state.global_step
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if not args.logging_steps or state.global_step % args.logging_steps:
+            return
+        elapsed = time.perf_counter() - self._start
+        samples = ((state.global_step - self._step) * args.per_device_train_batch_size
+                   * args.gradient_accumulation_steps * args.world_size)
+        if state.is_world_process_zero and elapsed > 0:
+            record = {'step': state.global_step, 'samples_per_second': round(samples / elapsed, 2)}
+            state.log_history.append(record)
+            print(f"шаг {state.global_step}: {record['samples_per_second']} примеров/с")
+        self._start = time.perf_counter()
+        self._step = state.global_step
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-name', default=MODEL_NAME, help='Исходная модель (имя на Hub или каталог)')
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--expected-rows', type=int, default=None,
+                        help=f'Проверка числа строк; для {DATA_PATH} по умолчанию {EXPECTED_ROWS}')
+    parser.add_argument('--model-dir', default=MODEL_DIR, help='Куда сохранить обученную модель')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='Каталог чекпойнтов')
+    parser.add_argument('--epochs', type=float, default=2)
+    parser.add_argument('--batch-size', type=int, default=16, help='Батч на процесс')
+    parser.add_argument('--grad-accum', type=int, default=1, help='Шагов накопления градиента')
+    parser.add_argument('--learning-rate', type=float, default=3e-4)
+    parser.add_argument('--save-steps', type=int, default=200, help='Чекпойнт и оценка каждые N шагов')
+    parser.add_argument('--bf16', choices=['auto', 'yes', 'no'], default='auto')
+    parser.add_argument('--threads', type=int, default=None, help='Потоков на процесс (по умолчанию ядра / процессы)')
+    parser.add_argument('--no-resume', action='store_true', help='Не продолжать прерванный запуск')
+    parser.add_argument('--cpu', action='store_true', help='Обучать на CPU, даже если есть CUDA')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.path.islink(args.model_dir):
+        # Ссылка на выложенную версию (continuous_finetune.py): запись в неё подменила бы
+        # файлы модели, которую сейчас обслуживает приложение
+        raise SystemExit(f"{args.model_dir} — символическая ссылка на выложенную версию модели; "
+                         "укажите другой --model-dir или выкладывайте через continuous_finetune.py")
+    use_cpu = args.cpu or not torch.cuda.is_available()
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+    bf16 = args.bf16 == 'yes' or (args.bf16 == 'auto' and use_cpu and cpu_supports_bf16())
+    if use_cpu:
+        cores = pin_threads(local_rank, local_world_size, args.threads)
+        print(f"Процесс {local_rank}/{local_world_size}: ядра {cores[0]}-{cores[-1]}, bf16: {bf16}")
+
+    # 1. Аргументы обучения
+    training_args = TrainingArguments(
+        output_dir=args.output_dir,
+        use_cpu=use_cpu,
+        ddp_backend='gloo' if use_cpu else None,
+        ddp_find_unused_parameters=False,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.batch_size * 2,
+        gradient_accumulation_steps=args.grad_accum,
+        group_by_length=True,                 # Батчи из примеров близкой длины — меньше паддинга
+        length_column_name='length',
+        num_train_epochs=args.epochs,
+        learning_rate=args.learning_rate,
+        weight_decay=0.01,
+        bf16=bf16,
+        logging_steps=10,
+        save_strategy='steps',
+        save_steps=args.save_steps,
+        evaluation_strategy='steps',
+        eval_steps=args.save_steps,
+        save_total_limit=2,                   # Лучший и последний чекпойнт
+        report_to='none',
+        load_best_model_at_end=True,
+        metric_for_best_model='eval_loss'
     )
 
-tokenized = dataset.map(
-    preprocess,
-    batched=True,
-    remove_columns=dataset['train'].column_names
-)
-
-# 5. Аргументы обучения (адаптированы для маленького датасета)
-training_args = TrainingArguments(
-    output_dir='data/results_t5_sql',
-    per_device_train_batch_size=1,        # Можно уменьшить до 1-2 если не хватает памяти
-    per_device_eval_batch_size=1,         # Аналогично
-    num_train_epochs=2,                   # Сначала лучше попробовать 1-2 эпохи
-    learning_rate=3e-4,
-    weight_decay=0.01,
-    logging_steps=10,
-    save_strategy="epoch",
-    evaluation_strategy="epoch",
-    save_total_limit=1,
-    report_to="none",
-    load_best_model_at_end=True,
-    metric_for_best_model="eval_loss"
-)
-
-data_collator = DataCollatorForSeq2Seq(tokenizer, model=model)
-
-# 6. Trainer
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=tokenized['train'],
-    eval_dataset=tokenized['validation'],
-    data_collator=data_collator,
-)
-
-# 7. Обучение
-trainer.train()
-
-# 8. Сохраняем модель и токенизатор
-model.save_pretrained('data/model_t5_sql')
-tokenizer.save_pretrained('data/model_t5_sql')
-print("Обучение завершено, модель сохранена в data/model_t5_sql")
\ No newline at end of file
+    # 2. Токенизатор и модель
+    tokenizer = T5Tokenizer.from_pretrained(args.model_name)
+    model = T5ForConditionalGeneration.from_pretrained(args.model_name)
+
+    # 3. Данные: train/val 90/10, токенизация один раз — дальше из кэша data/tokenized_cache.
+    # Кэш собирает главный процесс, остальные читают готовый
+    expected_rows = args.expected_rows or (EXPECTED_ROWS if args.data == DATA_PATH else None)
+    with training_args.main_process_first(desc='токенизация'):
+        tokenized = load_or_build(tokenizer, args.data, max_length=64, val_fraction=0.1,
+                                  expected_rows=expected_rows)
+
+    # 4. Trainer
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized['train'],
+        eval_dataset=tokenized['validation'],
+        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model),
+        callbacks=[ThroughputCallback()],
+    )
+
+    # 5. Обучение, с последнего чекпойнта, если прерван тот же запуск (те же данные и исходная модель)
+    run = {'cache_key': cache_key(tokenizer, args.data, max_length=64, val_fraction=0.1)[0],
+           'model_name': base_model_id(args.model_name)}
+    with training_args.main_process_first(desc='метка запуска'):
+        checkpoint = resume_checkpoint(args.output_dir, run, resume=not args.no_resume,
+                                       main=training_args.local_process_index == 0)
+    if checkpoint:
+        print(f"Продолжаем обучение с {checkpoint}")
+    trainer.train(resume_from_checkpoint=checkpoint)
+
+    # 6. Сохраняем модель и токенизатор (в DDP — только главный процесс)
+    trainer.save_model(args.model_dir)
+    if trainer.is_world_process_zero():
+        tokenizer.save_pretrained(args.model_dir)
+        print(f"Обучение завершено, модель сохранена в {args.model_dir}")
+    if training_args.local_process_index == 0:
+        # Запуск завершён: следующий начнётся заново, а не с его чекпойнтов
+        os.remove(os.path.join(args.output_dir, RUN_MARKER))
+
+
+if __name__ == '__main__':
+    main()
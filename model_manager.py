@@ -0,0 +1,204 @@
+"""
+Управление загрузкой модели.
+
+ModelManager откладывает загрузку (импорт torch/transformers, чтение весов,
+проверку точности бэкенда) до момента, когда модель действительно нужна:
+- "eager"      — сразу в start(); так грузится мастер-процесс gunicorn с
+                 preload_app, и воркеры после fork делят страницы весов;
+- "background" — в фоновом потоке, приложение отвечает сразу, а /ready
+                 сообщает, когда модель загружена;
+- "lazy"       — при первом вызове get().
+
+Импорт app.py (тесты, flask CLI) модель не загружает.
+
+Неудачная загрузка запоминается: следующие retry_after секунд get() сразу
+поднимает ошибку, а не повторяет загрузку на каждом запросе.
+
+reload() загружает новую версию модели в фоне и подменяет ей текущую
+(swap): пока новая грузится, вопросы обслуживает прежняя, а вызовы, уже
+получившие прежнюю модель, дорабатывают на ней — запросы не теряются.
+
+Пример (перевести веса в safetensors, которые читаются через mmap):
+    python model_manager.py --convert data/model_t5_sql
+"""
+import argparse
+import os
+import threading
+import time
+
+LOAD_MODES = ("eager", "background", "lazy")
+
+
+class ModelManager:
+    """
+    Хранит объект, который возвращает load() (например, функцию генерации
+    поверх бэкенда), и загружает его не больше одного раза. load()
+    возвращает (модель, версия) — версию тех файлов, которые он на самом
+    деле прочитал: каталог модели могут подменить, пока идёт загрузка.
+    on_version(version) вызывается, когда загруженная версия меняется,
+    on_swap(version) — после каждой подмены модели (reload, swap).
+    """
+
+    def __init__(self, load, version=None, retry_after=30.0):
+        self._load = load
+        self.retry_after = retry_after
+        self._failed_at = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self.state = "idle"
+        self.error = None
+        self.load_seconds = None
+        # Версия модели (например, model_fingerprint каталога); меняется при swap
+        self.version = version
+        self.reloads = 0
+        self.reload_error = None
+        self.failed_version = None
+        self.on_version = None
+        self.on_swap = None
+
+    def start(self, mode="background"):
+        if mode not in LOAD_MODES:
+            raise ValueError(f"Неизвестный режим загрузки: {mode}. Доступны: {', '.join(LOAD_MODES)}")
+        if mode == "eager":
+            self._load_once()
+        elif mode == "background":
+            self._thread = threading.Thread(target=self._warm_up, name="model-warm-up", daemon=True)
+            self._thread.start()
+
+    def _warm_up(self):
+        try:
+            self._load_once()
+        except Exception as e:
+            print(f"Не удалось загрузить модель: {e}")
+
+    def _load_once(self, timeout=-1):
+        # Параллельные вызовы ждут на блокировке, пока первый не загрузит модель
+        if not self._lock.acquire(timeout=timeout):
+            raise TimeoutError(f"Модель не загрузилась за {timeout} с")
+        previous = self.version
+        try:
+            if self._model is not None:
+                return self._model
+            if self.state == "failed" and time.monotonic() - self._failed_at < self.retry_after:
+                raise RuntimeError(f"Модель не загружена: {self.error}")
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                model, version = self._load()
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                self._failed_at = time.monotonic()
+                raise
+            self.load_seconds = time.perf_counter() - start
+            self._model, self.version, self.state, self.error = model, version, "ready", None
+        finally:
+            self._lock.release()
+        if self.version != previous and self.on_version is not None:
+            self.on_version(self.version)
+        return model
+
+    def get(self, timeout=None):
+        """
+        Загруженная модель; если она ещё не готова, ждёт загрузки
+        (не дольше timeout секунд) или загружает сама. После неудачной
+        загрузки повторная попытка — не раньше чем через retry_after секунд.
+        """
+        model = self._model
+        if model is not None:
+            return model
+        return self._load_once(-1 if timeout is None else timeout)
+
+    def reload(self, version=None, wait=False):
+        """
+        Загружает модель заново в фоновом потоке и подменяет текущую.
+        version — ожидаемая версия: при неудаче она запоминается в
+        failed_version; после подмены version — та, что загружена на самом
+        деле. Возвращает False, если перезагрузка уже идёт.
+        """
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(version,), name="model-reload", daemon=True
+            )
+            self._reload_thread.start()
+        if wait:
+            self._reload_thread.join()
+        return True
+
+    def _reload(self, version):
+        start = time.perf_counter()
+        try:
+            model, loaded = self._load()
+        except Exception as e:
+            # Прежняя модель продолжает работать; эту версию повторно не грузим
+            self.reload_error, self.failed_version = str(e), version
+            print(f"Не удалось загрузить новую версию модели {version}: {e}")
+            return
+        self.swap(model, loaded, time.perf_counter() - start)
+
+    def swap(self, model, version=None, load_seconds=None):
+        """
+        Подменяет модель: следующие get() вернут новую.
+        """
+        with self._lock:
+            previous = self.version
+            self._model = model
+            self.version = version
+            self.state, self.error = "ready", None
+            self.reloads += 1
+            self.reload_error = None
+            if load_seconds is not None:
+                self.load_seconds = load_seconds
+        if version != previous and self.on_version is not None:
+            self.on_version(version)
+        if self.on_swap is not None:
+            self.on_swap(version)
+
+    @property
+    def ready(self):
+        return self._model is not None
+
+    def status(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "version": self.version,
+            "reloads": self.reloads,
+            "reload_error": self.reload_error,
+            "pid": os.getpid(),
+        }
+
+
+def convert_to_safetensors(model_dir):
+    """
+    Пересохраняет веса модели в model.safetensors. from_pretrained читает
+    такой файл через mmap, без промежуточной копии state_dict из pickle.
+    """
+    from transformers import T5ForConditionalGeneration
+
+    if os.path.exists(os.path.join(model_dir, "model.safetensors")):
+        return False
+    model = T5ForConditionalGeneration.from_pretrained(model_dir)
+    # pytorch_model.bin остаётся на месте: при наличии обоих файлов transformers берёт safetensors
+    model.save_pretrained(model_dir, safe_serialization=True)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--convert", metavar="MODEL_DIR", required=True,
+                        help="Каталог модели, веса которой нужно сохранить в safetensors")
+    args = parser.parse_args()
+    if convert_to_safetensors(args.convert):
+        print(f"Веса сохранены в {os.path.join(args.convert, 'model.safetensors')}")
+    else:
+        print("model.safetensors уже есть, конвертация не нужна")
+
+
+if __name__ == "__main__":
+    main()
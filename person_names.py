@@ -0,0 +1,111 @@
+"""
+ФИО сотрудников по номеру: общие для db_generate.py (сотрудники и авторы
+большой базы) и generate_synthetic_text_sql_pairs.py (вопросы о
+сотрудниках). Модуль без зависимостей, его импорт ничего не стоит.
+"""
+
+SURNAMES = [
+    "Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков",
+    "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов",
+    "Николаев", "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв", "Борисов", "Яковлев",
+    "Григорьев", "Романов", "Воробьёв", "Сергеев", "Кузьмин", "Фролов", "Александров", "Дмитриев", "Королёв",
+    "Гусев", "Киселёв", "Ильин", "Максимов", "Поляков", "Сорокин", "Виноградов", "Ковалёв", "Белов", "Медведев",
+    "Антонов", "Тарасов", "Жуков", "Баранов", "Филиппов", "Комаров", "Давыдов", "Беляев", "Герасимов", "Богданов",
+    "Осипов", "Сидоренко", "Матвеев", "Титов", "Марков", "Миронов", "Крылов", "Куликов", "Карпов", "Власов",
+    "Мельников", "Денисов", "Гаврилов", "Тихонов", "Казаков", "Афанасьев", "Данилов", "Савельев", "Тимофеев",
+    "Фомин", "Чернов", "Абрамов", "Мартынов", "Ефимов", "Федотов", "Щербаков", "Назаров", "Калинин", "Исаев",
+    "Чернышёв", "Быков", "Маслов", "Родионов", "Коновалов", "Лазарев", "Воронин", "Климов", "Филатов", "Пономарёв",
+    "Голубев", "Кудрявцев", "Прохоров", "Наумов", "Потапов", "Журавлёв", "Овчинников", "Трофимов", "Леонов",
+    "Соболев", "Ермаков", "Колесников", "Гончаров", "Емельянов", "Никифоров", "Грачёв", "Котов", "Гришин",
+    "Ефремов", "Архипов", "Громов", "Кириллов", "Малышев", "Панов", "Моисеев", "Румянцев", "Акимов", "Кондратьев",
+]
+MALE_NAMES = [
+    "Александр", "Алексей", "Андрей", "Антон", "Аркадий", "Артём", "Борис", "Вадим", "Валентин", "Валерий",
+    "Василий", "Виктор", "Виталий", "Владимир", "Владислав", "Всеволод", "Вячеслав", "Геннадий", "Георгий", "Глеб",
+    "Григорий", "Даниил", "Денис", "Дмитрий", "Евгений", "Егор", "Иван", "Игорь", "Илья", "Кирилл",
+    "Константин", "Лев", "Леонид", "Максим", "Марк", "Матвей", "Михаил", "Никита", "Николай", "Олег",
+    "Павел", "Пётр", "Роман", "Руслан", "Семён", "Сергей", "Станислав", "Степан", "Тимофей", "Фёдор",
+]
+FEMALE_NAMES = [
+    "Александра", "Алина", "Алла", "Анастасия", "Анна", "Антонина", "Валентина", "Валерия", "Вера", "Виктория",
+    "Галина", "Дарья", "Диана", "Евгения", "Екатерина", "Елена", "Елизавета", "Жанна", "Зинаида", "Злата",
+    "Инна", "Ирина", "Карина", "Кира", "Ксения", "Лариса", "Лидия", "Любовь", "Людмила", "Маргарита",
+    "Марина", "Мария", "Надежда", "Наталья", "Нина", "Оксана", "Ольга", "Полина", "Раиса", "Светлана",
+    "София", "Тамара", "Татьяна", "Ульяна", "Юлия", "Яна", "Ангелина", "Василиса", "Вероника", "Эльвира",
+]
+# Отчества от мужских имён: (мужское, женское)
+PATRONYMICS = [
+    ("Александрович", "Александровна"), ("Алексеевич", "Алексеевна"), ("Андреевич", "Андреевна"),
+    ("Антонович", "Антоновна"), ("Борисович", "Борисовна"), ("Вадимович", "Вадимовна"),
+    ("Валерьевич", "Валерьевна"), ("Васильевич", "Васильевна"), ("Викторович", "Викторовна"),
+    ("Витальевич", "Витальевна"), ("Владимирович", "Владимировна"), ("Вячеславович", "Вячеславовна"),
+    ("Геннадьевич", "Геннадьевна"), ("Георгиевич", "Георгиевна"), ("Григорьевич", "Григорьевна"),
+    ("Денисович", "Денисовна"), ("Дмитриевич", "Дмитриевна"), ("Евгеньевич", "Евгеньевна"),
+    ("Егорович", "Егоровна"), ("Иванович", "Ивановна"), ("Игоревич", "Игоревна"), ("Ильич", "Ильинична"),
+    ("Кириллович", "Кирилловна"), ("Константинович", "Константиновна"), ("Леонидович", "Леонидовна"),
+    ("Львович", "Львовна"), ("Максимович", "Максимовна"), ("Михайлович", "Михайловна"),
+    ("Николаевич", "Николаевна"), ("Олегович", "Олеговна"), ("Павлович", "Павловна"), ("Петрович", "Петровна"),
+    ("Романович", "Романовна"), ("Сергеевич", "Сергеевна"), ("Семёнович", "Семёновна"),
+    ("Станиславович", "Станиславовна"), ("Степанович", "Степановна"), ("Тимофеевич", "Тимофеевна"),
+    ("Фёдорович", "Фёдоровна"), ("Юрьевич", "Юрьевна"),
+]
+
+# Уникальных ФИО без числового суффикса: пол x фамилия x имя x отчество
+NAME_SPACE = 2 * len(SURNAMES) * len(MALE_NAMES) * len(PATRONYMICS)
+
+
+def _fio_parts(i):
+    # (женское ли, фамилия, имя, отчество, номер среди тёзок)
+    female, i = i % 2, i // 2
+    surname, i = SURNAMES[i % len(SURNAMES)], i // len(SURNAMES)
+    names = FEMALE_NAMES if female else MALE_NAMES
+    name, i = names[i % len(names)], i // len(names)
+    patronymic, i = PATRONYMICS[i % len(PATRONYMICS)][female], i // len(PATRONYMICS)
+    if female and surname.endswith(("ов", "ев", "ёв", "ин", "ын")):
+        surname += "а"
+    return female, surname, name, patronymic, i
+
+
+def fio(i):
+    """
+    ФИО сотрудника с номером i: одно и то же при генерации сотрудников и авторов.
+    """
+    _, surname, name, patronymic, n = _fio_parts(i)
+    full = f"{surname} {name} {patronymic}"
+    return full if n == 0 else f"{full} {n + 1}"
+
+
+# Имена с беглой гласной или другой основой в косвенных падежах
+GENITIVE_EXCEPTIONS = {"Лев": "Льва", "Павел": "Павла", "Пётр": "Петра", "Любовь": "Любови"}
+
+
+def _genitive_word(word, female):
+    if word in GENITIVE_EXCEPTIONS:
+        return GENITIVE_EXCEPTIONS[word]
+    if word.endswith(("о", "е", "и", "у")):
+        # Несклоняемые (Сидоренко)
+        return word
+    if word.endswith("я"):
+        return word[:-1] + "и"
+    if word.endswith("а"):
+        return word[:-1] + ("и" if word[-2] in "гкхжшщч" else "ы")
+    if female:
+        # Женские имена на мягкий знак; прочие женские на согласную не склоняются
+        return word[:-1] + "и" if word.endswith("ь") else word
+    if word.endswith(("й", "ь")):
+        return word[:-1] + "я"
+    return word + "а"
+
+
+def fio_genitive(i):
+    """
+    ФИО сотрудника с номером i в родительном падеже: "публикации автора
+    Ивановой Анны Сергеевны". Запрос к базе использует fio(i).
+    """
+    female, surname, name, patronymic, n = _fio_parts(i)
+    if female and surname.endswith("а") and surname[:-1].endswith(("ов", "ев", "ёв", "ин", "ын")):
+        surname = surname[:-1] + "ой"
+    else:
+        surname = _genitive_word(surname, female)
+    full = f"{surname} {_genitive_word(name, female)} {_genitive_word(patronymic, female)}"
+    return full if n == 0 else f"{full} {n + 1}"
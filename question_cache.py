@@ -0,0 +1,201 @@
+import csv
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from log_interaction import log_files
+
+
+def normalize_question(text):
+    """
+    Приводит вопрос к каноническому виду для ключа кэша:
+    нижний регистр, ё -> е, без пунктуации и лишних пробелов.
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def model_fingerprint(model_dir):
+    """
+    Версия модели по размеру и времени изменения файлов в каталоге.
+    Меняется при каждом переобучении/сохранении модели.
+    """
+    parts = []
+    for entry in sorted(os.scandir(model_dir), key=lambda e: e.name):
+        if entry.is_file():
+            stat = entry.stat()
+            parts.append(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+class QuestionCache:
+    """
+    LRU-кэш "нормализованный вопрос -> SQL" с TTL и опциональным
+    вторым уровнем в SQLite, который переживает перезапуск приложения.
+
+    Записи привязаны к версии модели: после set_model_version с новой
+    версией всё сгенерированное старой моделью перестаёт отдаваться.
+    """
+
+    def __init__(self, max_size=2048, ttl=24 * 3600, db_path=None, max_disk_size=100_000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_disk_size = max_disk_size
+        self.model_version = ""
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.db_path = db_path
+        self._fork_lock = threading.Lock()
+        self._db = self._open_db() if db_path else None
+        self._pid = os.getpid()
+
+    def _open_db(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS question_cache (
+                key TEXT PRIMARY KEY,
+                sql TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        db.commit()
+        return db
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Соединение SQLite нельзя использовать после fork: дочерний процесс
+            # (воркер gunicorn с preload_app) открывает своё, унаследованное не трогаем.
+            # Блокировку тоже заменяем: при fork её мог держать другой поток.
+            # _pid публикуется последним, когда новые объекты уже на месте
+            with self._fork_lock:
+                if self._pid != os.getpid():
+                    if self.db_path:
+                        self._db = self._open_db()
+                    self._lock = threading.Lock()
+                    self._pid = os.getpid()
+
+    def set_model_version(self, version):
+        """
+        Сообщает кэшу текущую версию модели; при смене версии кэш сбрасывается.
+        """
+        self._check_fork()
+        with self._lock:
+            if version == self.model_version:
+                return
+            self.model_version = version
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM question_cache WHERE model_version != ?", (version,))
+                self._db.commit()
+
+    def get(self, question):
+        key = normalize_question(question)
+        now = time.time()
+        self._check_fork()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                sql, created = item
+                if now - created <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return sql
+                del self._items[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT sql, created FROM question_cache WHERE key = ? AND model_version = ?",
+                    (key, self.model_version)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, question, sql):
+        key = normalize_question(question)
+        now = time.time()
+        self._check_fork()
+        with self._lock:
+            self._remember(key, sql, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO question_cache VALUES (?, ?, ?, ?)",
+                    (key, sql, self.model_version, now)
+                )
+                self._puts += 1
+                if self._puts % 100 == 0:
+                    self._prune_disk(now)
+                self._db.commit()
+
+    def invalidate(self):
+        self._check_fork()
+        with self._lock:
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM question_cache")
+                self._db.commit()
+
+    def warm_from_log(self, log_file, limit=None, validate=None):
+        """
+        Прогревает кэш успешными запросами из лога взаимодействий
+        (вместе с его ротированными копиями).
+        Учитываются только строки, где SQL выполнился (sql_valid = True/ok)
+        и, если передан validate(sql) -> bool, прошедшие эту проверку.
+        Возвращает число загруженных записей.
+        """
+        rows = []
+        for path in log_files(log_file):
+            with open(path, newline="", encoding="utf-8") as f:
+                rows.extend(csv.DictReader(f))
+        if limit is not None:
+            rows = rows[-limit:]
+        loaded = 0
+        for row in rows:
+            sql = row.get("predicted_sql") or row.get("generated_sql")
+            if not row.get("user_input") or not sql:
+                continue
+            if str(row.get("sql_valid", "")).strip().lower() not in ("true", "ok", "1"):
+                continue
+            if validate is not None and not validate(sql):
+                continue
+            self.put(row["user_input"], sql)
+            loaded += 1
+        return loaded
+
+    def stats(self):
+        self._check_fork()
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key, sql, created):
+        self._items[key] = (sql, created)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _prune_disk(self, now):
+        self._db.execute("DELETE FROM question_cache WHERE created < ?", (now - self.ttl,))
+        self._db.execute("""
+            DELETE FROM question_cache WHERE key IN (
+                SELECT key FROM question_cache ORDER BY created DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_disk_size,))
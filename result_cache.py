@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Части SQL: литералы и идентификаторы в кавычках ('...', "...", [...], `...`),
+# комментарии и остальной код
+_SQL_TOKENS = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|\[[^\]]*\]|`(?:[^`]|``)*`)"""
+    r"|(--[^\n]*|/\*.*?(?:\*/|$))"
+    r"|([^'\"\[`/-]+|.)",
+    re.DOTALL,
+)
+_QUOTED_MARK = "\x00{}\x00"
+
+
+def canonical_sql(sql):
+    """
+    Канонический вид SQL для ключа кэша: без комментариев, завершающих ';'
+    и лишних пробелов. Литералы и идентификаторы в кавычках не меняются,
+    поэтому разные по смыслу запросы не получают один ключ.
+    """
+    quoted, code = [], []
+    for quote, comment, text in _SQL_TOKENS.findall(sql):
+        if quote:
+            # Пробелы вокруг метки сохраняются: "a" "b" и "a""b" — разные запросы
+            code.append(_QUOTED_MARK.format(len(quoted)))
+            quoted.append(quote)
+        elif comment:
+            code.append(" ")
+        else:
+            code.append(text)
+    code = re.sub(r"\s*([(),=<>])\s*", r"\1", " ".join("".join(code).split()))
+    code = re.sub(r"[\s;]+$", "", code)
+    return re.sub("\x00(\\d+)\x00", lambda m: quoted[int(m.group(1))], code)
+
+
+def database_version(db_path):
+    """
+    Версия базы по размеру и времени изменения файла БД и его WAL-журнала.
+    Любая запись в базу (в том числе из db_init.py) меняет версию.
+    """
+    version = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            version.append(None)
+            continue
+        version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def _estimate_bytes(columns, rows):
+    size = sum(len(str(c)) for c in columns)
+    for row in rows:
+        size += 16 + sum(len(str(v)) + 8 for v in row)
+    return size
+
+
+class ResultCache:
+    """
+    Кэш результатов запросов: (канонический SQL, страница) -> (columns, rows).
+
+    Весь кэш сбрасывается, как только меняется файл базы данных.
+    Объём ограничен суммарным числом строк и примерным размером в байтах;
+    слишком большие результаты не кэшируются вовсе.
+    """
+
+    def __init__(self, db_path, max_rows=200_000, max_bytes=64 * 1024 * 1024, max_result_rows=10_000):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_result_rows = max_result_rows
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._items = OrderedDict()
+        self._rows = 0
+        self._bytes = 0
+        self._version = database_version(db_path)
+        self._lock = threading.Lock()
+
+    def version(self):
+        """
+        Текущая версия базы: её нужно запомнить до выполнения запроса и передать в put.
+        """
+        return database_version(self.db_path)
+
+    def get(self, sql, page=None):
+        key = (canonical_sql(sql), page)
+        with self._lock:
+            self._check_version()
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            columns, rows, _ = item
+            return columns, rows
+
+    def put(self, sql, columns, rows, page=None, version=None):
+        """
+        Кэширует результат; version — версия базы до выполнения запроса.
+        Если база с тех пор изменилась, результат мог устареть и не кэшируется.
+        """
+        if len(rows) > self.max_result_rows:
+            return
+        key = (canonical_sql(sql), page)
+        size = _estimate_bytes(columns, rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (list(columns), list(rows), size)
+            self._rows += len(rows)
+            self._bytes += size
+            while self._rows > self.max_rows or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._items)))
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "rows": self._rows,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _check_version(self):
+        version = database_version(self.db_path)
+        if version != self._version:
+            self._version = version
+            self._clear()
+
+    def _clear(self):
+        if self._items:
+            self.invalidations += 1
+        self._items.clear()
+        self._rows = 0
+        self._bytes = 0
+
+    def _drop(self, key):
+        _, rows, size = self._items.pop(key)
+        self._rows -= len(rows)
+        self._bytes -= size
@@ -0,0 +1,228 @@
+"""
+Поиск ближайшего вопроса по обучающему корпусу (data/training_data.csv,
+synthetic_rus_text_sql.csv).
+
+Вопросы представлены TF-IDF векторами символьных n-грамм, захешированных
+в фиксированное число измерений, и хранятся в одной матрице NumPy с
+нормированными строками. Поиск — одно умножение матрицы на вектор и
+выбор top-k, поэтому занимает доли миллисекунды на корпус в десятки
+тысяч вопросов.
+
+Если ближайший вопрос похож сильнее порога, его SQL отдаётся без
+обращения к модели — при условии, что в новом вопросе есть все "якоря"
+найденного: слова, которые попали в его SQL (значения, столбцы), и числа,
+а в найденном — все числа нового. В корпусе много почти одинаковых
+вопросов с разным SQL ("ссылка" и "ссылки", "старше 50" и "старше 60"),
+и одной близости для них мало.
+
+neighbors() возвращает k ближайших пар, например, как подсказки
+(few-shot) или для отладки.
+
+Пример:
+    python retrieval.py "Покажи всех сотрудников института химии"
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from question_cache import normalize_question
+
+CORPUS_FILES = ["data/training_data.csv", "synthetic_rus_text_sql.csv"]
+NGRAM_RANGE = (2, 4)
+DIMENSIONS = 2048
+DEFAULT_THRESHOLD = 0.9
+# Сколько n-грамм помнит кэш хешей: n-граммы корпуса повторяются, а
+# n-граммы произвольных вопросов пользователей не должны копиться без предела
+NGRAM_CACHE_SIZE = 1 << 16
+
+_WORD = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=NGRAM_CACHE_SIZE)
+def _bucket(ngram):
+    # Стабильный между процессами хеш (встроенный hash() рандомизирован)
+    return int.from_bytes(hashlib.blake2b(ngram.encode("utf-8"), digest_size=4).digest(), "little") % DIMENSIONS
+
+
+def _anchors(key, sql):
+    # Слова вопроса, которые встречаются в его SQL, и числа: от них зависит ответ
+    sql_words = set(_WORD.findall(sql.lower().replace("ё", "е")))
+    return frozenset(word for word in key.split() if word in sql_words or word.isdigit())
+
+
+class RetrievalIndex:
+    """
+    Индекс "вопрос -> SQL" с поиском по косинусной близости.
+
+    Сырые частоты n-грамм и документные частоты хранятся отдельно, так что
+    новые пары добавляются без перестройки всего индекса: пересчитываются
+    только веса IDF и нормировка (одна векторная операция над матрицей).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.texts = []
+        self.sqls = []
+        self._anchors = []
+        self._keys = {}
+        self._tf = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self._df = np.zeros(DIMENSIONS, dtype=np.float32)
+        self._idf = np.ones(DIMENSIONS, dtype=np.float32)
+        self._matrix = self._tf
+        self._file_rows = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _counts(self, key):
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        padded = f" {key} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                vector[_bucket(padded[i:i + n])] += 1
+        # Сублинейное масштабирование частот
+        return np.log1p(vector, out=vector)
+
+    def _reweight(self):
+        n = len(self.texts)
+        self._idf = (np.log((1 + n) / (1 + self._df)) + 1).astype(np.float32)
+        matrix = self._tf * self._idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._matrix = matrix / np.maximum(norms, 1e-12)
+
+    def add_pairs(self, pairs):
+        """
+        Добавляет пары (вопрос, SQL); повторы по нормализованному вопросу
+        пропускаются (остаётся первый SQL). Возвращает число добавленных.
+        """
+        rows, texts, sqls, anchors = [], [], [], []
+        with self._lock:
+            for text, sql in pairs:
+                key = normalize_question(text)
+                if not key or not sql or key in self._keys:
+                    continue
+                self._keys[key] = len(self.texts) + len(texts)
+                texts.append(text)
+                sqls.append(sql)
+                anchors.append(_anchors(key, sql))
+                rows.append(self._counts(key))
+            if not rows:
+                return 0
+            block = np.vstack(rows)
+            self._tf = np.vstack([self._tf, block])
+            self._df += (block > 0).sum(axis=0)
+            self.texts.extend(texts)
+            self.sqls.extend(sqls)
+            self._anchors.extend(anchors)
+            self._reweight()
+        return len(rows)
+
+    def add_csv(self, path):
+        """
+        Загружает пары из CSV с колонками text, sql. При повторном вызове
+        читаются только строки, дописанные после прошлой загрузки.
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        start = self._file_rows.get(path, 0)
+        self._file_rows[path] = len(rows)
+        return self.add_pairs((row.get("text") or "", row.get("sql") or "") for row in rows[start:])
+
+    def refresh(self):
+        """
+        Дочитывает строки, дописанные во все ранее загруженные CSV.
+        """
+        return sum(self.add_csv(path) for path in list(self._file_rows))
+
+    def _query_vector(self, question):
+        key = normalize_question(question)
+        vector = self._counts(key) * self._idf
+        norm = np.linalg.norm(vector)
+        return key, vector / norm if norm else vector
+
+    def _top(self, question, k):
+        with self._lock:
+            matrix, n = self._matrix, len(self.texts)
+        if not n:
+            return []
+        _, vector = self._query_vector(question)
+        scores = matrix @ vector
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def neighbors(self, question, k=5):
+        """
+        k ближайших пар: [(вопрос, SQL, косинусная близость), ...] по убыванию близости.
+        """
+        return [(self.texts[i], self.sqls[i], score) for i, score in self._top(question, k)]
+
+    def match(self, question):
+        """
+        SQL ближайшего вопроса, если он похож сильнее порога, все его
+        якоря есть в question и числа в вопросах совпадают; иначе None.
+        """
+        best = self._top(question, k=1)
+        sql = None
+        if best:
+            i, score = best[0]
+            words = set(normalize_question(question).split())
+            numbers = {word for word in words if word.isdigit()}
+            if score >= self.threshold and self._anchors[i] <= words and numbers <= self._anchors[i]:
+                sql = self.sqls[i]
+        with self._lock:
+            if sql is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return sql
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.texts),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def load_index(files=CORPUS_FILES, threshold=DEFAULT_THRESHOLD):
+    index = RetrievalIndex(threshold)
+    for path in files:
+        index.add_csv(path)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("question")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = load_index(threshold=args.threshold)
+    print(f"Индекс: {len(index.texts)} вопросов, построен за {time.perf_counter() - start:.2f} с")
+    start = time.perf_counter()
+    results = index.neighbors(args.question, args.k)
+    print(f"Поиск: {(time.perf_counter() - start) * 1000:.3f} мс")
+    for text, sql, score in results:
+        print(f"{score:.3f}  {text}\n       {sql}")
+    sql = index.match(args.question)
+    print(f"Ответ без модели: {sql}" if sql else "Ниже порога — SQL сгенерирует модель")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Проверка сгенерированного SQL перед выполнением.
+
+1. Только чтение: запрос компилируется в EXPLAIN QUERY PLAN с авторизатором
+   SQLite, который разрешает лишь SELECT, чтение столбцов и вызов функций.
+   Любая запись, PRAGMA, ATTACH и т.п. отклоняются на этапе разбора самим
+   SQLite, без регулярных выражений.
+2. Стоимость: по плану запроса оценивается число просматриваемых строк.
+   Полный просмотр (SCAN) таблицы стоит столько, сколько в ней строк,
+   вложенные циклы соединения перемножаются, коррелированные подзапросы
+   умножаются на число строк внешнего цикла. Если запрос отдаёт строки
+   по мере просмотра (нет ORDER BY, GROUP BY, DISTINCT, агрегатов),
+   единственный просмотр верхнего уровня остановится после LIMIT+OFFSET
+   строк — столько он и стоит. Запрос дороже max_cost (например,
+   декартово произведение больших таблиц) не выполняется.
+3. LIMIT: к запросу без LIMIT верхнего уровня добавляется LIMIT, поэтому
+   SQLite не вычисляет строки, которые не будут показаны.
+
+Планы кэшируются по каноническому SQL без добавленного LIMIT (одна запись
+на запрос, а не на страницу) и сбрасываются при изменении файла базы
+(вместе с числом строк в таблицах); поправка на LIMIT считается по плану
+при каждой проверке.
+
+Ограничение времени выполнения — db_pool.time_limit.
+
+Пример:
+    python sql_guard.py "SELECT * FROM Сотрудники, Научные_работы"
+    python sql_guard.py --csv data/training_data.csv
+"""
+import argparse
+import csv
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from result_cache import canonical_sql, database_version
+
+DB_PATH = "data/database.db"
+
+# Действия, которые авторизатор разрешает при компиляции запроса
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                   getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+# Строк на одну итерацию поиска по индексу (SEARCH): оценка сверху для равенства
+SEARCH_ROWS = 10
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_PARENS = re.compile(r"\([^()]*\)")
+_PLAN_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+# Верхний уровень запроса, который читает все строки до выдачи первой
+_NOT_STREAMING = re.compile(
+    r"\b(?:ORDER|GROUP)\s+BY\b|\b(?:DISTINCT|HAVING|UNION|INTERSECT|EXCEPT|WINDOW|OVER)\b"
+    r"|\b(?:COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT)\b",
+    re.IGNORECASE,
+)
+_OWN_LIMIT = re.compile(r"\bLIMIT\s+(\d+)(?:\s+OFFSET\s+(\d+)|\s*,\s*(\d+))?\s*$", re.IGNORECASE)
+
+
+def _top_level_code(sql):
+    # Текст запроса без литералов, комментариев и содержимого скобок
+    code = _COMMENTS.sub(" ", _LITERALS.sub("''", sql))
+    while True:
+        stripped = _PARENS.sub(" ", code)
+        if stripped == code:
+            return code
+        code = stripped
+
+
+def with_limit(sql, limit):
+    """
+    SQL с LIMIT limit, если у запроса нет своего LIMIT верхнего уровня.
+    LIMIT ставится с новой строки, чтобы не попасть в комментарий "--".
+    """
+    sql = sql.strip().rstrip(";").rstrip()
+    if re.search(r"\bLIMIT\b", _top_level_code(sql), re.IGNORECASE):
+        return sql
+    return f"{sql}\nLIMIT {int(limit)}"
+
+
+def scan_limit(sql, limit=None):
+    """
+    Сколько строк прочитает верхний уровень запроса, который отдаёт строки
+    по мере просмотра: LIMIT+OFFSET самого запроса или limit, который
+    добавит with_limit. None, если запрос сначала читает всё (сортировка,
+    группировка, агрегаты) или LIMIT не число.
+    """
+    code = _top_level_code(sql.strip().rstrip(";"))
+    if "/*" in code or _NOT_STREAMING.search(code):
+        # Незакрытый комментарий поглотил бы LIMIT из with_limit
+        return None
+    if re.search(r"\bLIMIT\b", code, re.IGNORECASE):
+        match = _OWN_LIMIT.search(code.rstrip())
+        if match is None:
+            return None
+        if match.group(3) is not None:
+            # LIMIT смещение, число
+            return int(match.group(1)) + int(match.group(3))
+        return int(match.group(1)) + int(match.group(2) or 0)
+    return limit
+
+
+def table_rows(conn, tables):
+    """
+    Число строк в таблицах: из sqlite_stat1 (после ANALYZE), иначе COUNT(*).
+    """
+    rows = {}
+    try:
+        for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+            rows[table] = int(stat.split()[0])
+    except sqlite3.OperationalError:
+        # ANALYZE не выполнялся — таблицы sqlite_stat1 нет
+        pass
+    for table in tables:
+        if table not in rows:
+            rows[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    return rows
+
+
+def plan_cost(plan, rows, limit=None):
+    """
+    Оценка числа просматриваемых строк по EXPLAIN QUERY PLAN.
+    limit — результат scan_limit: им ограничивается единственный SCAN
+    верхнего уровня. Возвращает (cost, scans, cross_join).
+    """
+    children = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    default_rows = max(rows.values(), default=0)
+    scans = []
+    cross_join = False
+
+    def cost(parent):
+        nonlocal cross_join
+        loops, loop_scans, loop_nodes, once, correlated = 1, 0, 0, 0, []
+        for node_id, detail in children.get(parent, []):
+            match = _PLAN_TABLE.match(detail)
+            if detail.startswith("SCAN CONSTANT ROW"):
+                continue
+            if match and detail.startswith("SCAN"):
+                # Псевдонимы и CTE не сопоставляем с таблицами — берём самую большую
+                loops *= max(1, rows.get(match.group(1), default_rows))
+                loop_scans += 1
+                loop_nodes += 1
+                scans.append(match.group(1))
+            elif match:
+                loops *= SEARCH_ROWS
+                loop_nodes += 1
+            elif "CORRELATED" in detail:
+                correlated.append(node_id)
+            else:
+                once += cost(node_id)
+        # Два полных просмотра во вложенных циклах — соединение без условия по индексу
+        cross_join = cross_join or loop_scans > 1
+        if parent == 0 and limit is not None and loop_scans == 1 and loop_nodes == 1:
+            # Просмотр остановится, когда наберётся LIMIT+OFFSET строк
+            loops = min(loops, max(1, limit))
+        return once + (loops if loops > 1 else 0) + sum(loops * cost(c) for c in correlated)
+
+    return cost(0), scans, cross_join
+
+
+class SqlGuard:
+    """
+    Проверяет SQL перед выполнением и кэширует планы (LRU) по
+    каноническому SQL. Вердикт — словарь: allowed, reason, cost, scans,
+    cross_join, plan.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_cost=1_000_000, max_size=4096):
+        self.db_path = db_path
+        self.max_cost = max_cost
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._items = OrderedDict()
+        self._rows = None
+        self._version = database_version(db_path)
+        self._lock = threading.Lock()
+
+    def check(self, conn, sql, limit=None):
+        """
+        Вердикт для sql; conn — соединение с базой (например, из ConnectionPool).
+        sql — запрос без LIMIT из with_limit, limit — LIMIT, с которым его
+        выполнят: кэш хранит план по каноническому sql, одну запись на все
+        страницы, а поправка на limit считается по плану.
+        """
+        key = canonical_sql(sql)
+        with self._lock:
+            version = database_version(self.db_path)
+            if version != self._version:
+                # База изменилась: другие размеры таблиц — другие планы
+                self._items.clear()
+                self._rows = None
+                self._version = version
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            entry = self._evaluate(conn, sql)
+            miss = True
+            with self._lock:
+                self._items[key] = entry
+                if len(self._items) > self.max_size:
+                    self._items.popitem(last=False)
+        else:
+            miss = False
+        verdict = self._verdict(entry, sql, limit)
+        if miss and not verdict["allowed"]:
+            with self._lock:
+                self.rejected += 1
+        return verdict
+
+    def _evaluate(self, conn, sql):
+        # План и число строк в таблицах или причина отказа до оценки стоимости
+        if not re.match(r"\s*(SELECT|WITH)\b", _COMMENTS.sub(" ", sql), re.IGNORECASE):
+            return {"reason": "разрешены только запросы SELECT", "plan": None, "rows": None}
+        denied = []
+
+        def authorize(action, arg1, arg2, db_name, trigger):
+            if action in ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_OK
+            denied.append(action)
+            return sqlite3.SQLITE_DENY
+
+        conn.set_authorizer(authorize)
+        try:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        except sqlite3.Error as e:
+            reason = "запрос изменяет данные или настройки базы" if denied else str(e)
+            return {"reason": reason, "plan": None, "rows": None}
+        finally:
+            conn.set_authorizer(None)
+
+        with self._lock:
+            rows = self._rows
+        if rows is None:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            rows = table_rows(conn, tables)
+            with self._lock:
+                self._rows = rows
+        return {"reason": None, "plan": plan, "rows": rows}
+
+    def _verdict(self, entry, sql, limit):
+        verdict = {"allowed": False, "reason": entry["reason"], "cost": None, "scans": [],
+                   "cross_join": False, "plan": []}
+        if entry["plan"] is None:
+            return verdict
+        cost, scans, cross_join = plan_cost(entry["plan"], entry["rows"], scan_limit(sql, limit))
+        verdict.update(cost=cost, scans=scans, cross_join=cross_join, plan=[row[3] for row in entry["plan"]])
+        if cost > self.max_cost:
+            kind = "декартово произведение таблиц" if cross_join else "слишком дорогой запрос"
+            verdict["reason"] = f"{kind}: оценка {cost} строк при лимите {self.max_cost}"
+            return verdict
+        verdict["allowed"] = True
+        return verdict
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sql", nargs="*", help="Запросы для проверки")
+    parser.add_argument("--csv", help="CSV со столбцом sql: сколько запросов прошло бы проверку")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--max-cost", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    guard = SqlGuard(args.db, max_cost=args.max_cost)
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    for sql in args.sql:
+        verdict = guard.check(conn, sql)
+        print(f"{'OK' if verdict['allowed'] else 'ОТКЛОНЁН'}: {sql}")
+        if verdict["reason"]:
+            print(f"  причина: {verdict['reason']}")
+        if verdict["cost"] is not None:
+            print(f"  оценка строк: {verdict['cost']}, полные просмотры: {', '.join(verdict['scans']) or 'нет'}")
+        for step in verdict["plan"]:
+            print(f"  {step}")
+    if args.csv:
+        with open(args.csv, newline="", encoding="utf-8") as f:
+            queries = [row["sql"] for row in csv.DictReader(f) if row.get("sql")]
+        reasons = {}
+        for sql in queries:
+            verdict = guard.check(conn, sql)
+            if not verdict["allowed"]:
+                reason = verdict["reason"].split(":")[0]
+                reasons[reason] = reasons.get(reason, 0) + 1
+        stats = guard.stats()
+        print(f"Запросов: {len(queries)}, уникальных: {stats['size']}, отклонено: {sum(reasons.values())}")
+        for reason, count in sorted(reasons.items(), key=lambda item: -item[1]):
+            print(f"  {count:>6}  {reason}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
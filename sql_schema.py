@@ -0,0 +1,38 @@
+"""
+Схема data/database.db и проверка идентификаторов в SQL без выполнения запроса.
+"""
+import re
+import sqlite3
+
+# Имя из WITH [RECURSIVE] name [(столбцы)] AS (...) или , name AS (...)
+CTE_NAME = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*(\w+)\s*(?:\([^()]*\))?\s*AS\s*\(", re.IGNORECASE)
+
+
+def load_schema(db_path):
+    """
+    Схема базы: {таблица: [столбцы]}.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        return {table: [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')] for table in tables}
+    finally:
+        conn.close()
+
+
+def unknown_identifiers(sql, schema):
+    """
+    Таблицы после FROM/JOIN и столбцы вида Таблица.столбец, которых нет в схеме.
+    Позволяет не выполнять заведомо невалидный SQL.
+    """
+    code = re.sub(r"'(?:[^']|'')*'", "''", sql)
+    # Имена из WITH name AS (...) — тоже допустимые источники строк
+    ctes = set(CTE_NAME.findall(code))
+    unknown = [t for t in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)", code, re.IGNORECASE)
+               if t not in schema and t not in ctes]
+    for table, column in re.findall(r"\b(\w+)\.(\w+)", code):
+        if table in schema and column not in schema[table]:
+            unknown.append(f"{table}.{column}")
+    return unknown
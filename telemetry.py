@@ -0,0 +1,200 @@
+"""
+Метрики в формате Prometheus и трассировка запросов по стадиям.
+
+Счётчики и гистограммы живут в памяти процесса и отдаются текстом на
+/metrics (у каждого воркера gunicorn свои значения). Стадии запроса
+(поиск готового SQL, генерация, выполнение SQL, рендеринг, запись лога)
+измеряются через Trace: время попадает в гистограмму
+sqlbot_stage_seconds{stage=...}, а trace_id — в лог взаимодействий.
+Токенизация и декодирование измеряются внутри generate_sql_batch,
+так как выполняются для целого пакета вопросов.
+"""
+import bisect
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _label_text(self.labelnames + ("le",), key + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Значение, которое вычисляется в момент запроса /metrics (размер кэша и т.п.).
+    """
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, read):
+        return self.register(Gauge(name, help, read))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # Ошибка в одном источнике не должна ломать всю выдачу /metrics
+                lines.append(f"# {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = REGISTRY.counter("sqlbot_requests_total", "Обработанные запросы", ["endpoint"])
+SQL_SOURCE = REGISTRY.counter(
+    "sqlbot_sql_source_total", "Откуда взят SQL: fastpath, cache, retrieval, model", ["source"])
+SQL_ERRORS = REGISTRY.counter("sqlbot_sql_errors_total", "Запросы, SQL которых не выполнился")
+GENERATED_TOKENS = REGISTRY.counter("sqlbot_generated_tokens_total", "Токены, сгенерированные моделью")
+STAGE_SECONDS = REGISTRY.histogram("sqlbot_stage_seconds", "Длительность стадий обработки", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram("sqlbot_request_seconds", "Полное время обработки запроса", ["endpoint"])
+BATCH_SIZE = REGISTRY.histogram("sqlbot_generate_batch_size", "Вопросов в одном вызове generate",
+                                buckets=SIZE_BUCKETS)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """
+    Трасса одного запроса: trace_id и длительности стадий в миллисекундах.
+    """
+
+    def __init__(self, endpoint, trace_id=None):
+        self.endpoint = endpoint
+        self.trace_id = trace_id or new_trace_id()
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        REQUESTS.inc(endpoint=endpoint)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed * 1000
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def finish(self):
+        REQUEST_SECONDS.observe(self.elapsed_ms() / 1000, endpoint=self.endpoint)
+
+    def server_timing(self):
+        # Заголовок Server-Timing: стадии видны в инструментах разработчика браузера
+        with self._lock:
+            return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.stages.items())
+
+
+def timed(trace, name):
+    """
+    Замер стадии: в трассу запроса, если она есть, иначе только в гистограмму.
+    """
+    return trace.stage(name) if trace is not None else STAGE_SECONDS.time(stage=name)
@@ -0,0 +1,155 @@
+"""
+Быстрый путь без нейросети: вопросы, совпадающие с шаблонами из
+generate_synthetic_text_sql_pairs.py, переводятся в SQL поиском по индексу.
+
+Индекс строится один раз из пространства шаблонов:
+- точное совпадение нормализованного вопроса (все шаблоны со всеми
+  значениями слотов) — поиск в словаре;
+- для числовых слотов (возраст, год) — регулярное выражение, так что
+  "старше 70 лет" распознаётся, даже если 70 не встречалось в шаблонах.
+
+Если вопрос не совпал ни с одним шаблоном, SQL генерирует модель T5.
+
+Пример:
+    python template_fastpath.py --report
+"""
+import argparse
+import csv
+import re
+import threading
+import time
+
+from generate_synthetic_text_sql_pairs import JOIN_TEMPLATES, NUMERIC_SLOTS, SELECT_TEMPLATES, enumerate_templates, fill_template
+from log_interaction import LOG_FILE, log_files
+from question_cache import normalize_question
+from result_cache import canonical_sql
+
+# Допустимая запись значения числового слота в вопросе
+NUMERIC_PATTERNS = {
+    "age": r"(\d{1,3})",
+    "year": r"(\d{4})",
+}
+_SLOT_MARK = "slotvalue"
+
+
+class TemplateIndex:
+    """
+    Индекс "нормализованный вопрос -> SQL" по шаблонам синтетического датасета.
+    match(question) возвращает SQL или None, если вопрос не похож на шаблон.
+    """
+
+    def __init__(self, templates=None):
+        templates = templates or SELECT_TEMPLATES + JOIN_TEMPLATES
+        self.exact = {normalize_question(text): sql for text, sql in enumerate_templates(templates)}
+        self.patterns = []
+        for template in templates:
+            slot = template[0]
+            if slot not in NUMERIC_SLOTS:
+                continue
+            text, _ = fill_template(template, _SLOT_MARK)
+            pattern = re.escape(normalize_question(text)).replace(_SLOT_MARK, NUMERIC_PATTERNS[slot])
+            self.patterns.append((re.compile(pattern + "$"), template))
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.slot_hits = 0
+        self.misses = 0
+
+    def lookup(self, question):
+        """
+        Поиск без учёта статистики: (SQL, "exact" | "slot") или (None, None).
+        """
+        key = normalize_question(question)
+        sql = self.exact.get(key)
+        if sql is not None:
+            return sql, "exact"
+        for pattern, template in self.patterns:
+            m = pattern.match(key)
+            if m:
+                return fill_template(template, int(m.group(1)))[1], "slot"
+        return None, None
+
+    def match(self, question):
+        sql, kind = self.lookup(question)
+        with self._lock:
+            if kind == "exact":
+                self.exact_hits += 1
+            elif kind == "slot":
+                self.slot_hits += 1
+            else:
+                self.misses += 1
+        return sql
+
+    def stats(self):
+        with self._lock:
+            total = self.exact_hits + self.slot_hits + self.misses
+            return {
+                "templates": len(self.exact),
+                "exact_hits": self.exact_hits,
+                "slot_hits": self.slot_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.slot_hits) / total if total else 0.0,
+            }
+
+
+def report(index, log_file=LOG_FILE):
+    """
+    Какая доля запросов из лога взаимодействий была бы обслужена быстрым
+    путём и насколько его SQL совпадает с тем, что выдала модель.
+    """
+    files = log_files(log_file)
+    if not files:
+        return None
+    rows = []
+    for path in files:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows.extend(row for row in csv.DictReader(f) if row.get("user_input") and row.get("source") != "feedback")
+    served = agree = 0
+    served_questions = set()
+    start = time.perf_counter()
+    for row in rows:
+        sql, _ = index.lookup(row["user_input"])
+        if sql is None:
+            continue
+        served += 1
+        served_questions.add(normalize_question(row["user_input"]))
+        logged = row.get("predicted_sql") or row.get("generated_sql") or ""
+        agree += canonical_sql(sql) == canonical_sql(logged)
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(rows),
+        "served": served,
+        "served_ratio": served / len(rows) if rows else 0.0,
+        "unique_questions": len({normalize_question(row["user_input"]) for row in rows}),
+        "served_unique_questions": len(served_questions),
+        "agree_with_logged_sql": agree,
+        "lookup_us": elapsed / len(rows) * 1e6 if rows else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", action="store_true", help="Доля трафика из лога, обслуженная быстрым путём")
+    parser.add_argument("--log-file", default=LOG_FILE)
+    parser.add_argument("--question", help="Проверить один вопрос")
+    args = parser.parse_args()
+
+    index = TemplateIndex()
+    print(f"Шаблонов в индексе: {len(index.exact)}, числовых шаблонов: {len(index.patterns)}")
+    if args.question:
+        sql, kind = index.lookup(args.question)
+        print(f"{kind}: {sql}" if sql else "Нет совпадения, SQL сгенерирует модель")
+    if args.report:
+        result = report(index, args.log_file)
+        if result is None:
+            print(f"Лог {args.log_file} не найден")
+            return
+        print(f"Запросов в логе: {result['requests']}")
+        print(f"Обслужено быстрым путём: {result['served']} ({result['served_ratio']:.2%}), "
+              f"уникальных вопросов: {result['served_unique_questions']} из {result['unique_questions']}")
+        if result["served"]:
+            print(f"SQL совпал с записанным в логе: {result['agree_with_logged_sql']} из {result['served']}")
+        print(f"Среднее время поиска: {result['lookup_us']:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
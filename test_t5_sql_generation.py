@@ -1,10 +1,6 @@
 from transformers import T5ForConditionalGeneration, T5Tokenizer
 import re
 
-# Загрузка модели и токенизатора
-model = T5ForConditionalGeneration.from_pretrained('data/model_t5_sql')
-tokenizer = T5Tokenizer.from_pretrained('data/model_t5_sql')
-
 def generate_sql(text, max_length=128):
     input_text = 'translate Russian to SQL: ' + text
     input_ids = tokenizer(input_text, return_tensors='pt').input_ids
@@ -205,24 +201,29 @@ test_cases = [
     }
 ]
 
-print("=== Тестирование генерации SQL (мягкое сравнение) ===\n")
+if __name__ == "__main__":
+    # Загрузка модели и токенизатора
+    model = T5ForConditionalGeneration.from_pretrained('data/model_t5_sql')
+    tokenizer = T5Tokenizer.from_pretrained('data/model_t5_sql')
+
+    print("=== Тестирование генерации SQL (мягкое сравнение) ===\n")
 
-correct = 0
-total = len(test_cases)
+    correct = 0
+    total = len(test_cases)
 
-for idx, case in enumerate(test_cases, 1):
-    user_query = case["input"]
-    reference_sql = case["target_sql"]
-    generated_sql = generate_sql(user_query)
+    for idx, case in enumerate(test_cases, 1):
+        user_query = case["input"]
+        reference_sql = case["target_sql"]
+        generated_sql = generate_sql(user_query)
 
-    match = soft_compare_sql(generated_sql, reference_sql)
+        match = soft_compare_sql(generated_sql, reference_sql)
 
-    print(f"{idx}. Вопрос: {user_query}")
-    print(f"   Эталонный SQL: {reference_sql}")
-    print(f"   Сгенерированный SQL: {generated_sql}")
-    print(f"   Совпадение (soft): {match}\n")
+        print(f"{idx}. Вопрос: {user_query}")
+        print(f"   Эталонный SQL: {reference_sql}")
+        print(f"   Сгенерированный SQL: {generated_sql}")
+        print(f"   Совпадение (soft): {match}\n")
 
-    if match:
-        correct += 1
+        if match:
+            correct += 1
 
-print(f"Всего совпадений (soft): {correct} из {total} ({correct/total*100:.1f}%)")
\ No newline at end of file
+    print(f"Всего совпадений (soft): {correct} из {total} ({correct/total*100:.1f}%)")
\ No newline at end of file